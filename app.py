@@ -2,13 +2,47 @@ import os
 import secrets
 import string
 
-from PIL import Image
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash
+from PIL import Image, ImageOps
+from flask import Flask, Request, Response, render_template, request, redirect, url_for, send_from_directory, send_file, flash, abort, stream_with_context, g, has_request_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import hashlib
+import base64
+import io
+import binascii
 import json
+import sqlite3
+import threading
+import time
+import fcntl
+import errno
+import select
+import ctypes
+import ctypes.util
+import signal
+import tempfile
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from urllib.parse import quote as url_quote
+import stat as stat_module
+
+from credentials import CredentialStore
+from metrics import Metrics
+from duplicates import DuplicateIndex
+from contextlib import contextmanager
+
+CONFIG_FILE = 'config.txt'
+# Values given in MB in config.txt, stored in bytes
+CONFIG_MB_KEYS = ('MAX_CONTENT_LENGTH', 'MAX_FILE_SIZE', 'UPLOAD_MAX_INFLIGHT')
+# Values stored as integers
+CONFIG_INT_KEYS = ('WATCHER_POLL_INTERVAL', 'CONFIG_CHECK_INTERVAL', 'THUMBNAIL_WORKERS', 'RENDITION_QUALITY',
+                   'THUMBNAIL_CACHE_MAX_MB', 'SLOW_REQUEST_MS', 'UPLOAD_MAX_CONCURRENT', 'UPLOAD_QUEUE_SIZE',
+                   'UPLOAD_QUEUE_TIMEOUT')
+# Values stored as booleans (true/false, yes/no, on/off, 1/0)
+CONFIG_BOOL_KEYS = ('DEDUPLICATE_UPLOADS', 'GALLERY_SPRITES')
 
 # Load configuration from file
 def load_config():
@@ -17,12 +51,30 @@ def load_config():
         'USER_CREDENTIALS_FILE': 'user_credentials.txt',
         'SECRET_KEY': 'your_secret_key_here',
         'MAX_CONTENT_LENGTH': 500,  # MB
-        'MAX_FILE_SIZE': 50  # MB
+        'MAX_FILE_SIZE': 50,  # MB
+        'FOLDER_WATCHER': 'auto',  # auto, inotify, poll or off
+        'WATCHER_POLL_INTERVAL': 30,  # seconds
+        'CONFIG_CHECK_INTERVAL': 2,  # seconds between config.txt change checks
+        'DEDUPLICATE_UPLOADS': False,  # store identical content once (hardlinks)
+        'THUMBNAIL_WORKERS': os.cpu_count() or 1,  # 0 = generate thumbnails inline
+        'RENDITION_FORMAT': 'webp',  # webp or jpeg
+        'RENDITION_QUALITY': 80,
+        'THUMBNAIL_CACHE_MAX_MB': 0,  # 0 = never evict renditions
+        'X_ACCEL_REDIRECT': '',  # nginx internal location serving the upload folder
+        'STORAGE_LAYOUT': 'flat',  # flat, hash (ab/cd/name) or date (YYYY/MM/DD/name)
+        'METRICS_DIR': '',  # per-worker metrics files; empty = a directory under /tmp
+        'METRICS_TOKEN': '',  # bearer token for scraping /metrics without logging in
+        'SLOW_REQUEST_MS': 0,  # log requests slower than this with their phases; 0 = off
+        'UPLOAD_MAX_CONCURRENT': 0,  # upload requests handled at once over all workers; 0 = no limit
+        'UPLOAD_MAX_INFLIGHT': 0,  # MB of upload bodies being received at once; 0 = no limit
+        'UPLOAD_QUEUE_SIZE': 2,  # uploads allowed to wait for a slot before getting a 503
+        'UPLOAD_QUEUE_TIMEOUT': 5,  # seconds a queued upload waits
+        'GALLERY_SPRITES': False  # one sprite sheet per date group instead of a request per thumbnail
     }
     
     try:
-        if os.path.exists('config.txt'):
-            with open('config.txt', 'r') as f:
+        if os.path.exists(CONFIG_FILE):
+            with open(CONFIG_FILE, 'r') as f:
                 for line in f:
                     line = line.strip()
                     if line and not line.startswith('#'):
@@ -31,28 +83,59 @@ def load_config():
                             key = key.strip()
                             value = value.strip()
                             
-                            # Convert MB values to bytes for Flask
-                            if key in ['MAX_CONTENT_LENGTH', 'MAX_FILE_SIZE']:
+                            if key in CONFIG_MB_KEYS or key in CONFIG_INT_KEYS:
                                 try:
-                                    config[key] = int(value) * 1024 * 1024
+                                    config[key] = int(value)
                                 except ValueError:
                                     print(f"Warning: Invalid {key} value: {value}")
+                            elif key in CONFIG_BOOL_KEYS:
+                                config[key] = value.lower() in ('1', 'true', 'yes', 'on')
                             else:
                                 config[key] = value
     except Exception as e:
         print(f"Warning: Could not load config.txt: {e}")
     
-    # Convert default MB to bytes if not loaded from config
-    if isinstance(config['MAX_CONTENT_LENGTH'], int) and config['MAX_CONTENT_LENGTH'] < 1000:
-        config['MAX_CONTENT_LENGTH'] *= 1024 * 1024
-    if isinstance(config['MAX_FILE_SIZE'], int) and config['MAX_FILE_SIZE'] < 1000:
-        config['MAX_FILE_SIZE'] *= 1024 * 1024
+    # Convert MB values to bytes for Flask
+    for key in CONFIG_MB_KEYS:
+        config[key] *= 1024 * 1024
     
     return config
 
+# Parsed configuration, re-read only when config.txt changes or on SIGHUP
+_config_cache = {'config': None, 'mtime': None, 'checked_at': 0.0}
+_config_cache_lock = threading.Lock()
+_config_reload_requested = threading.Event()
+
+def _config_mtime():
+    try:
+        return os.stat(CONFIG_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+def get_config():
+    """Return the parsed configuration, checking config.txt for changes at most every CONFIG_CHECK_INTERVAL seconds"""
+    now = time.monotonic()
+    with _config_cache_lock:
+        cached = _config_cache['config']
+        if cached is not None and not _config_reload_requested.is_set() \
+                and now - _config_cache['checked_at'] < cached['CONFIG_CHECK_INTERVAL']:
+            return cached
+
+        _config_cache['checked_at'] = now
+        mtime = _config_mtime()
+        if cached is None or _config_reload_requested.is_set() or mtime != _config_cache['mtime']:
+            _config_reload_requested.clear()
+            _config_cache['config'] = load_config()
+            _config_cache['mtime'] = mtime
+        return _config_cache['config']
+
+def request_config_reload(signum=None, frame=None):
+    """Force the next get_config() call to re-read config.txt (SIGHUP handler)"""
+    _config_reload_requested.set()
+
 # Check if config has changed and reload if needed
 def get_current_upload_folder():
-    current_config = load_config()
+    current_config = get_config()
     new_folder = current_config['UPLOAD_FOLDER']
     
     # Update app config if changed
@@ -64,7 +147,13 @@ def get_current_upload_folder():
     
     return app.config['UPLOAD_FOLDER']
 
-config = load_config()
+try:
+    signal.signal(signal.SIGHUP, request_config_reload)
+except (ValueError, AttributeError):
+    # Not in the main thread, or no SIGHUP on this platform
+    pass
+
+config = get_config()
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = config['UPLOAD_FOLDER']
@@ -89,6 +178,24 @@ app.config['ALLOWED_EXTENSIONS'] = {
     'csv', 'sql', 'log', 'ini', 'cfg', 'conf'
 }
 app.config['USER_CREDENTIALS_FILE'] = config['USER_CREDENTIALS_FILE']
+app.config['FOLDER_WATCHER'] = config['FOLDER_WATCHER']
+app.config['WATCHER_POLL_INTERVAL'] = config['WATCHER_POLL_INTERVAL']
+app.config['DEDUPLICATE_UPLOADS'] = config['DEDUPLICATE_UPLOADS']
+app.config['THUMBNAIL_WORKERS'] = config['THUMBNAIL_WORKERS']
+app.config['RENDITION_FORMAT'] = config['RENDITION_FORMAT'].lower()
+app.config['RENDITION_QUALITY'] = config['RENDITION_QUALITY']
+app.config['THUMBNAIL_CACHE_MAX_MB'] = config['THUMBNAIL_CACHE_MAX_MB']
+app.config['X_ACCEL_REDIRECT'] = config['X_ACCEL_REDIRECT']
+app.config['STORAGE_LAYOUT'] = config['STORAGE_LAYOUT'].lower()
+app.config['METRICS_DIR'] = config['METRICS_DIR'] or os.path.join(
+    tempfile.gettempdir(), 'filebox-metrics-' + hashlib.sha1(app.root_path.encode('utf-8')).hexdigest()[:8])
+app.config['METRICS_TOKEN'] = config['METRICS_TOKEN']
+app.config['SLOW_REQUEST_MS'] = config['SLOW_REQUEST_MS']
+app.config['UPLOAD_MAX_CONCURRENT'] = config['UPLOAD_MAX_CONCURRENT']
+app.config['UPLOAD_MAX_INFLIGHT'] = config['UPLOAD_MAX_INFLIGHT']
+app.config['UPLOAD_QUEUE_SIZE'] = config['UPLOAD_QUEUE_SIZE']
+app.config['UPLOAD_QUEUE_TIMEOUT'] = config['UPLOAD_QUEUE_TIMEOUT']
+app.config['GALLERY_SPRITES'] = config['GALLERY_SPRITES']
 app.secret_key = config['SECRET_KEY']
 app.config['REMEMBER_COOKIE_DURATION'] = 30 * 24 * 3600  # 30 days
 
@@ -103,6 +210,76 @@ def too_large(e):
         'error': f'Upload too large. Max total: {app.config["MAX_CONTENT_LENGTH"]//1024//1024}MB, Max per file: {app.config["MAX_FILE_SIZE"]//1024//1024}MB'
     }), 413
 
+def json_response(payload, status=200):
+    return json.dumps(payload, separators=(',', ':')), status, {'Content-Type': 'application/json'}
+
+# Metrics: per-route latency, phase timers and counters, aggregated over workers at /metrics
+metrics = Metrics(app.config['METRICS_DIR'])
+metrics.describe('filebox_request_duration_seconds', 'histogram', 'Request latency by route')
+metrics.describe('filebox_request_phase_seconds', 'histogram', 'Time spent in each phase of a request')
+metrics.describe('filebox_requests_total', 'counter', 'Requests by route, method and status')
+metrics.describe('filebox_request_bytes_total', 'counter', 'Request body bytes received')
+metrics.describe('filebox_response_bytes_total', 'counter', 'Response body bytes sent (when the length is known)')
+metrics.describe('filebox_cache_requests_total', 'counter', 'Cache lookups by cache and result (hit/miss)')
+metrics.describe('filebox_thumbnail_failures_total', 'counter', 'Thumbnails that could not be generated')
+metrics.describe('filebox_upload_admissions_total', 'counter', 'Upload admission decisions (admitted, queued, rejected)')
+
+def add_phase_time(name, seconds):
+    """Add to the current request's phase breakdown (no-op outside requests)"""
+    if has_request_context():
+        phases = g.setdefault('phases', {})
+        phases[name] = phases.get(name, 0.0) + seconds
+
+@contextmanager
+def timed_phase(name):
+    """Add the time spent in the block to the current request's phase breakdown"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase_time(name, time.perf_counter() - started)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.endpoint or 'unmatched'
+    metrics.observe('filebox_request_duration_seconds', elapsed, route=route, method=request.method)
+    metrics.inc('filebox_requests_total', route=route, method=request.method, status=str(response.status_code))
+    if request.content_length:
+        metrics.inc('filebox_request_bytes_total', request.content_length, route=route)
+    if response.content_length:
+        metrics.inc('filebox_response_bytes_total', response.content_length, route=route)
+    phases = g.get('phases', {})
+    for phase, seconds in phases.items():
+        metrics.observe('filebox_request_phase_seconds', seconds, route=route, phase=phase)
+
+    slow_ms = app.config['SLOW_REQUEST_MS']
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        breakdown = ', '.join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in phases.items())
+        app.logger.warning(f"Slow request {request.method} {request.full_path.rstrip('?')}: "
+                           f"{elapsed * 1000:.1f} ms" + (f" ({breakdown})" if breakdown else ''))
+    try:
+        metrics.flush()
+    except OSError as e:
+        app.logger.warning(f"Could not write metrics to {metrics.directory}: {str(e)}")
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text format; needs a login or 'Authorization: Bearer <METRICS_TOKEN>'"""
+    token = app.config['METRICS_TOKEN']
+    authorized = token and secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not current_user.is_authenticated:
+        return login_manager.unauthorized()
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -112,38 +289,41 @@ class User(UserMixin):
     def __init__(self, id):
         self.id = id
 
+# Credentials are parsed once per worker and re-read when the file changes
+credential_store = CredentialStore(app.config['USER_CREDENTIALS_FILE'])
+
+def create_default_user():
+    """Create the credentials file with a random admin password"""
+    default_user = 'admin'
+    default_password = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(12))
+    default_hash = generate_password_hash(default_password, method='pbkdf2:sha256')
+    
+    with open(app.config['USER_CREDENTIALS_FILE'], 'w') as f:
+        f.write(f"{default_user}:{default_hash}\n")
+    
+    app.logger.warning(f"Created default user: {default_user} with password: {default_password}")
+    credential_store.invalidate()
+
 # Load users from file
 def load_users():
-    users = {}
     try:
-        if os.path.exists(app.config['USER_CREDENTIALS_FILE']):
-            with open(app.config['USER_CREDENTIALS_FILE'], 'r') as f:
-                for line in f:
-                    if line.strip() and not line.startswith('#'):
-                        parts = line.strip().split(':', 1)
-                        if len(parts) == 2:
-                            username, password_hash = parts
-                            users[username] = password_hash
-        else:
+        if not os.path.exists(app.config['USER_CREDENTIALS_FILE']):
             # Create default user if file doesn't exist
-            default_user = 'admin'
-            default_password = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(12))
-            default_hash = generate_password_hash(default_password, method='pbkdf2:sha256')
-            
-            with open(app.config['USER_CREDENTIALS_FILE'], 'w') as f:
-                f.write(f"{default_user}:{default_hash}\n")
-            
-            app.logger.warning(f"Created default user: {default_user} with password: {default_password}")
-            users[default_user] = default_hash
-    
+            create_default_user()
+        return credential_store.get_users()
     except Exception as e:
         app.logger.error(f"Error loading users: {str(e)}")
     
-    return users
+    return {}
 
 @login_manager.user_loader
 def load_user(user_id):
-    users = load_users()
+    # Runs on every authenticated request: cached lookup, no file creation
+    try:
+        users = credential_store.get_users()
+    except Exception as e:
+        app.logger.error(f"Error loading users: {str(e)}")
+        return None
     return User(user_id) if user_id in users else None
 
 # Ensure upload directory exists
@@ -208,6 +388,10 @@ def get_file_mime_type(filename):
     }
     return mime_types.get(ext, 'application/octet-stream')
 
+def get_file_extension(filename):
+    """Lowercased text after the last dot, '' without one (the index's ext column)"""
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
 def get_file_type_category(filename):
     """Categorize file type for icon display"""
     ext = filename.split('.')[-1].lower()
@@ -240,47 +424,276 @@ def get_file_type_category(filename):
     else:
         return 'file'
 
-# Increased from default (400,400)
-THUMBNAIL_SIZE = (800, 800)  
+# Rendition pyramid, largest first: the sizes rendered together come from a single decode
+RENDITION_SIZES = {
+    'screen': 2048,  # modal viewer
+    'card': 800,  # gallery cards (the default thumbnail)
+    'grid': 200,  # small previews
+}
+DEFAULT_RENDITION = 'card'
+# Rendered on upload, from a JPEG decode reduced to about the card size. The
+# screen size would need a near full-resolution decode: it is rendered on its
+# own when first requested.
+EAGER_RENDITIONS = ('card', 'grid')
+# Image formats Pillow can render thumbnails for
+THUMBNAIL_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tiff', 'tif'}
+# Shown by serve_thumbnail while the thumbnail is still queued
+THUMBNAIL_PLACEHOLDER = 'thumbnail-pending.svg'
+# Inline placeholders: longest side in pixels and WebP quality (a few hundred bytes each)
+LQIP_SIZE = 16
+LQIP_QUALITY = 40
+
+def compute_dhash(img):
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale reduction, as a signed int"""
+    pixels = list(img.convert('L').resize((9, 8), Image.BOX).getdata())
+    value = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            value = (value << 1) | (pixels[col] > pixels[col + 1])
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def compute_lqip(img):
+    """Base64 of a tiny WebP of the image, inlined into pages as a placeholder"""
+    tiny = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    tiny.thumbnail((LQIP_SIZE, LQIP_SIZE), Image.BOX)
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'WEBP', quality=LQIP_QUALITY)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def compute_image_features(path):
+    """(perceptual hash, placeholder) of an image file (runs in worker processes)"""
+    with Image.open(path) as img:
+        img.draft('RGB', (64, 64))
+        img = ImageOps.exif_transpose(img)
+        return compute_dhash(img), compute_lqip(img)
+
+def render_renditions(path, targets, fmt='webp', quality=80):
+    """Decode an image once and write every rendition (runs in the thumbnail worker processes).
+
+    targets is a list of (max_side, output_path), largest first. Returns the
+    image's perceptual hash and placeholder, taken from the smallest rendition.
+    """
+    with Image.open(path) as img:
+        # JPEG: let libjpeg decode at the smallest scale that still covers the largest target
+        ratio = min(targets[0][0] / max(img.size), 1)
+        img.draft('RGB', (int(img.size[0] * ratio), int(img.size[1] * ratio)))
+        # Cameras store portrait shots sideways with an EXIF orientation; renditions carry no EXIF
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+        work = img.convert('RGBA' if has_alpha else 'RGB')
+
+    if fmt == 'jpeg' and has_alpha:
+        background = Image.new('RGB', work.size, (255, 255, 255))
+        background.paste(work, mask=work.getchannel('A'))
+        work = background
+
+    for max_side, output_path in targets:
+        # Each size is reduced from the previous, larger one
+        work.thumbnail((max_side, max_side), Image.LANCZOS)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = f"{output_path}.tmp"
+        if fmt == 'jpeg':
+            work.save(tmp_path, 'JPEG', quality=quality, optimize=True, progressive=True)
+        else:
+            work.save(tmp_path, 'WEBP', quality=quality, method=4)
+        os.replace(tmp_path, output_path)
+    return compute_dhash(work), compute_lqip(work)
+
+def get_rendition_extension():
+    return 'jpg' if app.config['RENDITION_FORMAT'] == 'jpeg' else 'webp'
+
+# Storage layouts: originals either all in the upload folder or spread over
+# shard directories; URLs only ever use the file name (mapped through the index)
+STORAGE_LAYOUTS = ('flat', 'hash', 'date')
+
+def get_hash_shard(filename):
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return os.path.join(digest[:2], digest[2:4])
+
+def get_storage_relpath(filename, file_date=None, layout=None):
+    """Path of an original relative to the upload folder under a storage layout"""
+    layout = layout or app.config['STORAGE_LAYOUT']
+    if layout == 'hash':
+        return os.path.join(get_hash_shard(filename), filename)
+    if layout == 'date' and file_date is not None:
+        return os.path.join(f"{file_date.year:04d}", f"{file_date.month:02d}", f"{file_date.day:02d}", filename)
+    return filename
+
+def get_rendition_shard(filename, layout=None):
+    # Renditions are looked up by name alone, so they always shard by hash
+    layout = layout or app.config['STORAGE_LAYOUT']
+    return '' if layout == 'flat' else get_hash_shard(filename)
+
+def get_thumbnail_path(upload_folder, filename, size=DEFAULT_RENDITION, layout=None):
+    return os.path.join(upload_folder, 'thumbs', size, get_rendition_shard(filename, layout),
+                        f"{filename}.{get_rendition_extension()}")
+
+def get_rendition_targets(upload_folder, filename, sizes=EAGER_RENDITIONS):
+    return [(max_side, get_thumbnail_path(upload_folder, filename, size))
+            for size, max_side in RENDITION_SIZES.items() if size in sizes]
+
+def get_rendition_job(upload_folder, filename, sizes=EAGER_RENDITIONS):
+    """Arguments of render_renditions() for a file"""
+    return (get_file_path(upload_folder, filename), get_rendition_targets(upload_folder, filename, sizes),
+            app.config['RENDITION_FORMAT'], app.config['RENDITION_QUALITY'])
+
+def store_image_features(conn, filename, features):
+    """Save what render_renditions() returned for a file: (phash, lqip)"""
+    with conn:
+        conn.execute('UPDATE files SET phash = ?, lqip = ? WHERE name = ?', (*features, filename))
+        conn.execute("DELETE FROM thumbnail_jobs WHERE name = ? AND status = 'failed'", (filename,))
 
 def create_thumbnail(path):
+    upload_folder = get_current_upload_folder()
+    filename = os.path.basename(path)
     try:
-        img = Image.open(path)
-        img.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
-        upload_folder = get_current_upload_folder()
-        thumb_dir = os.path.join(upload_folder, 'thumbs')
-        os.makedirs(thumb_dir, exist_ok=True)
-        thumb_path = os.path.join(thumb_dir, os.path.basename(path))
-        img.save(thumb_path)
-        return thumb_path
+        features = render_renditions(*get_rendition_job(upload_folder, filename))
+        store_image_features(get_index_db(upload_folder), filename, features)
+        return features
     except Exception as e:
         app.logger.error(f"Thumbnail creation failed: {str(e)}")
+        metrics.inc('filebox_thumbnail_failures_total', source='inline')
+        record_thumbnail_failure(upload_folder, filename, e)
         return None
 
 
 import re
-from datetime import datetime
-from collections import defaultdict
+import struct
+from datetime import datetime, date as date_cls
+from collections import defaultdict, OrderedDict
 from PIL.ExifTags import TAGS
 
-def extract_date_from_metadata(file_path):
-    """Extract date from file metadata (EXIF for images)"""
+def extract_date_with_pillow(file_path):
+    """Extract the EXIF date by fully opening the image with Pillow"""
+    with Image.open(file_path) as img:
+        exif = img._getexif()
+        if exif:
+            # Try different date fields in order of preference
+            date_fields = ['DateTimeOriginal', 'DateTime', 'DateTimeDigitized']
+            for field in date_fields:
+                for tag_id, value in exif.items():
+                    tag = TAGS.get(tag_id, tag_id)
+                    if tag == field and value:
+                        try:
+                            return datetime.strptime(value, '%Y:%m:%d %H:%M:%S').date()
+                        except ValueError:
+                            continue
+    return None
+
+# EXIF tags read by the header-only extractor
+EXIF_TAG_DATETIME = 0x0132
+EXIF_TAG_EXIF_IFD = 0x8769
+EXIF_TAG_DATETIME_ORIGINAL = 0x9003
+EXIF_TAG_DATETIME_DIGITIZED = 0x9004
+# An APP1 segment is at most 64KB, so the EXIF block of a JPEG is always in here
+EXIF_HEADER_READ_SIZE = 64 * 1024
+
+def _parse_tiff_dates(read_at):
+    """Collect the date tags of a TIFF structure; read_at(offset, length) returns raw bytes"""
+    header = read_at(0, 8)
+    if header[:4] == b'II*\x00':
+        order = '<'
+    elif header[:4] == b'MM\x00*':
+        order = '>'
+    else:
+        raise ValueError('Not a TIFF header')
+
+    def read_ifd(offset):
+        count_bytes = read_at(offset, 2)
+        if len(count_bytes) < 2:
+            raise ValueError('Truncated IFD')
+        count = struct.unpack(order + 'H', count_bytes)[0]
+        data = read_at(offset + 2, count * 12)
+        if len(data) < count * 12:
+            raise ValueError('Truncated IFD')
+        entries = {}
+        for i in range(count):
+            tag, typ, n, value = struct.unpack(order + 'HHI4s', data[i * 12:(i + 1) * 12])
+            entries[tag] = (typ, n, value)
+        return entries
+
+    def ascii_value(entry):
+        typ, n, value = entry
+        if typ != 2:
+            return None
+        raw = value[:n] if n <= 4 else read_at(struct.unpack(order + 'I', value)[0], n)
+        return raw.split(b'\x00', 1)[0].decode('ascii', 'replace').strip()
+
+    dates = {}
+    ifd0 = read_ifd(struct.unpack(order + 'I', header[4:8])[0])
+    if EXIF_TAG_DATETIME in ifd0:
+        dates[EXIF_TAG_DATETIME] = ascii_value(ifd0[EXIF_TAG_DATETIME])
+    if EXIF_TAG_EXIF_IFD in ifd0:
+        exif_ifd = read_ifd(struct.unpack(order + 'I', ifd0[EXIF_TAG_EXIF_IFD][2])[0])
+        for tag in (EXIF_TAG_DATETIME_ORIGINAL, EXIF_TAG_DATETIME_DIGITIZED):
+            if tag in exif_ifd:
+                dates[tag] = ascii_value(exif_ifd[tag])
+    return dates
+
+def extract_date_fast(file_path):
+    """Extract the EXIF date from the file header without decoding the image.
+
+    Returns None when the file has no usable date and raises ValueError when
+    the header layout is not understood, so callers can fall back to Pillow.
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(EXIF_HEADER_READ_SIZE)
+
+        if head[:2] == b'\xff\xd8':
+            # JPEG: walk the segments up to the EXIF APP1 block
+            pos = 2
+            tiff = None
+            while pos + 4 <= len(head):
+                if head[pos] != 0xFF:
+                    raise ValueError('Bad JPEG marker')
+                marker = head[pos + 1]
+                if marker == 0xFF:
+                    pos += 1
+                    continue
+                if marker in (0xD9, 0xDA):
+                    break  # End of image / start of scan: no EXIF block
+                length = struct.unpack('>H', head[pos + 2:pos + 4])[0]
+                if marker == 0xE1 and head[pos + 4:pos + 10] == b'Exif\x00\x00':
+                    tiff = head[pos + 10:pos + 2 + length]
+                    if len(tiff) < length - 8:
+                        raise ValueError('EXIF block beyond header window')
+                    break
+                pos += 2 + length
+            else:
+                if len(head) == EXIF_HEADER_READ_SIZE:
+                    raise ValueError('EXIF block beyond header window')
+            if tiff is None:
+                return None
+            dates = _parse_tiff_dates(lambda offset, length: tiff[offset:offset + length])
+        else:
+            # TIFF: IFDs can live anywhere in the file, read them on demand
+            def read_at(offset, length):
+                if offset + length <= len(head):
+                    return head[offset:offset + length]
+                f.seek(offset)
+                return f.read(length)
+            dates = _parse_tiff_dates(read_at)
+
+    # Same order of preference as the Pillow path
+    for tag in (EXIF_TAG_DATETIME_ORIGINAL, EXIF_TAG_DATETIME, EXIF_TAG_DATETIME_DIGITIZED):
+        value = dates.get(tag)
+        if value:
+            try:
+                return datetime.strptime(value, '%Y:%m:%d %H:%M:%S').date()
+            except ValueError:
+                continue
+    return None
+
+def extract_date_from_metadata(file_path, filename=None):
+    """Extract date from file metadata (EXIF for images); filename gives the type of unnamed spool files"""
     try:
         # For images, try EXIF data
-        if file_path.lower().endswith(('.jpg', '.jpeg', '.tiff', '.tif')):
-            with Image.open(file_path) as img:
-                exif = img._getexif()
-                if exif:
-                    # Try different date fields in order of preference
-                    date_fields = ['DateTimeOriginal', 'DateTime', 'DateTimeDigitized']
-                    for field in date_fields:
-                        for tag_id, value in exif.items():
-                            tag = TAGS.get(tag_id, tag_id)
-                            if tag == field and value:
-                                try:
-                                    return datetime.strptime(value, '%Y:%m:%d %H:%M:%S').date()
-                                except ValueError:
-                                    continue
+        if (filename or file_path).lower().endswith(('.jpg', '.jpeg', '.tiff', '.tif')):
+            try:
+                return extract_date_fast(file_path)
+            except (ValueError, struct.error):
+                return extract_date_with_pillow(file_path)
     except Exception as e:
         # Silently fail and let other methods handle it
         pass
@@ -312,72 +725,1152 @@ def extract_date_from_filename(filename):
     
     return None
 
+# Resolved dates keyed by path, valid while (inode, size, mtime) are unchanged
+DATE_CACHE_SIZE = 100000
+_date_cache = OrderedDict()
+_date_cache_lock = threading.Lock()
+
+def resolve_file_date(path, filename, st=None):
+    """Resolve the gallery date of a file, memoized on (inode, size, mtime)"""
+    if st is None:
+        st = os.stat(path)
+    key = (st.st_ino, st.st_size, st.st_mtime_ns)
+    with _date_cache_lock:
+        cached = _date_cache.get(path)
+        if cached is not None and cached[0] == key:
+            _date_cache.move_to_end(path)
+            metrics.inc('filebox_cache_requests_total', cache='file_date', result='hit')
+            return cached[1]
+    metrics.inc('filebox_cache_requests_total', cache='file_date', result='miss')
+
+    # Try to extract date in order of preference:
+    # 1. File metadata (EXIF for images)
+    file_date = extract_date_from_metadata(path)
+    if not file_date:
+        # 2. Filename patterns
+        file_date = extract_date_from_filename(filename)
+    if not file_date:
+        # 3. File modification date (fallback)
+        file_date = datetime.fromtimestamp(st.st_mtime).date()
+
+    with _date_cache_lock:
+        _date_cache[path] = (key, file_date)
+        _date_cache.move_to_end(path)
+        while len(_date_cache) > DATE_CACHE_SIZE:
+            _date_cache.popitem(last=False)
+    return file_date
+
+# Persistent metadata index (one SQLite database per upload folder)
+INDEX_DB_NAME = '.filebox_index.sqlite3'
+# The FTS5 trigram tokenizer came with SQLite 3.34
+SQLITE_TRIGRAM_VERSION = (3, 34, 0)
+
+def sqlite_has_trigram():
+    """Whether this SQLite has FTS5 with the trigram tokenizer"""
+    if sqlite3.sqlite_version_info < SQLITE_TRIGRAM_VERSION:
+        return False
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE probe USING fts5(name, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+    return True
+
+# Without it, filename search scans the names with LIKE
+SEARCH_TRIGRAM = sqlite_has_trigram()
+
+# get_file_extension() in SQL, to fill the ext column of an index from before it
+FILE_EXT_SQL = ("lower(CASE WHEN instr(name, '.') "
+                "THEN substr(name, length(rtrim(name, replace(name, '.', ''))) + 1) ELSE '' END)")
+
+FILES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    hash TEXT,
+    path TEXT,  -- relative to the upload folder; differs from name in sharded layouts
+    phash INTEGER,  -- 64-bit difference hash of images (signed), set when renditions are rendered
+    lqip TEXT,  -- base64 of a tiny blurred rendition, painted while the real thumbnail loads
+    ext TEXT  -- lowercased extension, for the search filter
+);
+"""
+
+INDEX_SCHEMA = FILES_SCHEMA + """
+-- Gallery order; /api/files seeks into it with a (date, mtime, name) cursor
+DROP INDEX IF EXISTS idx_files_date;
+CREATE INDEX IF NOT EXISTS idx_files_order ON files (date DESC, mtime DESC, name DESC);
+CREATE INDEX IF NOT EXISTS idx_files_type ON files (type, date DESC, mtime DESC, name DESC);
+CREATE INDEX IF NOT EXISTS idx_files_hash ON files (hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+-- Bumped when a file is added or removed, or its name or perceptual hash changes,
+-- so the duplicate finder knows when it has to read the hashes again
+INSERT OR IGNORE INTO meta (key, value) VALUES ('files_version', 0);
+CREATE TRIGGER IF NOT EXISTS files_version_insert AFTER INSERT ON files BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'files_version';
+END;
+CREATE TRIGGER IF NOT EXISTS files_version_delete AFTER DELETE ON files BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'files_version';
+END;
+CREATE TRIGGER IF NOT EXISTS files_version_update AFTER UPDATE OF name, phash ON files
+WHEN old.name IS NOT new.name OR old.phash IS NOT new.phash BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'files_version';
+END;
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id TEXT PRIMARY KEY,
+    user TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    sha256 TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    session_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    PRIMARY KEY (session_id, idx)
+);
+-- Last _N suffix handed out per uploaded name, so conflicts never probe the disk
+CREATE TABLE IF NOT EXISTS name_counters (
+    name TEXT PRIMARY KEY,
+    last INTEGER NOT NULL
+);
+-- Rows of uploads not linked into place yet, which reconcile must not take for deleted files
+CREATE TABLE IF NOT EXISTS name_claims (
+    name TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    claimed REAL NOT NULL
+);
+"""
+
+SEARCH_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_files_ext ON files (ext, date DESC, mtime DESC, name DESC);
+"""
+
+# Filename search: a trigram full-text index over files.name, kept in step by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    name, content='files', content_rowid='rowid', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts (rowid, name) VALUES (new.rowid, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF name ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+    INSERT INTO files_fts (rowid, name) VALUES (new.rowid, new.name);
+END;
+"""
+FTS_TRIGGERS_DROP = """
+DROP TRIGGER IF EXISTS files_fts_insert;
+DROP TRIGGER IF EXISTS files_fts_delete;
+DROP TRIGGER IF EXISTS files_fts_update;
+"""
+
+_index_local = threading.local()
+
+def open_index_db(upload_folder):
+    """Open (and create if needed) the metadata index of an upload folder"""
+    db_path = os.path.join(upload_folder, INDEX_DB_NAME)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # WAL lets gunicorn workers read while another one writes
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(INDEX_SCHEMA)
+    conn.executescript(THUMBNAIL_JOBS_SCHEMA)
+    conn.executescript(ADMISSION_SCHEMA)
+    rebuilt = False
+    with conn:
+        # Write lock first: of several connections opening an old index, one adds the columns
+        conn.execute('BEGIN IMMEDIATE')
+        columns = {row['name']: row['hidden'] for row in conn.execute('PRAGMA table_xinfo(files)')}
+        if 'path' not in columns:
+            # Index from before sharded layouts: every file is at the top level
+            conn.execute('ALTER TABLE files ADD COLUMN path TEXT')
+            conn.execute('UPDATE files SET path = name')
+        if 'phash' not in columns:
+            conn.execute('ALTER TABLE files ADD COLUMN phash INTEGER')
+        if 'lqip' not in columns:
+            conn.execute('ALTER TABLE files ADD COLUMN lqip TEXT')
+        if 'ext' not in columns:
+            conn.execute('ALTER TABLE files ADD COLUMN ext TEXT')
+            conn.execute(f'UPDATE files SET ext = {FILE_EXT_SQL}')
+        elif columns['ext']:
+            # Generated column of earlier versions, which needs SQLite 3.31: copy the table to a plain one
+            # (its indexes and search triggers go with the old table and are created again below)
+            conn.execute('ALTER TABLE files RENAME TO files_generated_ext')
+            conn.execute(FILES_SCHEMA)
+            conn.execute('INSERT INTO files (rowid, name, size, mtime, date, type, hash, path, phash, lqip, ext) '
+                         'SELECT rowid, name, size, mtime, date, type, hash, path, phash, lqip, ext '
+                         'FROM files_generated_ext')
+            conn.execute('DROP TABLE files_generated_ext')
+            rebuilt = True
+    if rebuilt:
+        conn.executescript(INDEX_SCHEMA)
+    conn.executescript(SEARCH_SCHEMA)
+    has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'files_fts_insert'").fetchone()
+    if SEARCH_TRIGRAM:
+        conn.executescript(FTS_SCHEMA)
+        if not has_fts:
+            # Cold start, or an index last used by an SQLite without trigram: index the names in the table
+            with conn:
+                conn.execute("INSERT INTO files_fts (files_fts) VALUES ('rebuild')")
+    elif has_fts:
+        # Triggers into a table this SQLite cannot open would make every write fail
+        conn.executescript(FTS_TRIGGERS_DROP)
+    return conn
+
+def get_index_db(upload_folder=None):
+    """Return this thread's connection to the index of the current upload folder"""
+    if upload_folder is None:
+        upload_folder = get_current_upload_folder()
+    connections = getattr(_index_local, 'connections', None)
+    if connections is None:
+        connections = _index_local.connections = {}
+    conn = connections.get(upload_folder)
+    if conn is None:
+        conn = connections[upload_folder] = open_index_db(upload_folder)
+    return conn
+
+# A real upsert (not INSERT OR REPLACE) keeps the rowid, which the search index refers to
+INDEX_UPSERT = ('INSERT INTO files (name, size, mtime, date, type, hash, path, ext) VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, '
+                'date = excluded.date, type = excluded.type, hash = excluded.hash, path = excluded.path, '
+                # Values derived from the image survive moves, not content changes
+                'phash = CASE WHEN files.size = excluded.size AND files.mtime = excluded.mtime '
+                'THEN files.phash END, '
+                'lqip = CASE WHEN files.size = excluded.size AND files.mtime = excluded.mtime '
+                'THEN files.lqip END')
+# Plain insert: fails on an existing name, which is how uploads claim theirs
+INDEX_INSERT = ('INSERT INTO files (name, size, mtime, date, type, hash, path, ext) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+
+def build_index_row(upload_folder, filename, file_hash=None, st=None, relpath=None):
+    """Collect the indexed metadata of a single file"""
+    relpath = relpath or filename
+    path = os.path.join(upload_folder, relpath)
+    if st is None:
+        st = os.stat(path)
+    file_date = resolve_file_date(path, filename, st)
+    return (filename, st.st_size, st.st_mtime, file_date.isoformat(),
+            get_file_type_category(filename), file_hash, relpath, get_file_extension(filename))
+
+def index_file(upload_folder, filename, file_hash=None, relpath=None):
+    """Insert or refresh the index entry of a file in the upload folder"""
+    row = build_index_row(upload_folder, filename, file_hash, relpath=relpath)
+    conn = get_index_db(upload_folder)
+    with conn:
+        conn.execute(INDEX_UPSERT, row)
+
+def get_file_path(upload_folder, filename):
+    """Absolute path of a stored original, following the index for sharded layouts"""
+    row = get_index_db(upload_folder).execute('SELECT path FROM files WHERE name = ?', (filename,)).fetchone()
+    if row is not None and row['path']:
+        return os.path.join(upload_folder, row['path'])
+    # Not indexed (yet): where the current layout puts it, else the top level
+    if app.config['STORAGE_LAYOUT'] == 'hash':
+        sharded = os.path.join(upload_folder, get_storage_relpath(filename, layout='hash'))
+        if os.path.exists(sharded):
+            return sharded
+    return os.path.join(upload_folder, filename)
+
+def is_name_taken(upload_folder, filename):
+    """Whether a stored original already uses this name, in any shard"""
+    conn = get_index_db(upload_folder)
+    if conn.execute('SELECT 1 FROM files WHERE name = ?', (filename,)).fetchone():
+        return True
+    return os.path.exists(get_file_path(upload_folder, filename))
+
+def next_name_suffix(upload_folder, filename):
+    """Next _N suffix for a taken name, from a counter shared by all workers"""
+    conn = get_index_db(upload_folder)
+    # No UPDATE ... RETURNING, which needs SQLite 3.35: the UPDATE takes the write
+    # lock, so the SELECT in the same transaction reads this worker's own increment
+    with conn:
+        if not conn.execute('UPDATE name_counters SET last = last + 1 WHERE name = ?', (filename,)).rowcount:
+            # First conflict on this name: start after the highest suffix already stored
+            base, ext = os.path.splitext(filename)
+            pattern = re.sub(r'([\[*?])', r'[\1]', base) + '_*' + re.sub(r'([\[*?])', r'[\1]', ext)
+            highest = 0
+            for (name,) in conn.execute('SELECT name FROM files WHERE name GLOB ?', (pattern,)):
+                suffix = name[len(base) + 1:len(name) - len(ext)]
+                if suffix.isdigit():
+                    highest = max(highest, int(suffix))
+            conn.execute(
+                'INSERT INTO name_counters (name, last) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET last = last + 1',
+                (filename, highest + 1)
+            )
+        row = conn.execute('SELECT last FROM name_counters WHERE name = ?', (filename,)).fetchone()
+    return row[0]
+
+def get_shard_layout(name, depth, parent_layout):
+    """Layout a directory at this depth belongs to, or None if it is not a shard"""
+    if depth == 0:
+        if len(name) == 2 and all(c in '0123456789abcdef' for c in name):
+            return 'hash'
+        if len(name) == 4 and name.isdigit():
+            return 'date'
+    elif depth == 1 and parent_layout == 'hash':
+        if len(name) == 2 and all(c in '0123456789abcdef' for c in name):
+            return 'hash'
+    elif depth in (1, 2) and parent_layout == 'date':
+        if len(name) == 2 and name.isdigit():
+            return 'date'
+    return None
+
+def iter_shard_dirs(upload_folder):
+    """Yield the relative path of the upload folder ('') and of every shard directory"""
+    stack = [('', 0, None)]
+    while stack:
+        reldir, depth, layout = stack.pop()
+        yield reldir
+        try:
+            with os.scandir(os.path.join(upload_folder, reldir)) as entries:
+                for entry in entries:
+                    child_layout = get_shard_layout(entry.name, depth, layout)
+                    if child_layout and entry.is_dir(follow_symlinks=False):
+                        stack.append((os.path.join(reldir, entry.name), depth + 1, child_layout))
+        except FileNotFoundError:
+            continue
+
+def iter_stored_files(upload_folder):
+    """Yield (relative path, DirEntry) for the originals at the top level and in shards"""
+    for reldir in iter_shard_dirs(upload_folder):
+        try:
+            with os.scandir(os.path.join(upload_folder, reldir)) as entries:
+                for entry in entries:
+                    if allowed_file(entry.name) and entry.is_file():
+                        yield os.path.join(reldir, entry.name), entry
+        except FileNotFoundError:
+            continue
+
+def unindex_file(upload_folder, filename):
+    """Remove the index entry of a file"""
+    conn = get_index_db(upload_folder)
+    with conn:
+        conn.execute('DELETE FROM files WHERE name = ?', (filename,))
+
+def reconcile_index(upload_folder, compute_hashes=False, rebuild=False):
+    """Bring the index in line with files added, changed or removed outside the app"""
+    conn = get_index_db(upload_folder)
+    if rebuild:
+        with conn:
+            conn.execute('DELETE FROM files')
+            if SEARCH_TRIGRAM:
+                conn.execute("INSERT INTO files_fts (files_fts) VALUES ('rebuild')")
+
+    indexed = {row['name']: row for row in conn.execute('SELECT name, size, mtime, hash, path FROM files')}
+    # Read after the rows: any of them not claimed by now has its file in place before the scan
+    claimed = get_live_name_claims(conn)
+    stats = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    seen = set()
+    rows = []
+
+    for relpath, entry in iter_stored_files(upload_folder):
+        if entry.name in seen:
+            app.logger.warning(f"Ignoring {relpath}: another file named {entry.name} is already indexed")
+            continue
+        seen.add(entry.name)
+        st = entry.stat()
+        existing = indexed.get(entry.name)
+        if existing and existing['size'] == st.st_size and existing['mtime'] == st.st_mtime \
+                and existing['path'] == relpath and (existing['hash'] or not compute_hashes):
+            stats['unchanged'] += 1
+            continue
+
+        file_hash = calculate_file_hash(entry.path) if compute_hashes else None
+        if existing and not file_hash and existing['size'] == st.st_size and existing['mtime'] == st.st_mtime:
+            # Only moved between shards: the content hash still holds
+            file_hash = existing['hash']
+        rows.append(build_index_row(upload_folder, entry.name, file_hash, st, relpath))
+        stats['updated' if existing else 'added'] += 1
+
+    removed = [(name,) for name in indexed if name not in seen and name not in claimed]
+    stats['removed'] = len(removed)
+
+    with conn:
+        conn.executemany(INDEX_UPSERT, rows)
+        conn.executemany('DELETE FROM files WHERE name = ?', removed)
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('reconciled_at', ?)",
+            (datetime.now().isoformat(),)
+        )
+    return stats
+
+def ensure_index(upload_folder):
+    """Build the index on first use of an upload folder"""
+    conn = get_index_db(upload_folder)
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'reconciled_at'").fetchone() is None:
+        app.logger.info(f"Building metadata index for {upload_folder}")
+        reconcile_index(upload_folder)
+    return conn
+
+def refresh_index_entry(upload_folder, filename, relpath=None):
+    """Re-index a single file after an external change, keeping its hash if untouched"""
+    relpath = relpath or filename
+    path = os.path.join(upload_folder, relpath)
+    conn = get_index_db(upload_folder)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        # Only if the index still points here: it may have moved to another shard
+        with conn:
+            conn.execute('DELETE FROM files WHERE name = ? AND path = ? '
+                         'AND name NOT IN (SELECT name FROM name_claims)', (filename, relpath))
+        return
+    if not os.path.isfile(path):
+        return
+    row = conn.execute('SELECT size, mtime, hash, path FROM files WHERE name = ?', (filename,)).fetchone()
+    if row and row['size'] == st.st_size and row['mtime'] == st.st_mtime:
+        if row['path'] != relpath:
+            with conn:
+                conn.execute('UPDATE files SET path = ? WHERE name = ?', (relpath, filename))
+        return
+    with conn:
+        conn.execute(INDEX_UPSERT, build_index_row(upload_folder, filename, None, st, relpath))
+
+# Background folder watcher
+# Files copied in over Samba/rsync bypass upload_file; one watcher per upload
+# folder (elected through an flock shared by all gunicorn workers) keeps the
+# index current so requests never need to rescan the directory.
+WATCHER_LOCK_NAME = '.filebox_watcher.lock'
+WATCHER_RETRY_INTERVAL = 5  # seconds between leadership attempts
+WATCHER_FOLDER_CHECK_INTERVAL = 2  # seconds between upload folder change checks
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+# IN_CREATE is only acted on for directories (new shards); files are picked up on close/move
+WATCHER_EVENT_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_CREATE |
+                      IN_DELETE_SELF | IN_MOVE_SELF)
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+INOTIFY_EVENT = struct.Struct('iIII')
+
+class Inotify:
+    """Minimal ctypes binding to the Linux inotify API"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError('libc not found')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+        return wd
+
+    def read_events(self, timeout):
+        """Yield (wd, mask, name) tuples, waiting at most timeout seconds"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos < len(data):
+            wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = data[pos:pos + length].rstrip(b'\x00').decode('utf-8', 'surrogateescape')
+            pos += length
+            yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+def inotify_available():
+    try:
+        Inotify().close()
+        return True
+    except (OSError, AttributeError):
+        return False
+
+def try_lock_file(path):
+    """Take an exclusive flock on path without waiting; returns the open lock file or None"""
+    lock_file = open(path, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+class FolderWatcher(threading.Thread):
+    """Keeps the metadata index of the current upload folder in sync with the disk"""
+
+    def __init__(self, mode, poll_interval):
+        super().__init__(name='filebox-folder-watcher', daemon=True)
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                upload_folder = self.current_folder()
+                lock_file = self.acquire_leadership(upload_folder)
+                if lock_file is None:
+                    self.stopped.wait(WATCHER_RETRY_INTERVAL)
+                    continue
+                try:
+                    app.logger.info(f"Watching {upload_folder} for changes ({self.mode})")
+                    # Catch up on anything that changed while nobody was watching,
+                    # and finish deletions interrupted by a restart
+                    reconcile_index(upload_folder)
+                    start_trash_purge(upload_folder)
+                    if self.mode == 'inotify':
+                        self.watch_inotify(upload_folder)
+                    else:
+                        self.watch_poll(upload_folder)
+                finally:
+                    lock_file.close()
+            except Exception as e:
+                app.logger.error(f"Folder watcher error: {str(e)}")
+                self.stopped.wait(WATCHER_RETRY_INTERVAL)
+
+    def current_folder(self):
+        with app.app_context():
+            return get_current_upload_folder()
+
+    def acquire_leadership(self, upload_folder):
+        """Take the folder's watcher lock; only one process watches a folder"""
+        return try_lock_file(os.path.join(upload_folder, WATCHER_LOCK_NAME))
+
+    def folder_changed(self, upload_folder):
+        return self.current_folder() != upload_folder
+
+    def watch_poll(self, upload_folder):
+        next_scan = time.monotonic() + self.poll_interval
+        while not self.stopped.wait(WATCHER_FOLDER_CHECK_INTERVAL):
+            if self.folder_changed(upload_folder):
+                return
+            if time.monotonic() >= next_scan:
+                reconcile_index(upload_folder)
+                next_scan = time.monotonic() + self.poll_interval
+
+    def add_shard_watches(self, inotify, watches, upload_folder, reldir, depth, layout):
+        """Watch a directory and the shard directories below it; returns the new relative dirs"""
+        added = []
+        stack = [(reldir, depth, layout)]
+        while stack:
+            reldir, depth, layout = stack.pop()
+            wd = inotify.add_watch(os.path.join(upload_folder, reldir), WATCHER_EVENT_MASK)
+            watches[wd] = (reldir, depth, layout)
+            added.append(reldir)
+            try:
+                with os.scandir(os.path.join(upload_folder, reldir)) as entries:
+                    for entry in entries:
+                        child_layout = get_shard_layout(entry.name, depth, layout)
+                        if child_layout and entry.is_dir(follow_symlinks=False):
+                            stack.append((os.path.join(reldir, entry.name), depth + 1, child_layout))
+            except FileNotFoundError:
+                pass
+        return added
+
+    def watch_inotify(self, upload_folder):
+        inotify = Inotify()
+        try:
+            # wd -> (directory relative to the upload folder, shard depth, layout)
+            watches = {}
+            try:
+                self.add_shard_watches(inotify, watches, upload_folder, '', 0, None)
+            except OSError as e:
+                if e.errno != errno.ENOSPC:
+                    raise
+                # One watch per shard directory: more than fs.inotify.max_user_watches allows
+                app.logger.warning(f"Too many directories to watch in {upload_folder}; polling instead")
+                self.watch_poll(upload_folder)
+                return
+            root_wd = next(iter(watches))
+            last_folder_check = time.monotonic()
+            while not self.stopped.is_set():
+                for wd, mask, name in inotify.read_events(WATCHER_FOLDER_CHECK_INTERVAL):
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were dropped: fall back to one full reconcile
+                        reconcile_index(upload_folder)
+                    elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        if wd == root_wd:
+                            return
+                        watches.pop(wd, None)
+                    elif wd not in watches or not name:
+                        continue
+                    elif mask & IN_ISDIR:
+                        reldir, depth, layout = watches[wd]
+                        child_layout = get_shard_layout(name, depth, layout)
+                        if child_layout and mask & (IN_CREATE | IN_MOVED_TO):
+                            # New shard: watch it, then index what landed before the watch existed
+                            for new_dir in self.add_shard_watches(inotify, watches, upload_folder,
+                                                                  os.path.join(reldir, name), depth + 1, child_layout):
+                                with os.scandir(os.path.join(upload_folder, new_dir)) as entries:
+                                    for entry in entries:
+                                        if allowed_file(entry.name) and entry.is_file():
+                                            refresh_index_entry(upload_folder, entry.name,
+                                                                os.path.join(new_dir, entry.name))
+                    elif allowed_file(name) and not mask & IN_CREATE:
+                        reldir = watches[wd][0]
+                        refresh_index_entry(upload_folder, name, os.path.join(reldir, name))
+                if time.monotonic() - last_folder_check >= WATCHER_FOLDER_CHECK_INTERVAL:
+                    last_folder_check = time.monotonic()
+                    if self.folder_changed(upload_folder):
+                        return
+        finally:
+            inotify.close()
+
+_folder_watcher = None
+_folder_watcher_pid = None
+_folder_watcher_lock = threading.Lock()
+
+def start_folder_watcher():
+    """Start this process's watcher thread (once per worker, after any fork)"""
+    global _folder_watcher, _folder_watcher_pid
+    mode = app.config['FOLDER_WATCHER'].lower()
+    if mode == 'off':
+        return None
+    with _folder_watcher_lock:
+        if _folder_watcher is not None and _folder_watcher_pid == os.getpid():
+            return _folder_watcher
+        if mode == 'auto':
+            mode = 'inotify' if inotify_available() else 'poll'
+        _folder_watcher = FolderWatcher(mode, app.config['WATCHER_POLL_INTERVAL'])
+        _folder_watcher_pid = os.getpid()
+        _folder_watcher.start()
+        return _folder_watcher
+
+# Background thumbnail generation
+# Uploads only queue a job (persisted in the index database so it survives
+# restarts); one elected worker per folder feeds the queue to a process pool.
+THUMBNAILER_LOCK_NAME = '.filebox_thumbnailer.lock'
+THUMBNAIL_MAX_ATTEMPTS = 3
+THUMBNAIL_IDLE_WAIT = 2  # seconds between queue checks when idle
+
+THUMBNAIL_JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnail_jobs (
+    name TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_thumbnail_jobs_status ON thumbnail_jobs (status, updated);
+"""
+
+def create_image_pool(max_workers=None):
+    """Process pool for decoding images.
+
+    Its processes are forked from a forkserver, not from this process: a
+    gunicorn worker runs the watcher, dispatcher and purge threads, whose locks
+    and SQLite connections a plain fork would copy into the children mid-use.
+    Jobs only take picklable arguments (see get_rendition_job()).
+    """
+    context = multiprocessing.get_context('forkserver')
+    # The server imports this module once, so each process it forks starts with it loaded
+    context.set_forkserver_preload([__name__])
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+def is_thumbnailable(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in THUMBNAIL_EXTENSIONS
+
+def enqueue_thumbnail(upload_folder, filename):
+    """Queue thumbnail generation for a file (inline when THUMBNAIL_WORKERS is 0)"""
+    if app.config['THUMBNAIL_WORKERS'] <= 0:
+        create_thumbnail(get_file_path(upload_folder, filename))
+        return
+    conn = get_index_db(upload_folder)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO thumbnail_jobs (name, status, attempts, error, updated) "
+            "VALUES (?, 'pending', 0, NULL, ?)",
+            (filename, time.time())
+        )
+    if _thumbnail_dispatcher is not None:
+        _thumbnail_dispatcher.wakeup.set()
+
+def record_thumbnail_failure(upload_folder, filename, error):
+    """Mark a file that could not be rendered inline, so requests stop decoding it again"""
+    conn = get_index_db(upload_folder)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO thumbnail_jobs (name, status, attempts, error, updated) "
+            "VALUES (?, 'failed', ?, ?, ?)",
+            (filename, THUMBNAIL_MAX_ATTEMPTS, str(error), time.time())
+        )
+
+def get_thumbnail_job_status(upload_folder, filename):
+    row = get_index_db(upload_folder).execute(
+        'SELECT status, updated FROM thumbnail_jobs WHERE name = ?', (filename,)
+    ).fetchone()
+    if row is None:
+        return None
+    if row['status'] == 'failed':
+        # A failure only holds for the content that failed: a replaced file is tried again
+        try:
+            if os.stat(get_file_path(upload_folder, filename)).st_mtime > row['updated']:
+                return None
+        except FileNotFoundError:
+            pass
+    return row['status']
+
+class ThumbnailDispatcher(threading.Thread):
+    """Feeds queued thumbnail jobs of the current upload folder to a process pool"""
+
+    def __init__(self, max_workers):
+        super().__init__(name='filebox-thumbnailer', daemon=True)
+        self.max_workers = max_workers
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.executor = None
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                with app.app_context():
+                    upload_folder = get_current_upload_folder()
+                lock_file = try_lock_file(os.path.join(upload_folder, THUMBNAILER_LOCK_NAME))
+                if lock_file is None:
+                    self.stopped.wait(WATCHER_RETRY_INTERVAL)
+                    continue
+                try:
+                    self.process_queue(upload_folder)
+                finally:
+                    lock_file.close()
+            except Exception as e:
+                app.logger.error(f"Thumbnail dispatcher error: {str(e)}")
+                self.stopped.wait(WATCHER_RETRY_INTERVAL)
+
+    def process_queue(self, upload_folder):
+        conn = get_index_db(upload_folder)
+        with conn:
+            # We hold the folder lock: anything still 'running' was interrupted
+            conn.execute("UPDATE thumbnail_jobs SET status = 'pending' WHERE status = 'running'")
+        if self.executor is None:
+            self.executor = create_image_pool(self.max_workers)
+
+        in_flight = {}
+        while not self.stopped.is_set():
+            with app.app_context():
+                if get_current_upload_folder() != upload_folder:
+                    break
+
+            capacity = self.max_workers * 2 - len(in_flight)
+            if capacity > 0:
+                jobs = conn.execute(
+                    "SELECT name FROM thumbnail_jobs WHERE status = 'pending' ORDER BY updated LIMIT ?",
+                    (capacity,)
+                ).fetchall()
+                for job in jobs:
+                    name = job['name']
+                    if is_rendition_fresh(get_thumbnail_path(upload_folder, name), get_file_path(upload_folder, name)):
+                        # Already rendered on demand by serve_thumbnail
+                        with conn:
+                            conn.execute("DELETE FROM thumbnail_jobs WHERE name = ?", (name,))
+                        continue
+                    with conn:
+                        conn.execute(
+                            "UPDATE thumbnail_jobs SET status = 'running', attempts = attempts + 1, updated = ? "
+                            "WHERE name = ?", (time.time(), name)
+                        )
+                    future = self.executor.submit(render_renditions, *get_rendition_job(upload_folder, name))
+                    in_flight[future] = name
+
+            if not in_flight:
+                self.wakeup.wait(THUMBNAIL_IDLE_WAIT)
+                self.wakeup.clear()
+                continue
+
+            done, _ = wait(in_flight, timeout=THUMBNAIL_IDLE_WAIT, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = in_flight.pop(future)
+                self.finish_job(conn, name, future)
+
+        # Folder changed or stopping: let the remaining renders finish
+        for future, name in in_flight.items():
+            self.finish_job(conn, name, future)
+
+    def finish_job(self, conn, name, future):
+        try:
+            features = future.result()
+        except Exception as e:
+            app.logger.error(f"Thumbnail creation failed for {name}: {str(e)}")
+            metrics.inc('filebox_thumbnail_failures_total', source='worker')
+            with conn:
+                conn.execute(
+                    "UPDATE thumbnail_jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "error = ?, updated = ? WHERE name = ?",
+                    (THUMBNAIL_MAX_ATTEMPTS, str(e), time.time(), name)
+                )
+            return
+        with conn:
+            conn.execute('UPDATE files SET phash = ?, lqip = ? WHERE name = ?', (*features, name))
+            conn.execute("DELETE FROM thumbnail_jobs WHERE name = ? AND status = 'running'", (name,))
+
+_thumbnail_dispatcher = None
+_thumbnail_dispatcher_pid = None
+_thumbnail_dispatcher_lock = threading.Lock()
+
+def start_thumbnail_dispatcher():
+    """Start this process's thumbnail dispatcher thread (once per worker, after any fork)"""
+    global _thumbnail_dispatcher, _thumbnail_dispatcher_pid
+    if app.config['THUMBNAIL_WORKERS'] <= 0:
+        return None
+    with _thumbnail_dispatcher_lock:
+        if _thumbnail_dispatcher is not None and _thumbnail_dispatcher_pid == os.getpid():
+            return _thumbnail_dispatcher
+        _thumbnail_dispatcher = ThumbnailDispatcher(app.config['THUMBNAIL_WORKERS'])
+        _thumbnail_dispatcher_pid = os.getpid()
+        _thumbnail_dispatcher.start()
+        return _thumbnail_dispatcher
+
+@app.before_request
+def ensure_background_workers():
+    start_folder_watcher()
+    start_thumbnail_dispatcher()
+
+@app.route('/thumbnails/status')
+@login_required
+def thumbnail_status():
+    upload_folder = get_current_upload_folder()
+    conn = get_index_db(upload_folder)
+    counts = {'pending': 0, 'running': 0, 'failed': 0}
+    for row in conn.execute('SELECT status, COUNT(*) FROM thumbnail_jobs GROUP BY status'):
+        counts[row[0]] = row[1]
+    files = {}
+    for name in request.args.getlist('files'):
+        files[name] = get_thumbnail_job_status(upload_folder, name) or (
+            'ready' if os.path.exists(get_thumbnail_path(upload_folder, name)) else 'missing'
+        )
+    queued = [row['name'] for row in conn.execute(
+        "SELECT name FROM thumbnail_jobs WHERE status IN ('pending', 'running')"
+    )]
+    return json_response({'counts': counts, 'queued': queued, 'files': files})
+
 # Add pagination parameters to index route
 @app.route('/')
 @login_required
 def index():
     page = request.args.get('page', 1, type=int)
-    per_page = 50  # Items per page
+    page = max(page, 1)
 
-    # Get all files with date information
     upload_folder = get_current_upload_folder()
-    files = []
-    for filename in os.listdir(upload_folder):
-        path = os.path.join(upload_folder, filename)
-        if allowed_file(filename) and os.path.isfile(path):
-            # Try to extract date in order of preference:
-            # 1. File metadata (EXIF for images)
-            file_date = extract_date_from_metadata(path)
-            if not file_date:
-                # 2. Filename patterns
-                file_date = extract_date_from_filename(filename)
-            if not file_date:
-                # 3. File modification date (fallback)
-                file_date = datetime.fromtimestamp(os.path.getmtime(path)).date()
-            
-            files.append({
-                'name': filename,
-                'mtime': os.path.getmtime(path),
-                'type': get_file_type_category(filename),
-                'date': file_date
+    with timed_phase('index'):
+        conn = ensure_index(upload_folder)
+
+    with timed_phase('query'):
+        total_files = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        total_groups = conn.execute('SELECT COUNT(DISTINCT date) FROM files').fetchone()[0]
+
+        # Simple pagination by date groups
+        groups_per_page = 10
+        total_pages = (total_groups + groups_per_page - 1) // groups_per_page
+        start = (page - 1) * groups_per_page
+        page_dates = [row[0] for row in conn.execute(
+            'SELECT DISTINCT date FROM files ORDER BY date DESC LIMIT ? OFFSET ?',
+            (groups_per_page, start)
+        )]
+
+        # Only the files of the requested date groups, newest first
+        rows = []
+        if page_dates:
+            rows = conn.execute(
+                'SELECT name, mtime, type, date, lqip FROM files WHERE date BETWEEN ? AND ? '
+                'ORDER BY date DESC, mtime DESC, name DESC',
+                (page_dates[-1], page_dates[0])
+            ).fetchall()
+
+    with timed_phase('group'):
+        grouped_files = defaultdict(list)
+        for row in rows:
+            grouped_files[row['date']].append({
+                'name': row['name'],
+                'mtime': row['mtime'],
+                'type': row['type'],
+                'date': date_cls.fromisoformat(row['date']),
+                'lqip': row['lqip']
             })
-    
-    # Group files by date
-    grouped_files = defaultdict(list)
-    for file in files:
-        grouped_files[file['date']].append(file)
-    
-    # Sort dates (newest first) and files within each date
-    sorted_dates = sorted(grouped_files.keys(), reverse=True)
-    for date in sorted_dates:
-        grouped_files[date].sort(key=lambda x: x['mtime'], reverse=True)
-    
-    # Convert to list of date groups for template
-    date_groups = []
-    for date in sorted_dates:
-        date_groups.append({
-            'date': date,
-            'files': grouped_files[date],
-            'count': len(grouped_files[date])
-        })
-    
-    # Simple pagination by date groups
-    total_groups = len(date_groups)
-    groups_per_page = 10
-    total_pages = (total_groups + groups_per_page - 1) // groups_per_page
-    start = (page - 1) * groups_per_page
-    end = start + groups_per_page
-    paginated_groups = date_groups[start:end]
-    
-    total_files = sum(len(group['files']) for group in date_groups)
 
-    return render_template(
-        'index.html',
-        date_groups=paginated_groups,
-        page=page,
-        total_pages=total_pages,
-        total_files=total_files
-    )
+        # Convert to list of date groups for template
+        paginated_groups = []
+        for date in page_dates:
+            paginated_groups.append({
+                'date': date_cls.fromisoformat(date),
+                'files': grouped_files[date],
+                'count': len(grouped_files[date])
+            })
+
+    # Infinite scroll picks up right after the last file rendered here
+    next_cursor = None
+    if page < total_pages and paginated_groups:
+        last = paginated_groups[-1]['files'][-1]
+        next_cursor = encode_file_cursor(page_dates[-1], last['mtime'], last['name'])
+
+    sprites = {}
+    if app.config['GALLERY_SPRITES']:
+        with timed_phase('sprites'):
+            sprites = plan_gallery_sprites(conn, paginated_groups)
+
+    with timed_phase('render'):
+        return render_template(
+            'index.html',
+            date_groups=paginated_groups,
+            page=page,
+            total_pages=total_pages,
+            total_files=total_files,
+            next_cursor=next_cursor,
+            sprites=sprites
+        )
+
+FILES_PAGE_LIMIT = 100
+FILES_PAGE_MAX_LIMIT = 500
+
+def encode_file_cursor(date, mtime, name):
+    """Opaque cursor pointing just past a file in gallery order"""
+    raw = json.dumps([date, mtime, name], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_file_cursor(cursor):
+    """Inverse of encode_file_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date, mtime, name = json.loads(raw)
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(date, str) or not isinstance(mtime, (int, float)) or not isinstance(name, str):
+        raise ValueError('Invalid cursor')
+    return date, mtime, name
+
+def parse_file_filters(args):
+    """WHERE clauses and parameters for the type, ext and date filters of a listing.
+
+    Raises ValueError with a message for the client on invalid input.
+    """
+    filters = []
+    params = []
+    file_type = args.get('type')
+    if file_type:
+        filters.append('type = ?')
+        params.append(file_type)
+    ext = args.get('ext', '').strip().lstrip('.').lower()
+    if ext:
+        filters.append('ext = ?')
+        params.append(ext)
+    for arg, op in (('date_from', '>='), ('date_to', '<=')):
+        value = args.get(arg)
+        if value:
+            try:
+                value = date_cls.fromisoformat(value).isoformat()
+            except ValueError:
+                raise ValueError(f'Invalid {arg}: {value}')
+            filters.append(f'date {op} ?')
+            params.append(value)
+    return filters, params
+
+def query_file_page(conn, filters, params, limit, cursor=None):
+    """One page of files in gallery order, with per-date counts and the cursor of the next page"""
+    # The cursor only adds a seek into the ordered index, so any page costs the same
+    page_filters = list(filters)
+    page_params = list(params)
+    if cursor:
+        page_params.extend(decode_file_cursor(cursor))
+        page_filters.append('(date, mtime, name) < (?, ?, ?)')
+
+    where = f"WHERE {' AND '.join(page_filters)}" if page_filters else ''
+    rows = conn.execute(
+        f'SELECT name, size, mtime, date, type FROM files {where} '
+        'ORDER BY date DESC, mtime DESC, name DESC LIMIT ?',
+        page_params + [limit + 1]
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_file_cursor(last['date'], last['mtime'], last['name'])
+
+    # Full size of each date group on this page, for the group headers
+    counts = {}
+    dates = sorted({row['date'] for row in rows})
+    if dates:
+        count_filters = filters + [f"date IN ({', '.join('?' * len(dates))})"]
+        counts = dict(conn.execute(
+            f"SELECT date, COUNT(*) FROM files WHERE {' AND '.join(count_filters)} GROUP BY date",
+            params + dates
+        ).fetchall())
+
+    files = [{'name': row['name'], 'size': row['size'], 'mtime': row['mtime'],
+              'date': row['date'], 'type': row['type']} for row in rows]
+    return {'files': files, 'counts': counts, 'next_cursor': next_cursor}
+
+@app.route('/api/files')
+@login_required
+def list_files_api():
+    """Keyset-paginated file listing in gallery order (newest date first)"""
+    limit = request.args.get('limit', FILES_PAGE_LIMIT, type=int)
+    limit = min(max(limit, 1), FILES_PAGE_MAX_LIMIT)
+    conn = ensure_index(get_current_upload_folder())
+    try:
+        filters, params = parse_file_filters(request.args)
+        page = query_file_page(conn, filters, params, limit, request.args.get('cursor'))
+    except ValueError as e:
+        return json_response({'success': False, 'error': str(e)}, 400)
+    return json_response(page)
+
+# Search: filename substrings through the trigram index (no directory walk, no
+# image decoding), combined with the type, extension and date filters
+SEARCH_ARGS = ('q', 'type', 'ext', 'date_from', 'date_to')
+SEARCH_TRIGRAM_MIN = 3  # shorter queries (and all, without SEARCH_TRIGRAM) use LIKE over the name column
+
+def parse_search_filters(args):
+    filters, params = parse_file_filters(args)
+    query = args.get('q', '').strip()
+    if SEARCH_TRIGRAM and len(query) >= SEARCH_TRIGRAM_MIN:
+        filters.append('rowid IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)')
+        params.append('"' + query.replace('"', '""') + '"')
+    elif query:
+        filters.append("name LIKE ? ESCAPE '\\'")
+        params.append('%' + re.sub(r'([\\%_])', r'\\\1', query) + '%')
+    return filters, params
+
+@app.route('/api/search')
+@login_required
+def search_files_api():
+    """Files whose name contains q, filtered by type, ext and date range, newest first"""
+    limit = request.args.get('limit', FILES_PAGE_LIMIT, type=int)
+    limit = min(max(limit, 1), FILES_PAGE_MAX_LIMIT)
+    conn = ensure_index(get_current_upload_folder())
+    try:
+        filters, params = parse_search_filters(request.args)
+        with timed_phase('query'):
+            page = query_file_page(conn, filters, params, limit, request.args.get('cursor'))
+    except ValueError as e:
+        return json_response({'success': False, 'error': str(e)}, 400)
+    return json_response(page)
+
+@app.route('/search')
+@login_required
+def search():
+    search_args = {arg: request.args.get(arg, '').strip() for arg in SEARCH_ARGS}
+    with timed_phase('index'):
+        conn = ensure_index(get_current_upload_folder())
+    try:
+        filters, params = parse_search_filters(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('index'))
+
+    with timed_phase('query'):
+        where = f"WHERE {' AND '.join(filters)}" if filters else ''
+        total_files = conn.execute(f'SELECT COUNT(*) FROM files {where}', params).fetchone()[0]
+        page = query_file_page(conn, filters, params, FILES_PAGE_LIMIT)
+
+    with timed_phase('group'):
+        date_groups = []
+        for file in page['files']:
+            file_date = date_cls.fromisoformat(file['date'])
+            if not date_groups or date_groups[-1]['date'] != file_date:
+                date_groups.append({'date': file_date, 'files': [], 'count': page['counts'][file['date']]})
+            date_groups[-1]['files'].append(file)
+
+    with timed_phase('render'):
+        return render_template(
+            'index.html',
+            date_groups=date_groups,
+            page=1,
+            total_pages=1,
+            total_files=total_files,
+            next_cursor=page['next_cursor'],
+            search=search_args,
+            files_api_url=url_for('search_files_api', **{k: v for k, v in search_args.items() if v})
+        )
+
+# Near-duplicate images: perceptual hashes within a few bits of each other.
+# The clusters are kept in memory per folder and updated from the index when
+# its files_version shows that files or hashes changed.
+DUPLICATE_MAX_DISTANCE = 6
+DUPLICATE_DISTANCE_LIMIT = 12
+DUPLICATE_QUERY_BATCH = 500  # names per IN (...) lookup
+_duplicate_indexes = {}  # (folder, distance) -> DuplicateIndex
+_duplicate_results = {}  # (folder, distance) -> (files_version, clusters, hashed, pending)
+_duplicate_indexes_lock = threading.Lock()
+
+def find_duplicate_clusters(upload_folder, max_distance):
+    """Clusters of near-duplicate images as lists of file rows, plus the count still without a hash"""
+    conn = get_index_db(upload_folder)
+    # Read before the hashes: a change in between only makes the next request reload them
+    version = conn.execute("SELECT value FROM meta WHERE key = 'files_version'").fetchone()[0]
+    result = _duplicate_results.get((upload_folder, max_distance))
+    if result is None or result[0] != version:
+        with _duplicate_indexes_lock:
+            duplicate_index = _duplicate_indexes.get((upload_folder, max_distance))
+            if duplicate_index is None:
+                duplicate_index = _duplicate_indexes[upload_folder, max_distance] = DuplicateIndex(max_distance)
+        with timed_phase('query'):
+            hashes = dict(conn.execute('SELECT name, phash FROM files WHERE phash IS NOT NULL').fetchall())
+            pending = conn.execute(
+                f"SELECT COUNT(*) FROM files WHERE phash IS NULL AND ext IN ({', '.join('?' * len(THUMBNAIL_EXTENSIONS))})",
+                sorted(THUMBNAIL_EXTENSIONS)
+            ).fetchone()[0]
+        with timed_phase('cluster'):
+            duplicate_index.update(hashes)
+            clusters = duplicate_index.clusters()
+        result = _duplicate_results[upload_folder, max_distance] = (version, clusters, len(hashes), pending)
+    _, clusters, hashed, pending = result
+
+    rows = {}
+    names = [name for cluster in clusters for name in cluster]
+    for start in range(0, len(names), DUPLICATE_QUERY_BATCH):
+        batch = names[start:start + DUPLICATE_QUERY_BATCH]
+        for row in conn.execute(
+            f"SELECT name, size, mtime, date, type FROM files WHERE name IN ({', '.join('?' * len(batch))})", batch
+        ):
+            rows[row['name']] = dict(row)
+    return [[rows[name] for name in cluster if name in rows] for cluster in clusters], hashed, pending
+
+def get_duplicate_distance(args):
+    distance = args.get('distance', DUPLICATE_MAX_DISTANCE, type=int)
+    return min(max(distance, 0), DUPLICATE_DISTANCE_LIMIT)
+
+@app.route('/api/duplicates')
+@login_required
+def duplicates_api():
+    """Groups of visually near-identical images, largest group first"""
+    distance = get_duplicate_distance(request.args)
+    clusters, hashed, pending = find_duplicate_clusters(get_current_upload_folder(), distance)
+    return json_response({'distance': distance, 'hashed': hashed, 'pending': pending, 'clusters': clusters})
+
+@app.route('/duplicates')
+@login_required
+def duplicates():
+    distance = get_duplicate_distance(request.args)
+    clusters, hashed, pending = find_duplicate_clusters(get_current_upload_folder(), distance)
+    with timed_phase('render'):
+        return render_template('duplicates.html', clusters=clusters, distance=distance,
+                               distance_limit=DUPLICATE_DISTANCE_LIMIT, hashed=hashed, pending=pending)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -408,29 +1901,935 @@ def logout():
     flash('You have been logged out', 'success')
     return redirect(url_for('login'))
 
+# Lazy rendition generation: missing or stale renditions are rendered on first
+# request, under a per-file flock so concurrent requests from every gunicorn
+# worker wait for a single decode instead of each decoding the image.
+RENDITION_LOCK_DIR = '.locks'
+RENDITION_EVICTION_INTERVAL = 600  # seconds between cache size checks
+RENDITION_TOUCH_INTERVAL = 3600  # seconds before a served rendition's atime is refreshed
+_last_rendition_eviction = 0.0
+
+def is_rendition_fresh(thumb_path, source_path):
+    try:
+        thumb_mtime = os.stat(thumb_path).st_mtime
+    except FileNotFoundError:
+        return False
+    try:
+        return thumb_mtime >= os.stat(source_path).st_mtime
+    except FileNotFoundError:
+        return True
+
+def get_rendition_lock_path(upload_folder, filename):
+    lock_dir = os.path.join(upload_folder, 'thumbs', RENDITION_LOCK_DIR)
+    os.makedirs(lock_dir, exist_ok=True)
+    return os.path.join(lock_dir, hashlib.sha1(filename.encode('utf-8')).hexdigest() + '.lock')
+
+def ensure_renditions(upload_folder, filename, sizes=EAGER_RENDITIONS):
+    """Render a file's renditions of these sizes unless they are up to date (single-flight across workers)"""
+    source_path = get_file_path(upload_folder, filename)
+    # Every size counts: eviction removes them one by one
+    thumb_paths = [path for _max_side, path in get_rendition_targets(upload_folder, filename, sizes)]
+    if all(is_rendition_fresh(path, source_path) for path in thumb_paths):
+        return False
+    with open(get_rendition_lock_path(upload_folder, filename), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Someone else may have rendered it while we waited
+        if all(is_rendition_fresh(path, source_path) for path in thumb_paths):
+            return False
+        features = render_renditions(*get_rendition_job(upload_folder, filename, sizes))
+    if sizes == EAGER_RENDITIONS:
+        # The hash and placeholder come from the grid rendition, as on upload
+        store_image_features(get_index_db(upload_folder), filename, features)
+    maybe_evict_renditions(upload_folder)
+    return True
+
+def backfill_image_features(upload_folder, workers=None, batch=200):
+    """Compute the perceptual hash and placeholder of images indexed without them; returns (done, failed)"""
+    conn = get_index_db(upload_folder)
+    rows = conn.execute(
+        f"SELECT name FROM files WHERE (phash IS NULL OR lqip IS NULL) AND ext IN ({', '.join('?' * len(THUMBNAIL_EXTENSIONS))})",
+        sorted(THUMBNAIL_EXTENSIONS)
+    ).fetchall()
+    jobs = {}
+    for row in rows:
+        source_path = get_file_path(upload_folder, row['name'])
+        # The small rendition decodes far faster than the original when it is current
+        grid_path = get_thumbnail_path(upload_folder, row['name'], 'grid')
+        jobs[row['name']] = grid_path if is_rendition_fresh(grid_path, source_path) else source_path
+
+    hashed = failed = 0
+    updates = []
+    with create_image_pool(workers) as executor:
+        futures = {executor.submit(compute_image_features, path): name for name, path in jobs.items()}
+        for future in futures:
+            try:
+                updates.append((*future.result(), futures[future]))
+            except Exception as e:
+                app.logger.warning(f"Image hashing failed for {futures[future]}: {str(e)}")
+                failed += 1
+            if len(updates) >= batch:
+                with conn:
+                    conn.executemany('UPDATE files SET phash = ?, lqip = ? WHERE name = ?', updates)
+                hashed += len(updates)
+                updates = []
+    with conn:
+        conn.executemany('UPDATE files SET phash = ?, lqip = ? WHERE name = ?', updates)
+    return hashed + len(updates), failed
+
+def get_rendition(upload_folder, filename, size):
+    """Path of an up-to-date rendition, rendering it on demand; None if unavailable"""
+    source_path = get_file_path(upload_folder, filename)
+    thumb_path = get_thumbnail_path(upload_folder, filename, size)
+    if not is_rendition_fresh(thumb_path, source_path):
+        if not is_thumbnailable(filename) or not os.path.isfile(source_path):
+            return None
+        metrics.inc('filebox_cache_requests_total', cache='rendition', result='miss')
+        if get_thumbnail_job_status(upload_folder, filename) is not None:
+            # Queued for the worker pool, or known to fail
+            return None
+        try:
+            with timed_phase('render'):
+                ensure_renditions(upload_folder, filename, EAGER_RENDITIONS if size in EAGER_RENDITIONS else (size,))
+        except Exception as e:
+            app.logger.error(f"Thumbnail creation failed for {filename}: {str(e)}")
+            metrics.inc('filebox_thumbnail_failures_total', source='on_demand')
+            record_thumbnail_failure(upload_folder, filename, e)
+            return None
+        if not os.path.isfile(thumb_path):
+            return None
+    else:
+        metrics.inc('filebox_cache_requests_total', cache='rendition', result='hit')
+
+    # Refresh the access time used by the LRU eviction (mtime stays for freshness)
+    try:
+        st = os.stat(thumb_path)
+        if time.time() - st.st_atime > RENDITION_TOUCH_INTERVAL:
+            os.utime(thumb_path, (time.time(), st.st_mtime))
+    except OSError:
+        pass
+    return thumb_path
+
+def iter_rendition_files(upload_folder):
+    """Yield the paths of all renditions, flat or sharded"""
+    for size in RENDITION_SIZES:
+        for dirpath, _dirnames, filenames in os.walk(os.path.join(upload_folder, 'thumbs', size)):
+            for name in filenames:
+                if not name.endswith('.tmp'):
+                    yield os.path.join(dirpath, name)
+
+def evict_renditions(upload_folder, max_bytes):
+    """Delete least recently served renditions until the thumbs directory fits in max_bytes"""
+    entries = []
+    total = 0
+    for path in iter_rendition_files(upload_folder):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_atime, st.st_size, path))
+        total += st.st_size
+    removed = 0
+    if total > max_bytes:
+        # Evict down to 90% so we don't run again right away
+        target = max_bytes * 0.9
+        for _atime, file_size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= file_size
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+def get_rendition_paths(upload_folder, filename):
+    """Every file the thumbnailer may have created for an original"""
+    paths = [os.path.join(upload_folder, 'thumbs', size, shard, f"{filename}.{ext}")
+             for size in RENDITION_SIZES for shard in ('', get_hash_shard(filename)) for ext in ('webp', 'jpg')]
+    # Thumbnail from before renditions existed, and the single-flight lock
+    paths.append(os.path.join(upload_folder, 'thumbs', filename))
+    paths.append(os.path.join(upload_folder, 'thumbs', RENDITION_LOCK_DIR,
+                              hashlib.sha1(filename.encode('utf-8')).hexdigest() + '.lock'))
+    return paths
+
+def remove_renditions(upload_folder, filename):
+    removed = 0
+    for path in get_rendition_paths(upload_folder, filename):
+        try:
+            os.remove(path)
+            removed += 1
+        except (FileNotFoundError, IsADirectoryError):
+            pass
+    return removed
+
+def sweep_orphan_renditions(upload_folder):
+    """Delete thumbnails, renditions and lock files whose original is gone"""
+    originals = {entry.name for _relpath, entry in iter_stored_files(upload_folder)}
+    thumbs_dir = os.path.join(upload_folder, 'thumbs')
+    if not os.path.isdir(thumbs_dir):
+        return 0
+    orphans = []
+    for entry in os.scandir(thumbs_dir):
+        # Thumbnails from before renditions existed
+        if entry.is_file() and entry.name not in originals:
+            orphans.append(entry.path)
+    for path in iter_rendition_files(upload_folder):
+        if os.path.basename(path).rsplit('.', 1)[0] not in originals:
+            orphans.append(path)
+    sprite_dir = os.path.join(thumbs_dir, SPRITE_DIR)
+    if os.path.isdir(sprite_dir):
+        # Sheets of date groups that no longer have files
+        dates = {row[0] for row in get_index_db(upload_folder).execute('SELECT DISTINCT date FROM files')}
+        for entry in os.scandir(sprite_dir):
+            if entry.is_dir() and entry.name not in dates:
+                orphans.extend(sheet.path for sheet in os.scandir(entry.path))
+    lock_dir = os.path.join(thumbs_dir, RENDITION_LOCK_DIR)
+    if os.path.isdir(lock_dir):
+        live_locks = {hashlib.sha1(name.encode('utf-8')).hexdigest() + '.lock' for name in originals}
+        live_locks.add('evict.lock')
+        for entry in os.scandir(lock_dir):
+            if entry.name not in live_locks:
+                orphans.append(entry.path)
+
+    removed = 0
+    for path in orphans:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def maybe_evict_renditions(upload_folder):
+    """Run the size-bounded eviction at most every RENDITION_EVICTION_INTERVAL seconds"""
+    global _last_rendition_eviction
+    max_bytes = app.config['THUMBNAIL_CACHE_MAX_MB'] * 1024 * 1024
+    if max_bytes <= 0 or time.monotonic() - _last_rendition_eviction < RENDITION_EVICTION_INTERVAL:
+        return
+    _last_rendition_eviction = time.monotonic()
+    lock_file = try_lock_file(os.path.join(upload_folder, 'thumbs', RENDITION_LOCK_DIR, 'evict.lock'))
+    if lock_file is None:
+        return
+    try:
+        removed = evict_renditions(upload_folder, max_bytes)
+        if removed:
+            app.logger.info(f"Evicted {removed} renditions from {upload_folder}")
+    finally:
+        lock_file.close()
+
+# Responses for stored files: strong ETags, 304s and Range requests, optionally
+# handing the transfer to nginx (X-Accel-Redirect) once login_required passed.
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+
+def get_stored_etag(upload_folder, filename, st):
+    """The file's SHA-256 from the index when it is current, else inode-mtime-size"""
+    try:
+        row = get_index_db(upload_folder).execute(
+            'SELECT hash, size, mtime FROM files WHERE name = ?', (filename,)
+        ).fetchone()
+    except sqlite3.Error:
+        row = None
+    if row and row['hash'] and row['size'] == st.st_size and row['mtime'] == st.st_mtime:
+        return row['hash']
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+def send_stored_file(upload_folder, relative_path, mimetype=None, etag=None, immutable=False):
+    """Send a file below the upload folder with caching headers"""
+    path = safe_join(upload_folder, relative_path)
+    if path is None:
+        abort(404)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        abort(404)
+    if not stat_module.S_ISREG(st.st_mode):
+        abort(404)
+    if etag is None:
+        etag = f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+    if mimetype is None:
+        mimetype = get_file_mime_type(path)
+    cache_control = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+
+    accel_prefix = app.config['X_ACCEL_REDIRECT']
+    with timed_phase('send'):
+        if accel_prefix:
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                # nginx serves the bytes (sendfile, Range) from its internal location
+                response = Response(mimetype=mimetype)
+                response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + \
+                    url_quote(relative_path.replace(os.sep, '/'))
+        else:
+            response = send_file(path, mimetype=mimetype, etag=etag, conditional=True,
+                                 last_modified=st.st_mtime)
+            # Advertise seeking support for video/audio players
+            response.headers['Accept-Ranges'] = 'bytes'
+    metrics.inc('filebox_cache_requests_total', cache='http',
+                result='hit' if response.status_code == 304 else 'miss')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
 @app.route('/uploads/<filename>')
 @login_required
 def serve_file(filename):
     upload_folder = get_current_upload_folder()
+    size = request.args.get('size')
+    if size in RENDITION_SIZES:
+        # Downscaled version for viewing, when one can be made
+        rendition_path = get_rendition(upload_folder, filename, size)
+        if rendition_path:
+            return send_stored_file(upload_folder, os.path.relpath(rendition_path, upload_folder),
+                                    immutable='v' in request.args)
     mime_type = get_file_mime_type(filename)
-    return send_from_directory(upload_folder, filename, mimetype=mime_type)
+    if safe_join(upload_folder, filename) is None:
+        abort(404)
+    # The public name maps to wherever the storage layout put the file
+    path = get_file_path(upload_folder, filename)
+    if not os.path.isfile(path):
+        abort(404)
+    with timed_phase('etag'):
+        etag = get_stored_etag(upload_folder, filename, os.stat(path))
+    return send_stored_file(upload_folder, os.path.relpath(path, upload_folder), mimetype=mime_type, etag=etag)
 
 @app.route('/thumbs/<filename>')
 @login_required
 def serve_thumbnail(filename):
     upload_folder = get_current_upload_folder()
-    thumb_dir = os.path.join(upload_folder, 'thumbs')
-    return send_from_directory(thumb_dir, filename)
+    size = request.args.get('size', DEFAULT_RENDITION)
+    if size not in RENDITION_SIZES:
+        return json_response({'success': False, 'error': f'Unknown size: {size}'}, 400)
+    thumb_path = get_rendition(upload_folder, filename, size)
+    if thumb_path is None:
+        if get_thumbnail_job_status(upload_folder, filename) in ('pending', 'running'):
+            # Still being generated: placeholder that the browser must not cache
+            response = send_from_directory(app.static_folder, THUMBNAIL_PLACEHOLDER)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        # Thumbnail from before renditions existed
+        return send_stored_file(upload_folder, os.path.join('thumbs', filename))
+    # Gallery URLs carry the source's mtime (?v=), so a versioned thumbnail never changes
+    return send_stored_file(upload_folder, os.path.relpath(thumb_path, upload_folder),
+                            immutable='v' in request.args)
+
+# Sprite sheets: the images of a gallery date group packed into a few cached
+# sheets of square cells, so a page costs one request per sheet instead of one
+# per thumbnail. The key digests the group's names and mtimes, so any change to
+# the group yields new URLs and a rebuilt sheet.
+SPRITE_DIR = 'sprites'
+SPRITE_CELL = RENDITION_SIZES['grid']
+SPRITE_COLUMNS = 8
+SPRITE_SHEET_CELLS = 64
+SPRITE_MIN_FILES = 2  # smaller groups keep their per-file thumbnails
+
+def get_sprite_files(files):
+    """The files of a date group that go into its sprite sheets, in gallery order"""
+    return [file for file in files if is_thumbnailable(file['name'])]
+
+def get_sprite_key(files):
+    digest = hashlib.sha1(f"{SPRITE_CELL}:{app.config['RENDITION_FORMAT']}".encode('utf-8'))
+    for file in files:
+        digest.update(f"\0{file['name']}\0{file['mtime']!r}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def get_sprite_layout(count):
+    """(columns, rows) of each sheet holding count cells"""
+    sheets = []
+    for start in range(0, count, SPRITE_SHEET_CELLS):
+        cells = min(SPRITE_SHEET_CELLS, count - start)
+        columns = min(cells, SPRITE_COLUMNS)
+        sheets.append((columns, -(-cells // columns)))
+    return sheets
+
+def get_sprite_path(upload_folder, date, key, sheet):
+    return os.path.join(upload_folder, 'thumbs', SPRITE_DIR, date, f"{key}-{sheet}.{get_rendition_extension()}")
+
+def plan_gallery_sprites(conn, date_groups):
+    """Inline CSS showing each image of the given (complete) date groups from its sprite sheet"""
+    queued = {row['name'] for row in conn.execute(
+        "SELECT name FROM thumbnail_jobs WHERE status IN ('pending', 'running')"
+    )}
+    styles = {}
+    for group in date_groups:
+        files = get_sprite_files(group['files'])
+        # A sheet built now would miss the thumbnails still queued for the workers
+        if len(files) < SPRITE_MIN_FILES or any(file['name'] in queued for file in files):
+            continue
+        date = group['date'].isoformat()
+        key = get_sprite_key(files)
+        for sheet, (columns, rows) in enumerate(get_sprite_layout(len(files))):
+            url = url_for('serve_sprite', date=date, key=key, sheet=sheet)
+            for cell, file in enumerate(files[sheet * SPRITE_SHEET_CELLS:(sheet + 1) * SPRITE_SHEET_CELLS]):
+                x = cell % columns * 100 / (columns - 1) if columns > 1 else 0
+                y = cell // columns * 100 / (rows - 1) if rows > 1 else 0
+                layers = [(f"url({url})", f"{columns * 100}% {rows * 100}%", f"{x:g}% {y:g}%")]
+                if file.get('lqip'):
+                    # Painted underneath until the sheet has loaded
+                    layers.append((f"url(data:image/webp;base64,{file['lqip']})", 'contain', 'center'))
+                styles[file['name']] = '; '.join(
+                    f"background-{prop}: {', '.join(layer[i] for layer in layers)}"
+                    for i, prop in enumerate(('image', 'size', 'position'))
+                )
+    return styles
+
+def build_sprite_sheets(upload_folder, date, key, files):
+    """Render every sheet of a date group from its grid renditions (single-flight across workers)"""
+    fmt = app.config['RENDITION_FORMAT']
+    lock_path = os.path.join(upload_folder, 'thumbs', RENDITION_LOCK_DIR, f"sprite-{date}.lock")
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        layout = get_sprite_layout(len(files))
+        if all(os.path.exists(get_sprite_path(upload_folder, date, key, sheet)) for sheet in range(len(layout))):
+            return
+        for sheet, (columns, rows) in enumerate(layout):
+            size = (columns * SPRITE_CELL, rows * SPRITE_CELL)
+            # JPEG has no transparency: fill with the gallery's card background
+            image = Image.new('RGB', size, (245, 245, 245)) if fmt == 'jpeg' else Image.new('RGBA', size)
+            for cell, file in enumerate(files[sheet * SPRITE_SHEET_CELLS:(sheet + 1) * SPRITE_SHEET_CELLS]):
+                rendition = get_rendition(upload_folder, file['name'], 'grid')
+                if rendition is None:
+                    continue
+                try:
+                    with Image.open(rendition) as tile:
+                        tile = tile.convert('RGBA')
+                except OSError as e:
+                    # Evicted or damaged meanwhile: one blank cell rather than no sheet
+                    app.logger.warning(f"Sprite tile skipped for {file['name']}: {str(e)}")
+                    continue
+                tile.thumbnail((SPRITE_CELL, SPRITE_CELL))
+                left = cell % columns * SPRITE_CELL + (SPRITE_CELL - tile.width) // 2
+                top = cell // columns * SPRITE_CELL + (SPRITE_CELL - tile.height) // 2
+                image.paste(tile, (left, top), tile)
+            output_path = get_sprite_path(upload_folder, date, key, sheet)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            tmp_path = f"{output_path}.tmp"
+            if fmt == 'jpeg':
+                image.save(tmp_path, 'JPEG', quality=app.config['RENDITION_QUALITY'], optimize=True)
+            else:
+                image.save(tmp_path, 'WEBP', quality=app.config['RENDITION_QUALITY'], method=4)
+            os.replace(tmp_path, output_path)
+
+        # Sheets of earlier versions of the group
+        for entry in os.scandir(os.path.dirname(get_sprite_path(upload_folder, date, key, 0))):
+            if not entry.name.startswith(f"{key}-"):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+@app.route('/sprites/<date>/<key>/<int:sheet>')
+@login_required
+def serve_sprite(date, key, sheet):
+    upload_folder = get_current_upload_folder()
+    try:
+        date = date_cls.fromisoformat(date).isoformat()
+    except ValueError:
+        abort(404)
+    sprite_path = get_sprite_path(upload_folder, date, key, sheet)
+    if not os.path.exists(sprite_path):
+        files = get_sprite_files(get_index_db(upload_folder).execute(
+            'SELECT name, mtime FROM files WHERE date = ? ORDER BY mtime DESC, name DESC', (date,)
+        ).fetchall())
+        # A page from before the group changed: its cell offsets no longer apply
+        if get_sprite_key(files) != key or sheet >= len(get_sprite_layout(len(files))):
+            abort(404)
+        with timed_phase('render'):
+            build_sprite_sheets(upload_folder, date, key, files)
+    # The key changes with the group's contents, so a sheet URL never changes
+    return send_stored_file(upload_folder, os.path.relpath(sprite_path, upload_folder), immutable=True)
+
+# Formats that are already compressed gain nothing from deflate on a Pi's CPU
+ZIP_STORED_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'heif',
+    'mp4', 'mov', 'avi', 'mkv', 'webm', 'mp3', 'm4a', 'aac', 'ogg', 'flac',
+    'zip', 'rar', '7z', 'gz', 'bz2', 'xz', 'docx', 'xlsx', 'pptx', 'pdf'
+}
+ZIP_CHUNK_SIZE = 256 * 1024
+
+class ZipStreamBuffer:
+    """Unseekable sink for zipfile; the generator drains it after every write"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        # Local headers and data descriptors end up in front of the next chunk
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def generate_zip(upload_folder, filenames):
+    """Yield a ZIP archive of the given files piece by piece, in constant memory"""
+    sink = ZipStreamBuffer()
+    # zipfile sees a non-seekable stream and writes data descriptors after each member
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for filename in filenames:
+            path = get_file_path(upload_folder, filename)
+            try:
+                info = zipfile.ZipInfo.from_file(path, filename, strict_timestamps=False)
+                source = open(path, 'rb')
+            except OSError:
+                # Deleted since the listing was made
+                continue
+            ext = filename.rsplit('.', 1)[-1].lower()
+            info.compress_type = zipfile.ZIP_STORED if ext in ZIP_STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            with source, archive.open(info, 'w', force_zip64=info.file_size >= zipfile.ZIP64_LIMIT) as member:
+                for chunk in iter(lambda: source.read(ZIP_CHUNK_SIZE), b''):
+                    member.write(chunk)
+                    yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+@app.route('/download.zip', methods=['GET', 'POST'])
+@login_required
+def download_zip():
+    """Stream a ZIP of one date group (?date=YYYY-MM-DD) or of a list of files"""
+    upload_folder = get_current_upload_folder()
+    group_date = request.values.get('date')
+    if group_date:
+        try:
+            group_date = date_cls.fromisoformat(group_date).isoformat()
+        except ValueError:
+            return json_response({'success': False, 'error': f'Invalid date: {group_date}'}, 400)
+        conn = ensure_index(upload_folder)
+        filenames = [row['name'] for row in conn.execute(
+            'SELECT name FROM files WHERE date = ? ORDER BY date DESC, mtime DESC, name DESC',
+            (group_date,)
+        )]
+        archive_name = f'files-{group_date}.zip'
+    else:
+        filenames = []
+        for filename in dict.fromkeys(request.values.getlist('files')):
+            if safe_join(upload_folder, filename) and os.sep not in filename and allowed_file(filename) \
+                    and os.path.isfile(get_file_path(upload_folder, filename)):
+                filenames.append(filename)
+        archive_name = f"files-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+
+    if not filenames:
+        return json_response({'success': False, 'error': 'No files to download'}, 404)
+
+    response = Response(stream_with_context(generate_zip(upload_folder, filenames)),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{archive_name}"'
+    # Let Nginx pass the stream through instead of buffering it to disk
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
     
 def calculate_file_hash(file_path):
     """Calculate SHA256 hash of a file"""
     sha256_hash = hashlib.sha256()
     with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
+        for byte_block in iter(lambda: f.read(1024 * 1024), b""):
             sha256_hash.update(byte_block)
     return sha256_hash.hexdigest()
 
+# Uploads are streamed straight into the upload folder's filesystem, hashed and
+# size-checked while werkzeug parses the multipart body, then renamed into place.
+INCOMING_DIR_NAME = '.incoming'
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+# mkstemp creates 0600 files; uploads get the usual umask-based mode instead
+_process_umask = os.umask(0)
+os.umask(_process_umask)
+UPLOAD_FILE_MODE = 0o666 & ~_process_umask
+
+def get_incoming_dir(upload_folder):
+    incoming_dir = os.path.join(upload_folder, INCOMING_DIR_NAME)
+    os.makedirs(incoming_dir, exist_ok=True)
+    return incoming_dir
+
+def fsync_dir(path):
+    """Make a new directory entry durable"""
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def link_into_place(source_path, target_path):
+    """Give a synced file its final name; FileExistsError if the name is taken"""
+    try:
+        os.link(source_path, target_path)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno not in (errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP):
+            raise
+        # No hardlinks (e.g. FAT/exFAT drives): claim the name with O_EXCL, then rename over it
+        os.close(os.open(target_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, UPLOAD_FILE_MODE))
+        os.replace(source_path, target_path)
+    else:
+        os.remove(source_path)
+    fsync_dir(os.path.dirname(target_path))
+
+class IngestFile:
+    """Writable upload spool that hashes and size-checks data as it arrives"""
+
+    def __init__(self, upload_folder, max_size):
+        fd, self.path = tempfile.mkstemp(suffix='.part', dir=get_incoming_dir(upload_folder))
+        self._file = os.fdopen(fd, 'w+b', buffering=UPLOAD_BUFFER_SIZE)
+        self._hash = hashlib.sha256()
+        self.max_size = max_size
+        self.size = 0
+        self.too_large = False
+        # Time spent hashing, reported as its own phase of the upload
+        self.hash_seconds = 0.0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.too_large:
+            return len(data)
+        if self.size > self.max_size:
+            # Keep consuming the body but stop writing to disk
+            self.too_large = True
+            self._file.truncate(0)
+            return len(data)
+        started = time.perf_counter()
+        self._hash.update(data)
+        self.hash_seconds += time.perf_counter() - started
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def sync(self):
+        """Flush the received data to disk; the file is complete afterwards"""
+        if self._file.closed:
+            return
+        self._file.flush()
+        os.fchmod(self._file.fileno(), UPLOAD_FILE_MODE)
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def claim(self, target_path):
+        """Link the spooled file to its final path, never replacing an existing file"""
+        self.sync()
+        link_into_place(self.path, target_path)
+        self.path = None
+
+    def discard(self):
+        """Drop the spooled data (content already stored)"""
+        self.close()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if self.path:
+            # Never claimed: drop the partial upload
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __getattr__(self, name):
+        # seek/tell/read/flush for werkzeug's FileStorage
+        return getattr(self._file, name)
+
+def spool_upload(file, upload_folder):
+    """Return the IngestFile holding an uploaded file's data"""
+    if isinstance(file.stream, IngestFile):
+        return file.stream
+    # Small parts werkzeug kept in memory: copy them through the same path
+    spool = IngestFile(upload_folder, app.config['MAX_FILE_SIZE'])
+    file.stream.seek(0)
+    for chunk in iter(lambda: file.stream.read(UPLOAD_BUFFER_SIZE), b''):
+        spool.write(chunk)
+    file.stream = spool
+    return spool
+
+class FileboxRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint == 'upload_file':
+            return IngestFile(get_current_upload_folder(), app.config['MAX_FILE_SIZE'])
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+app.request_class = FileboxRequest
+
+def find_stored_copy(upload_folder, file_hash, size):
+    """Name of an indexed file with the given content, if it is still on disk"""
+    conn = get_index_db(upload_folder)
+    for row in conn.execute('SELECT name, size, path FROM files WHERE hash = ?', (file_hash,)):
+        path = os.path.join(upload_folder, row['path'])
+        if row['size'] == size and os.path.isfile(path) and os.path.getsize(path) == size:
+            return row['name']
+    return None
+
+def link_stored_copy(upload_folder, existing, target_path):
+    """Reference already stored content under a new name (hardlinks, renditions included)"""
+    os.link(get_file_path(upload_folder, existing), target_path)
+    filename = os.path.basename(target_path)
+    try:
+        for size in RENDITION_SIZES:
+            thumb_path = get_thumbnail_path(upload_folder, filename, size)
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            try:
+                os.link(get_thumbnail_path(upload_folder, existing, size), thumb_path)
+            except FileNotFoundError:
+                if size in EAGER_RENDITIONS:
+                    raise
+                # Not rendered yet: rendered for this name when first requested
+    except OSError:
+        # Missing renditions: let the thumbnail worker render them
+        return False
+    return True
+
+NAME_CLAIM_TIMEOUT = 600  # seconds after which a claim counts as left behind by a failed upload
+
+def get_live_name_claims(conn):
+    """Names claimed by uploads still being linked into place; drops claims of dead processes"""
+    live = set()
+    stale = []
+    for row in conn.execute('SELECT name, pid, claimed FROM name_claims').fetchall():
+        if is_pid_alive(row['pid']) and time.time() - row['claimed'] < NAME_CLAIM_TIMEOUT:
+            live.add(row['name'])
+        else:
+            stale.append((row['name'],))
+    if stale:
+        with conn:
+            conn.executemany('DELETE FROM name_claims WHERE name = ?', stale)
+    return live
+
+def claim_upload_name(upload_folder, filename, source_path, file_hash, metadata_date=None):
+    """Reserve a free name for new content by inserting its index row.
+
+    The row is built from the spooled (or already stored) file, which keeps its
+    inode and mtime once linked into place. metadata_date saves re-reading the
+    file's EXIF date when the caller already has it. The name stays in
+    name_claims until store_upload() has linked the file. Returns (filename, relpath).
+    """
+    conn = get_index_db(upload_folder)
+    st = os.stat(source_path)
+    metadata_date = metadata_date or extract_date_from_metadata(source_path, filename)
+    base, ext = os.path.splitext(filename)
+    candidate = filename
+    while True:
+        file_date = metadata_date or extract_date_from_filename(candidate) \
+            or datetime.fromtimestamp(st.st_mtime).date()
+        relpath = get_storage_relpath(candidate, file_date)
+        row = (candidate, st.st_size, st.st_mtime, file_date.isoformat(),
+               get_file_type_category(candidate), file_hash, relpath, get_file_extension(candidate))
+        try:
+            with conn:
+                conn.execute(INDEX_INSERT, row)
+                conn.execute('INSERT OR REPLACE INTO name_claims (name, pid, claimed) VALUES (?, ?, ?)',
+                             (candidate, os.getpid(), time.time()))
+            return candidate, relpath
+        except sqlite3.IntegrityError:
+            # Taken (names are unique across all shards): the next suffix comes from a counter
+            candidate = f"{base}_{next_name_suffix(upload_folder, filename)}{ext}"
+
+def store_upload(spool, filename, upload_folder, metadata_date=None, queue_thumbnail=True):
+    """Give a received upload its final name, index it and create its thumbnail.
+
+    The name is claimed in the index first and the file then hardlinked into
+    place, so concurrent workers never share a name and a crash never leaves a
+    partial file under it. Callers rendering thumbnails themselves pass
+    queue_thumbnail=False. Returns (saved_as, deduplicated).
+    """
+    file_hash = spool.hexdigest()
+    existing = None
+    if app.config['DEDUPLICATE_UPLOADS']:
+        with timed_phase('dedup'):
+            existing = find_stored_copy(upload_folder, file_hash, spool.size)
+        if existing == filename:
+            # Same name, same content: nothing to write
+            spool.discard()
+            return existing, True
+    if existing:
+        source_path = get_file_path(upload_folder, existing)
+    else:
+        with timed_phase('save'):
+            spool.sync()
+        source_path = spool.path
+
+    conn = get_index_db(upload_folder)
+    requested = filename
+    while True:
+        with timed_phase('index'):
+            filename, relpath = claim_upload_name(upload_folder, requested, source_path, file_hash, metadata_date)
+        target_path = os.path.join(upload_folder, relpath)
+        try:
+            with timed_phase('save'):
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                if existing:
+                    has_thumbnail = link_stored_copy(upload_folder, existing, target_path)
+                    spool.discard()
+                    deduplicated = True
+                else:
+                    spool.claim(target_path)
+                    has_thumbnail = deduplicated = False
+            with conn:
+                if deduplicated:
+                    conn.execute('UPDATE files SET (phash, lqip) = (SELECT phash, lqip FROM files WHERE name = ?) '
+                                 'WHERE name = ?', (existing, filename))
+                # In place: from now on reconcile judges the row by its file
+                conn.execute('DELETE FROM name_claims WHERE name = ?', (filename,))
+            break
+        except FileExistsError:
+            # A file copied in that the index has not seen yet: index it, then pick another name
+            with conn:
+                conn.execute(INDEX_UPSERT, build_index_row(upload_folder, filename, None, relpath=relpath))
+                conn.execute('DELETE FROM name_claims WHERE name = ?', (filename,))
+        except OSError as e:
+            with conn:
+                conn.execute('DELETE FROM files WHERE name = ?', (filename,))
+                conn.execute('DELETE FROM name_claims WHERE name = ?', (filename,))
+            if not existing:
+                raise
+            # e.g. a filesystem without hardlinks: keep a normal copy
+            app.logger.warning(f"Could not link {filename} to {existing}: {str(e)}")
+            existing = None
+            spool.sync()
+            source_path = spool.path
+
+    # Generate thumbnail for images (in the background worker pool)
+    if queue_thumbnail and not has_thumbnail and is_thumbnailable(filename):
+        with timed_phase('thumbnail'):
+            enqueue_thumbnail(upload_folder, filename)
+    
+    return filename, deduplicated
+
+# Upload admission control: an upload takes a slot in the index database before
+# its body is read, so every gunicorn worker sees the same number of uploads and
+# bytes in flight. Over the limits it waits in a short FIFO queue (holding its
+# worker), then is turned away with 503 + Retry-After.
+ADMISSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_admissions (
+    id TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    admitted INTEGER NOT NULL,  -- 0 while waiting in the queue
+    created REAL NOT NULL
+);
+"""
+ADMISSION_ENDPOINTS = ('upload_file', 'upload_session_chunk')
+ADMISSION_POLL_INTERVAL = 0.25  # seconds between slot checks while queued
+ADMISSION_RETRY_AFTER = 5  # seconds a rejected client is asked to wait
+
+def is_pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def admission_step(conn, slot_id, size):
+    """Try to admit (or queue) an upload; returns (state, active, active_bytes, queued)"""
+    max_uploads = app.config['UPLOAD_MAX_CONCURRENT']
+    max_bytes = app.config['UPLOAD_MAX_INFLIGHT']
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Slots of workers that died mid-upload (e.g. killed by the gunicorn timeout)
+        for (pid,) in conn.execute('SELECT DISTINCT pid FROM upload_admissions').fetchall():
+            if not is_pid_alive(pid):
+                conn.execute('DELETE FROM upload_admissions WHERE pid = ?', (pid,))
+        active, active_bytes = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM upload_admissions WHERE admitted'
+        ).fetchone()
+        queue = [row[0] for row in conn.execute(
+            'SELECT id FROM upload_admissions WHERE NOT admitted ORDER BY created, id'
+        )]
+        fits = (not max_uploads or active < max_uploads) and \
+            (not max_bytes or active == 0 or active_bytes + size <= max_bytes)
+        # First come, first served: only the head of the queue may take a free slot
+        if fits and (not queue or queue[0] == slot_id):
+            conn.execute(
+                'INSERT INTO upload_admissions (id, pid, bytes, admitted, created) VALUES (?, ?, ?, 1, ?) '
+                'ON CONFLICT (id) DO UPDATE SET admitted = 1',
+                (slot_id, os.getpid(), size, time.time())
+            )
+            state = 'admitted'
+        elif slot_id in queue:
+            state = 'queued'
+        elif len(queue) < app.config['UPLOAD_QUEUE_SIZE']:
+            conn.execute(
+                'INSERT INTO upload_admissions (id, pid, bytes, admitted, created) VALUES (?, ?, ?, 0, ?)',
+                (slot_id, os.getpid(), size, time.time())
+            )
+            queue.append(slot_id)
+            state = 'queued'
+        else:
+            state = 'rejected'
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return state, active, active_bytes, len(queue)
+
+def upload_busy_response():
+    error = 'Server busy with other uploads, please retry shortly'
+    headers = {'Retry-After': str(ADMISSION_RETRY_AFTER)}
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.endpoint != 'upload_file':
+        body, status, json_headers = json_response({'success': False, 'error': error}, 503)
+        headers.update(json_headers)
+        return body, status, headers
+    return error, 503, headers
+
+@app.before_request
+def admit_upload():
+    """Admission control for upload bodies, before any of the body is read"""
+    if request.endpoint not in ADMISSION_ENDPOINTS:
+        return None
+    if not current_user.is_authenticated:
+        # Both upload views need a login: turn anonymous clients away before they can hold a slot
+        return login_manager.unauthorized()
+    if not app.config['UPLOAD_MAX_CONCURRENT'] and not app.config['UPLOAD_MAX_INFLIGHT']:
+        return None
+    size = request.content_length or app.config['MAX_CONTENT_LENGTH']
+    if size > app.config['MAX_CONTENT_LENGTH']:
+        # Refused with 413 by the view without reading the body
+        return None
+
+    upload_folder = get_current_upload_folder()
+    conn = get_index_db(upload_folder)
+    slot_id = secrets.token_hex(8)
+    g.upload_admission = (upload_folder, slot_id)
+    deadline = time.monotonic() + app.config['UPLOAD_QUEUE_TIMEOUT']
+    with timed_phase('admission'):
+        state, active, active_bytes, queued = admission_step(conn, slot_id, size)
+        if state == 'queued':
+            metrics.inc('filebox_upload_admissions_total', result='queued')
+            app.logger.warning(f"Upload queued: {active} active ({active_bytes // (1024*1024)} MB in flight), "
+                            f"{queued} waiting")
+        while state == 'queued' and time.monotonic() < deadline:
+            time.sleep(ADMISSION_POLL_INTERVAL)
+            state, active, active_bytes, queued = admission_step(conn, slot_id, size)
+
+    if state == 'admitted':
+        metrics.inc('filebox_upload_admissions_total', result='admitted')
+        return None
+    release_upload_admission()
+    metrics.inc('filebox_upload_admissions_total', result='rejected')
+    app.logger.warning(f"Upload rejected ({size // 1024} KB): {active} active "
+                       f"({active_bytes // (1024*1024)} MB in flight), {queued} waiting")
+    return upload_busy_response()
+
+@app.teardown_request
+def release_upload_admission(exc=None):
+    admission = g.pop('upload_admission', None)
+    if admission is None:
+        return
+    upload_folder, slot_id = admission
+    conn = get_index_db(upload_folder)
+    with conn:
+        conn.execute('DELETE FROM upload_admissions WHERE id = ?', (slot_id,))
+
 @app.route('/upload', methods=['POST'])
+@login_required
 def upload_file():
     # Check if this is an AJAX request for hash verification
     is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -446,7 +2845,10 @@ def upload_file():
     except Exception as e:
         app.logger.error(f'Error checking content length: {str(e)}')
     
-    if 'files' not in request.files:
+    # Parsing the body streams every file to disk, hashing it on the way
+    with timed_phase('receive'):
+        has_files = 'files' in request.files
+    if not has_files:
         if is_ajax:
             return json.dumps({'success': False, 'error': 'No file part'}), 400
         flash('No file part', 'error')
@@ -472,53 +2874,36 @@ def upload_file():
                     results.append({'filename': file.filename, 'success': False, 'error': 'Invalid filename'})
                 continue
             
-            # Check individual file size
-            file.seek(0, 2)  # Seek to end
-            file_size = file.tell()
-            file.seek(0)  # Reset to beginning
+            upload_folder = get_current_upload_folder()
+            with timed_phase('receive'):
+                spool = spool_upload(file, upload_folder)
+            # Hashing happens while receiving; split it out of the receive time
+            add_phase_time('hash', spool.hash_seconds)
+            add_phase_time('receive', -spool.hash_seconds)
             
-            if file_size > app.config['MAX_FILE_SIZE']:
+            # Check individual file size
+            if spool.too_large:
                 failure_count += 1
                 max_size_mb = app.config['MAX_FILE_SIZE'] // (1024*1024)
                 if is_ajax:
                     results.append({'filename': file.filename, 'success': False, 'error': f'File too large (max {max_size_mb}MB)'})
                 continue
             
-            upload_folder = get_current_upload_folder()
-            target_path = os.path.join(upload_folder, filename)
             original_filename = filename
             
-            # Handle filename conflicts
-            if os.path.exists(target_path):
-                base, ext = os.path.splitext(filename)
-                counter = 1
-                while True:
-                    new_filename = f"{base}_{counter}{ext}"
-                    new_target = os.path.join(upload_folder, new_filename)
-                    if not os.path.exists(new_target):
-                        filename = new_filename
-                        target_path = new_target
-                        break
-                    counter += 1
-            
             try:
-                file.save(target_path)
-                
-                # Calculate hash for verification
-                file_hash = calculate_file_hash(target_path)
+                filename, deduplicated = store_upload(spool, filename, upload_folder)
+                file_hash = spool.hexdigest()
                 
                 success_count += 1
                 
-                # Generate thumbnail for images
-                if filename.lower().endswith(('jpg', 'jpeg', 'png', 'gif')):
-                    create_thumbnail(target_path)
-                
                 if is_ajax:
                     results.append({
                         'filename': original_filename,
                         'saved_as': filename,
                         'success': True,
-                        'hash': file_hash
+                        'hash': file_hash,
+                        'deduplicated': deduplicated
                     })
 
             except Exception as e:
@@ -556,12 +2941,456 @@ def upload_file():
 
     return redirect(url_for('index'))
 
+# Resumable uploads: a session per file, numbered chunks with their own
+# SHA-256, finalized through the same store_upload() path as upload_file.
+# Each chunk is streamed to its own file; completing the session concatenates
+# them and computes the file's SHA-256 in that same pass.
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 3600  # seconds before an abandoned session is dropped
+
+class AssembledUpload:
+    """A fully received resumable upload, ready for store_upload()"""
+
+    def __init__(self, path, file_hash):
+        self.path = path
+        self.file_hash = file_hash
+        self.size = os.path.getsize(path)
+
+    def hexdigest(self):
+        return self.file_hash
+
+    def discard(self):
+        os.remove(self.path)
+
+    def sync(self):
+        os.chmod(self.path, UPLOAD_FILE_MODE)
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def claim(self, target_path):
+        link_into_place(self.path, target_path)
+
+class StoredContent:
+    """Content a preflight found already stored, claimed without receiving it"""
+
+    def __init__(self, file_hash, size):
+        self.file_hash = file_hash
+        self.size = size
+        self.path = None
+
+    def hexdigest(self):
+        return self.file_hash
+
+    def discard(self):
+        pass
+
+    def sync(self):
+        # Only reached when the stored copy could not be linked: the client has to upload it
+        raise OSError('Stored copy is no longer available')
+
+def get_session_part_path(upload_folder, session_id):
+    return os.path.join(get_incoming_dir(upload_folder), f"{session_id}.part")
+
+def get_session_chunk_path(upload_folder, session_id, index):
+    return os.path.join(get_incoming_dir(upload_folder), f"{session_id}.{index}.chunk")
+
+def remove_session_chunks(upload_folder, session_id, total_chunks):
+    for index in range(total_chunks):
+        try:
+            os.remove(get_session_chunk_path(upload_folder, session_id, index))
+        except FileNotFoundError:
+            pass
+
+def drop_upload_session(conn, upload_folder, session_id):
+    session = conn.execute('SELECT size, chunk_size FROM upload_sessions WHERE id = ?', (session_id,)).fetchone()
+    with conn:
+        conn.execute('DELETE FROM upload_chunks WHERE session_id = ?', (session_id,))
+        conn.execute('DELETE FROM upload_sessions WHERE id = ?', (session_id,))
+    if session is not None:
+        remove_session_chunks(upload_folder, session_id,
+                              (session['size'] + session['chunk_size'] - 1) // session['chunk_size'])
+    try:
+        os.remove(get_session_part_path(upload_folder, session_id))
+    except FileNotFoundError:
+        pass
+
+def purge_expired_upload_sessions(conn, upload_folder):
+    expired = conn.execute(
+        'SELECT id FROM upload_sessions WHERE created < ?', (time.time() - UPLOAD_SESSION_TTL,)
+    ).fetchall()
+    for row in expired:
+        drop_upload_session(conn, upload_folder, row['id'])
+
+def get_upload_session(conn, session_id):
+    row = conn.execute('SELECT * FROM upload_sessions WHERE id = ?', (session_id,)).fetchone()
+    if row is None or row['user'] != current_user.id:
+        return None
+    return row
+
+def describe_upload_session(conn, session):
+    """Session state for the client: which chunks are still missing and the contiguous offset"""
+    total_chunks = (session['size'] + session['chunk_size'] - 1) // session['chunk_size']
+    received = {row[0] for row in conn.execute(
+        'SELECT idx FROM upload_chunks WHERE session_id = ?', (session['id'],)
+    )}
+    missing = [i for i in range(total_chunks) if i not in received]
+    contiguous = missing[0] if missing else total_chunks
+    return {
+        'id': session['id'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'chunk_size': session['chunk_size'],
+        'total_chunks': total_chunks,
+        'received': sorted(received),
+        'missing': missing,
+        'offset': min(contiguous * session['chunk_size'], session['size'])
+    }
+
+# Upload preflight: the client sends the SHA-256 of every selected file and
+# only uploads the ones the index doesn't already have.
+PREFLIGHT_MAX_FILES = 1000
+PREFLIGHT_QUERY_BATCH = 500  # hashes per IN (...) lookup
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+@app.route('/upload/preflight', methods=['POST'])
+@login_required
+def preflight_upload():
+    """Report which files of a batch are already stored, by name, size and SHA-256.
+
+    Each file comes back as "missing" (has to be uploaded), "linked" (stored
+    under another name and hardlinked in as this one, with DEDUPLICATE_UPLOADS)
+    or "present" (already stored; saved_as names the stored copy).
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('files')
+    if not isinstance(entries, list) or len(entries) > PREFLIGHT_MAX_FILES:
+        return json_response({'success': False, 'error': f'Expected a list of up to {PREFLIGHT_MAX_FILES} files'}, 400)
+
+    upload_folder = get_current_upload_folder()
+    conn = ensure_index(upload_folder)
+    wanted = []
+    for entry in entries:
+        entry = entry if isinstance(entry, dict) else {}
+        name = str(entry.get('name') or '')
+        file_hash = str(entry.get('sha256') or '').lower()
+        size = entry.get('size')
+        filename = secure_filename(name) if allowed_file(name) else ''
+        valid = filename and isinstance(size, int) and SHA256_PATTERN.fullmatch(file_hash)
+        wanted.append((name, filename, size, file_hash if valid else None))
+
+    with timed_phase('query'):
+        stored = {}
+        hashes = list({file_hash for _, _, _, file_hash in wanted if file_hash})
+        for start in range(0, len(hashes), PREFLIGHT_QUERY_BATCH):
+            batch = hashes[start:start + PREFLIGHT_QUERY_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            for row in conn.execute(f'SELECT name, size, path, hash FROM files WHERE hash IN ({placeholders})', batch):
+                stored.setdefault(row['hash'], []).append(row)
+
+    results = []
+    for name, filename, size, file_hash in wanted:
+        result = {'filename': name, 'status': 'missing'}
+        results.append(result)
+        copies = [row for row in stored.get(file_hash, ())
+                  if row['size'] == size and os.path.isfile(os.path.join(upload_folder, row['path']))]
+        if not copies:
+            continue
+        same_name = next((row for row in copies if row['name'] == filename), None)
+        if same_name is not None or not app.config['DEDUPLICATE_UPLOADS']:
+            result.update(status='present', success=True, saved_as=(same_name or copies[0])['name'], hash=file_hash)
+            continue
+        try:
+            saved_as, _ = store_upload(StoredContent(file_hash, size), filename, upload_folder)
+        except OSError as e:
+            app.logger.warning(f"Preflight could not link {filename}: {str(e)}")
+            continue
+        result.update(status='linked', success=True, saved_as=saved_as, hash=file_hash)
+
+    return json_response({'files': results})
+
+@app.route('/upload/sessions', methods=['POST'])
+@login_required
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    client_filename = str(data.get('filename') or '')
+    size = data.get('size')
+    expected_hash = data.get('sha256')
+
+    if not client_filename or not allowed_file(client_filename):
+        return json_response({'success': False, 'error': 'File type not allowed'}, 400)
+    if not secure_filename(client_filename):
+        return json_response({'success': False, 'error': 'Invalid filename'}, 400)
+    if not isinstance(size, int) or size < 0:
+        return json_response({'success': False, 'error': 'Invalid size'}, 400)
+    if expected_hash is not None and not (
+            isinstance(expected_hash, str) and SHA256_PATTERN.fullmatch(expected_hash.lower())):
+        return json_response({'success': False, 'error': 'Invalid sha256'}, 400)
+    if size > app.config['MAX_FILE_SIZE']:
+        max_size_mb = app.config['MAX_FILE_SIZE'] // (1024*1024)
+        return json_response({'success': False, 'error': f'File too large (max {max_size_mb}MB)'}, 413)
+
+    upload_folder = get_current_upload_folder()
+    conn = get_index_db(upload_folder)
+    purge_expired_upload_sessions(conn, upload_folder)
+
+    session_id = secrets.token_hex(16)
+    chunk_size = min(UPLOAD_CHUNK_SIZE, app.config['MAX_CONTENT_LENGTH'])
+    with conn:
+        conn.execute(
+            'INSERT INTO upload_sessions (id, user, filename, size, chunk_size, sha256, created) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (session_id, current_user.id, client_filename, size, chunk_size,
+             expected_hash.lower() if expected_hash is not None else None, time.time())
+        )
+    session = get_upload_session(conn, session_id)
+    return json_response(describe_upload_session(conn, session), 201)
+
+@app.route('/upload/sessions/<session_id>', methods=['GET'])
+@login_required
+def upload_session_status(session_id):
+    conn = get_index_db()
+    session = get_upload_session(conn, session_id)
+    if session is None:
+        return json_response({'success': False, 'error': 'Upload session not found'}, 404)
+    return json_response(describe_upload_session(conn, session))
+
+@app.route('/upload/sessions/<session_id>', methods=['DELETE'])
+@login_required
+def cancel_upload_session(session_id):
+    upload_folder = get_current_upload_folder()
+    conn = get_index_db(upload_folder)
+    if get_upload_session(conn, session_id) is None:
+        return json_response({'success': False, 'error': 'Upload session not found'}, 404)
+    drop_upload_session(conn, upload_folder, session_id)
+    return json_response({'success': True})
+
+@app.route('/upload/sessions/<session_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def upload_session_chunk(session_id, index):
+    upload_folder = get_current_upload_folder()
+    conn = get_index_db(upload_folder)
+    session = get_upload_session(conn, session_id)
+    if session is None:
+        return json_response({'success': False, 'error': 'Upload session not found'}, 404)
+
+    offset = index * session['chunk_size']
+    if index < 0 or offset >= session['size']:
+        return json_response({'success': False, 'error': 'Chunk index out of range'}, 400)
+    expected_length = min(session['chunk_size'], session['size'] - offset)
+
+    # Streamed to a temporary file with a running hash: the chunk is never held in memory
+    chunk_path = get_session_chunk_path(upload_folder, session_id, index)
+    digest = hashlib.sha256()
+    received = 0
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=get_incoming_dir(upload_folder))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # One byte past the chunk is enough to tell it is too long
+            while received <= expected_length:
+                data = request.stream.read(min(UPLOAD_BUFFER_SIZE, expected_length + 1 - received))
+                if not data:
+                    break
+                digest.update(data)
+                f.write(data)
+                received += len(data)
+        if received != expected_length:
+            return json_response({'success': False, 'error': f'Expected {expected_length} bytes, got {received}'}, 400)
+        chunk_hash = request.headers.get('X-Chunk-SHA256')
+        if chunk_hash and digest.hexdigest() != chunk_hash.lower():
+            return json_response({'success': False, 'error': 'Chunk checksum mismatch'}, 422)
+        os.replace(tmp_path, chunk_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    with conn:
+        conn.execute('INSERT OR IGNORE INTO upload_chunks (session_id, idx) VALUES (?, ?)', (session_id, index))
+
+    state = describe_upload_session(conn, session)
+    return json_response({'success': True, 'offset': state['offset'], 'missing': state['missing']})
+
+@app.route('/upload/sessions/<session_id>/complete', methods=['POST'])
+@login_required
+def complete_upload_session(session_id):
+    upload_folder = get_current_upload_folder()
+    conn = get_index_db(upload_folder)
+    session = get_upload_session(conn, session_id)
+    if session is None:
+        return json_response({'success': False, 'error': 'Upload session not found'}, 404)
+
+    state = describe_upload_session(conn, session)
+    if state['missing']:
+        return json_response({'success': False, 'error': 'Upload incomplete', 'missing': state['missing']}, 409)
+
+    # Concatenate the chunks, hashing the file on the way
+    part_path = get_session_part_path(upload_folder, session_id)
+    digest = hashlib.sha256()
+    with open(part_path, 'wb') as part:
+        for index in range(state['total_chunks']):
+            try:
+                chunk = open(get_session_chunk_path(upload_folder, session_id, index), 'rb')
+            except FileNotFoundError:
+                # Recorded but lost (e.g. the spool directory was cleaned): send it again
+                with conn:
+                    conn.execute('DELETE FROM upload_chunks WHERE session_id = ? AND idx = ?', (session_id, index))
+                os.remove(part_path)
+                return json_response({'success': False, 'error': 'Upload incomplete', 'missing': [index]}, 409)
+            with chunk:
+                for data in iter(lambda: chunk.read(UPLOAD_BUFFER_SIZE), b''):
+                    digest.update(data)
+                    part.write(data)
+    remove_session_chunks(upload_folder, session_id, state['total_chunks'])
+    file_hash = digest.hexdigest()
+    if session['sha256'] and session['sha256'] != file_hash:
+        # Start over: every chunk has to be sent again
+        with conn:
+            conn.execute('DELETE FROM upload_chunks WHERE session_id = ?', (session_id,))
+        os.remove(part_path)
+        return json_response({
+            'filename': session['filename'],
+            'success': False,
+            'error': 'File checksum mismatch',
+            'hash': file_hash
+        }, 422)
+
+    try:
+        filename, deduplicated = store_upload(AssembledUpload(part_path, file_hash),
+                                              secure_filename(session['filename']), upload_folder)
+    except Exception as e:
+        app.logger.error(f"Error saving file {session['filename']}: {str(e)}")
+        return json_response({'filename': session['filename'], 'success': False, 'error': str(e)}, 500)
+    drop_upload_session(conn, upload_folder, session_id)
+
+    return json_response({
+        'filename': session['filename'],
+        'saved_as': filename,
+        'success': True,
+        'hash': file_hash,
+        'deduplicated': deduplicated
+    })
+
+# Deleting only renames files into a trash batch and drops their index rows;
+# a background thread then removes the originals and their renditions.
+# A batch is filled under a hidden name, which the purge leaves alone.
+TRASH_DIR_NAME = '.trash'
+TRASH_PURGE_LOCK = '.purge.lock'
+TRASH_FILLING_TIMEOUT = 3600  # seconds after which a hidden batch counts as left behind by a crash
+
+_trash_purge_lock = threading.Lock()
+_trash_purge_threads = {}
+
+def get_trash_dir(upload_folder):
+    trash_dir = os.path.join(upload_folder, TRASH_DIR_NAME)
+    os.makedirs(trash_dir, exist_ok=True)
+    return trash_dir
+
+def move_to_trash(upload_folder, filenames):
+    """Move files into a new trash batch; returns (trashed, missing) name lists"""
+    trash_dir = get_trash_dir(upload_folder)
+    filling_dir = tempfile.mkdtemp(prefix=f".{int(time.time())}-", dir=trash_dir)
+    trashed = []
+    missing = []
+    for filename in dict.fromkeys(filenames):
+        if os.sep in filename or filename.startswith('.') or not allowed_file(filename):
+            missing.append(filename)
+            continue
+        try:
+            os.rename(get_file_path(upload_folder, filename), os.path.join(filling_dir, filename))
+            trashed.append(filename)
+        except FileNotFoundError:
+            missing.append(filename)
+    if trashed:
+        conn = get_index_db(upload_folder)
+        with conn:
+            conn.executemany('DELETE FROM files WHERE name = ?', [(name,) for name in trashed])
+        # Rows gone first: the purge only keeps renditions of names still indexed
+        os.rename(filling_dir, os.path.join(trash_dir, os.path.basename(filling_dir)[1:]))
+    else:
+        os.rmdir(filling_dir)
+    return trashed, missing
+
+def purge_trash(upload_folder):
+    """Delete trashed files, their renditions and thumbnail jobs (one worker at a time)"""
+    trash_dir = get_trash_dir(upload_folder)
+    lock_file = try_lock_file(os.path.join(trash_dir, TRASH_PURGE_LOCK))
+    if lock_file is None:
+        return 0
+    purged = 0
+    try:
+        # Keep going until no batch is left, including ones trashed meanwhile
+        while True:
+            abandoned = time.time() - TRASH_FILLING_TIMEOUT
+            batches = [entry.path for entry in os.scandir(trash_dir) if entry.is_dir()
+                       and (not entry.name.startswith('.') or entry.stat().st_mtime < abandoned)]
+            if not batches:
+                break
+            for batch_dir in batches:
+                names = []
+                for entry in os.scandir(batch_dir):
+                    os.remove(entry.path)
+                    names.append(entry.name)
+                os.rmdir(batch_dir)
+                # A file uploaded again under the same name keeps its renditions
+                gone = [name for name in names if not is_name_taken(upload_folder, name)]
+                for name in gone:
+                    remove_renditions(upload_folder, name)
+                conn = get_index_db(upload_folder)
+                with conn:
+                    conn.executemany('DELETE FROM thumbnail_jobs WHERE name = ?', [(name,) for name in gone])
+                purged += len(names)
+    finally:
+        lock_file.close()
+    if purged:
+        app.logger.info(f"Purged {purged} deleted files from {upload_folder}")
+    return purged
+
+def _run_trash_purge(upload_folder):
+    try:
+        purge_trash(upload_folder)
+    except Exception as e:
+        app.logger.error(f"Trash purge failed for {upload_folder}: {e}")
+
+def start_trash_purge(upload_folder):
+    """Purge the trash in a background thread unless one is already running here"""
+    with _trash_purge_lock:
+        thread = _trash_purge_threads.get(upload_folder)
+        if thread is not None and thread.is_alive():
+            return thread
+        thread = threading.Thread(target=_run_trash_purge, args=(upload_folder,),
+                                  name='filebox-trash-purge', daemon=True)
+        _trash_purge_threads[upload_folder] = thread
+        thread.start()
+        return thread
+
+@app.route('/delete', methods=['POST'])
+@login_required
+def delete_files():
+    """Delete many files at once: {"files": [...]} as JSON, or repeated 'files' form fields"""
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        filenames = payload.get('files') if isinstance(payload, dict) else None
+        if not isinstance(filenames, list) or not all(isinstance(name, str) for name in filenames):
+            return json_response({'success': False, 'error': 'Expected {"files": [...]}'}, 400)
+    else:
+        filenames = request.form.getlist('files')
+    if not filenames:
+        return json_response({'success': False, 'error': 'No files given'}, 400)
+
+    upload_folder = get_current_upload_folder()
+    trashed, missing = move_to_trash(upload_folder, filenames)
+    if trashed:
+        start_trash_purge(upload_folder)
+    return json_response({'success': True, 'deleted': trashed, 'missing': missing})
+
 @app.route('/delete/<filename>')
+@login_required
 def delete_file(filename):
     upload_folder = get_current_upload_folder()
-    file_path = os.path.join(upload_folder, filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    trashed, _missing = move_to_trash(upload_folder, [filename])
+    if trashed:
+        start_trash_purge(upload_folder)
         flash(f'Deleted: {filename}', 'success')
     else:
         flash('File not found', 'error')
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Per-Request Authentication Overhead Benchmark
+Measures the cost of Flask-Login's user_loader with the credentials file
+re-parsed on every request (old behavior) and with the cached
+CredentialStore, both in isolation and through authenticated requests.
+
+Usage:
+    python3 benchmarks/bench_auth.py [--users 50] [--requests 2000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def timed(func, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-request auth overhead')
+    parser.add_argument('--users', type=int, default=50, help='entries in the credentials file')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Import the app from a scratch directory so it doesn't touch the real config or uploads
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_DIR)
+        from werkzeug.security import generate_password_hash
+        password_hash = generate_password_hash('benchmark', method='pbkdf2:sha256')
+        with open('user_credentials.txt', 'w') as f:
+            f.write('# benchmark users\n')
+            for i in range(args.users):
+                f.write(f"user{i}:{password_hash}\n")
+
+        import app as filebox
+        from credentials import parse_credentials
+
+        client = filebox.app.test_client()
+        response = client.post('/login', data={'username': 'user0', 'password': 'benchmark'})
+        assert response.status_code == 302, 'login failed'
+
+        path = filebox.app.config['USER_CREDENTIALS_FILE']
+        store = filebox.credential_store
+        cached_get_users = store.get_users
+
+        def uncached_get_users():
+            return parse_credentials(path)
+
+        def request():
+            # Authenticated route that does no other file work
+            client.get('/thumbs/does-not-exist.jpg')
+
+        print(f"{args.users} users, {args.requests} iterations\n")
+        results = {}
+        for label, get_users in (('before (parse per request)', uncached_get_users),
+                                 ('after (cached store)', cached_get_users)):
+            store.get_users = get_users
+            with filebox.app.test_request_context():
+                loader_us = timed(lambda: filebox.load_user('user0'), args.requests)
+            request_us = timed(request, args.requests)
+            results[label] = (loader_us, request_us)
+            print(f"{label:<28} load_user {loader_us:8.1f} us   request {request_us:8.1f} us")
+        store.get_users = cached_get_users
+
+        before, after = results.values()
+        print()
+        print(f"load_user speedup: {before[0] / after[0]:.1f}x, "
+              f"saved per request: {before[1] - after[1]:.1f} us")
+
+if __name__ == '__main__':
+    main()
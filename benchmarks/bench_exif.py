@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+EXIF Date Extraction Micro-Benchmark
+Compares the Pillow path, the header-only fast path and the memoized
+resolve_file_date() on a folder of generated JPEGs with EXIF dates.
+
+Usage:
+    python3 benchmarks/bench_exif.py [--files 200] [--size 3000x2000] [--rounds 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_images(folder, count, size):
+    """Write count JPEGs carrying DateTimeOriginal/DateTime tags"""
+    paths = []
+    img = Image.effect_noise(size, 64).convert('RGB')
+    for i in range(count):
+        exif = Image.Exif()
+        exif[0x0132] = f"2023:05:{i % 28 + 1:02d} 12:00:00"
+        exif.get_ifd(0x8769)[0x9003] = f"2024:01:{i % 28 + 1:02d} 08:30:00"
+        path = os.path.join(folder, f"photo_{i:05d}.jpg")
+        img.save(path, 'JPEG', quality=85, exif=exif.tobytes())
+        paths.append(path)
+    return paths
+
+def run(label, func, paths, rounds):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for path in paths:
+            func(path)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    per_file_us = best / len(paths) * 1e6
+    print(f"{label:<28} {best * 1000:10.1f} ms total {per_file_us:10.1f} us/file")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark EXIF date extraction')
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size', default='3000x2000', help='image size WIDTHxHEIGHT')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.split('x'))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Import the app from a scratch directory so it doesn't touch the real config or uploads
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_DIR)
+        import app as filebox
+
+        folder = os.path.join(workdir, 'images')
+        os.makedirs(folder)
+        print(f"Generating {args.files} JPEGs of {size[0]}x{size[1]} ...")
+        paths = make_images(folder, args.files, size)
+
+        # Sanity check: both extractors must agree
+        for path in paths:
+            assert filebox.extract_date_fast(path) == filebox.extract_date_with_pillow(path), path
+
+        pillow = run('Pillow _getexif()', filebox.extract_date_with_pillow, paths, args.rounds)
+        fast = run('Header-only extractor', filebox.extract_date_fast, paths, args.rounds)
+        resolve = lambda path: filebox.resolve_file_date(path, os.path.basename(path))
+        resolve_cold = run('resolve_file_date (cold)', lambda path: (filebox._date_cache.clear(), resolve(path)),
+                           paths, args.rounds)
+        for path in paths:
+            resolve(path)
+        cached = run('resolve_file_date (cached)', resolve, paths, args.rounds)
+
+        print()
+        print(f"Header-only speedup over Pillow: {pillow / fast:.1f}x")
+        print(f"Cached resolve speedup over cold: {resolve_cold / cached:.1f}x")
+
+if __name__ == '__main__':
+    main()
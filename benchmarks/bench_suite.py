@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+End-to-End Scaling Benchmark Suite
+Generates synthetic upload folders (EXIF JPEGs, PNGs and documents, with
+and without date-patterned names) and drives the app through the Flask
+test client: gallery pages, the /api/files cursor listing, upload
+throughput, thumbnail rendering per megapixel and file serving bandwidth.
+Results are written as JSON so runs can be compared between commits.
+
+Runs offline; everything lives in a temporary directory.
+
+Usage:
+    python3 benchmarks/bench_suite.py [--files 1000,10000] [--output results.json]
+    python3 benchmarks/bench_suite.py --files 100000 --pages 1,10,last --repeat 3
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Share of each kind of file in a synthetic folder
+FILE_MIX = (('jpeg', 0.6), ('png', 0.15), ('document', 0.25))
+DOCUMENT_EXTENSIONS = ('txt', 'pdf', 'docx', 'csv')
+
+def timings(func, repeat):
+    """Run func repeat times and summarize the wall time in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+        'runs': repeat
+    }
+
+def jpeg_bytes(size, taken=None, noise=False):
+    """A JPEG, optionally carrying a DateTimeOriginal EXIF tag"""
+    img = Image.effect_noise(size, 64).convert('RGB') if noise else Image.new('RGB', size, (120, 90, 60))
+    buf = io.BytesIO()
+    if taken is not None:
+        exif = Image.Exif()
+        exif.get_ifd(0x8769)[0x9003] = taken.strftime('%Y:%m:%d %H:%M:%S')
+        img.save(buf, 'JPEG', quality=85, exif=exif.tobytes())
+    else:
+        img.save(buf, 'JPEG', quality=85)
+    return buf.getvalue()
+
+def generate_folder(folder, count, seed=0):
+    """Fill folder with count small files spread over ~3 years of dates"""
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    png = io.BytesIO()
+    Image.new('RGBA', (64, 48), (10, 200, 30, 255)).save(png, 'PNG')
+    png = png.getvalue()
+    start = datetime(2022, 1, 1)
+    kinds = [kind for kind, _share in FILE_MIX]
+    weights = [share for _kind, share in FILE_MIX]
+
+    for i in range(count):
+        taken = start + timedelta(seconds=rng.randrange(3 * 365 * 86400))
+        kind = rng.choices(kinds, weights)[0]
+        # Half of the files follow camera/phone naming with the date in it
+        dated = rng.random() < 0.5
+        if kind == 'jpeg':
+            name = f"IMG_{taken:%Y%m%d_%H%M%S}_{i}.jpg" if dated else f"photo_{i:06d}.jpg"
+            # Some photos lost their EXIF (messengers, editors)
+            data = jpeg_bytes((64, 48), taken if rng.random() < 0.8 else None)
+        elif kind == 'png':
+            name = f"Screenshot_{taken:%Y-%m-%d-%H-%M-%S}_{i}.png" if dated else f"image_{i:06d}.png"
+            data = png
+        else:
+            ext = rng.choice(DOCUMENT_EXTENSIONS)
+            name = f"scan_{taken:%Y%m%d}_{i}.{ext}" if dated else f"document_{i:06d}.{ext}"
+            data = os.urandom(rng.randrange(512, 8192))
+        path = os.path.join(folder, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        mtime = taken.timestamp()
+        os.utime(path, (mtime, mtime))
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Harness:
+    """The app imported from a scratch directory, logged in through the test client"""
+
+    def __init__(self, workdir, thumbnail_workers):
+        self.workdir = workdir
+        self.thumbnail_workers = thumbnail_workers
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_DIR)
+        from werkzeug.security import generate_password_hash
+        with open('user_credentials.txt', 'w') as f:
+            f.write(f"bench:{generate_password_hash('benchmark', method='pbkdf2:sha256')}\n")
+        self.use_folder(os.path.join(workdir, 'empty'))
+
+        import app as filebox
+        self.filebox = filebox
+        filebox.app.config['TESTING'] = True
+        self.client = filebox.app.test_client()
+        response = self.client.post('/login', data={'username': 'bench', 'password': 'benchmark'})
+        assert response.status_code == 302, 'login failed'
+
+    def use_folder(self, folder):
+        """Point config.txt at another upload folder and make the app pick it up"""
+        with open(os.path.join(self.workdir, 'config.txt'), 'w') as f:
+            f.write(f"UPLOAD_FOLDER={folder}\n")
+            f.write("FOLDER_WATCHER=off\n")
+            f.write(f"THUMBNAIL_WORKERS={self.thumbnail_workers}\n")
+            f.write("MAX_FILE_SIZE=1024\n")
+            f.write("MAX_CONTENT_LENGTH=4096\n")
+        if 'app' in sys.modules:
+            sys.modules['app'].request_config_reload()
+            with sys.modules['app'].app.app_context():
+                sys.modules['app'].get_current_upload_folder()
+
+    def get(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        assert response.status_code in (200, 206, 304), (url, response.status_code)
+        return response
+
+def bench_listing(harness, folder, count, pages, repeat):
+    harness.use_folder(folder)
+    result = {'files': count}
+
+    # First request builds the index from scratch (EXIF and filename dates for every file)
+    started = time.perf_counter()
+    html = harness.get('/').get_data(as_text=True)
+    result['index_cold_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    total_pages = 1
+    marker = 'Page 1 of '
+    if marker in html:
+        total_pages = int(html.split(marker, 1)[1].split('<', 1)[0])
+    result['total_pages'] = total_pages
+
+    result['index_pages'] = {}
+    for page in pages:
+        number = total_pages if page == 'last' else min(int(page), total_pages)
+        result['index_pages'][str(page)] = dict(timings(lambda: harness.get(f'/?page={number}'), repeat),
+                                                page=number)
+
+    # Keyset listing: first page, then a page reached by walking the cursor
+    result['api_files_first'] = timings(lambda: harness.get('/api/files?limit=100'), repeat)
+    cursor = None
+    depth = 0
+    for depth in range(1, 51):
+        payload = harness.get('/api/files', query_string={'limit': 100, 'cursor': cursor or ''}).get_json()
+        if not payload['next_cursor']:
+            break
+        cursor = payload['next_cursor']
+    if cursor:
+        deep = timings(lambda: harness.get('/api/files', query_string={'limit': 100, 'cursor': cursor}), repeat)
+        result['api_files_deep'] = dict(deep, depth=depth)
+    return result
+
+def bench_uploads(harness, folder, batches, repeat):
+    harness.use_folder(folder)
+    photo = jpeg_bytes((1600, 1200), datetime(2024, 6, 1, 12, 0, 0), noise=True)
+    results = {}
+    serial = 0
+    for batch in batches:
+        samples = []
+        for _ in range(repeat):
+            files = []
+            for _ in range(batch):
+                serial += 1
+                files.append((io.BytesIO(photo), f"upload_{serial:06d}.jpg"))
+            started = time.perf_counter()
+            response = harness.client.post('/upload', data={'files': files},
+                                           headers={'X-Requested-With': 'XMLHttpRequest'},
+                                           content_type='multipart/form-data')
+            samples.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        best = min(samples)
+        results[str(batch)] = {
+            'median_ms': round(statistics.median(samples) * 1000, 3),
+            'files_per_s': round(batch / best, 2),
+            'mb_per_s': round(batch * len(photo) / best / 1e6, 2),
+            'file_bytes': len(photo)
+        }
+    return results
+
+def bench_thumbnails(harness, folder, megapixels, repeat):
+    harness.use_folder(folder)
+    results = {}
+    for mp in megapixels:
+        width = int((mp * 1e6 * 4 / 3) ** 0.5)
+        height = int(width * 3 / 4)
+        name = f"render_{mp}mp.jpg"
+        path = os.path.join(folder, name)
+        with open(path, 'wb') as f:
+            f.write(jpeg_bytes((width, height), noise=True))
+        with harness.filebox.app.app_context():
+            stats = timings(lambda: harness.filebox.create_thumbnail(path), repeat)
+        stats['ms_per_megapixel'] = round(stats['median_ms'] / mp, 3)
+        stats['dimensions'] = f"{width}x{height}"
+        results[str(mp)] = stats
+    return results
+
+def bench_serving(harness, folder, size_mb, repeat):
+    harness.use_folder(folder)
+    name = 'serve_test.mp4'
+    with open(os.path.join(folder, name), 'wb') as f:
+        f.write(os.urandom(size_mb * 1024 * 1024))
+    harness.filebox.reconcile_index(folder, compute_hashes=True)
+
+    def full():
+        response = harness.get(f'/uploads/{name}')
+        for _chunk in response.response:
+            pass
+        response.close()
+
+    stats = timings(full, repeat)
+    stats['mb_per_s'] = round(size_mb / (stats['min_ms'] / 1000), 2)
+    etag = harness.get(f'/uploads/{name}').headers['ETag']
+    return {
+        'size_mb': size_mb,
+        'full': stats,
+        'range_1mb': timings(lambda: harness.get(f'/uploads/{name}', headers={'Range': 'bytes=0-1048575'}), repeat),
+        'not_modified': timings(lambda: harness.get(f'/uploads/{name}', headers={'If-None-Match': etag}), repeat)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark filebox at several folder sizes')
+    parser.add_argument('--files', default='1000,10000', help='comma-separated synthetic folder sizes')
+    parser.add_argument('--pages', default='1,5,last', help="gallery pages to time ('last' for the final one)")
+    parser.add_argument('--upload-batches', default='1,10,25', help='comma-separated files per upload request')
+    parser.add_argument('--megapixels', default='2,8,12', help='comma-separated image sizes for thumbnail timing')
+    parser.add_argument('--serve-mb', type=int, default=64, help='size of the file served for bandwidth')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--thumbnail-workers', type=int, default=0,
+                        help='THUMBNAIL_WORKERS for the run (0 renders inside the upload request)')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    sizes = [int(v) for v in args.files.split(',')]
+    pages = [v.strip() for v in args.pages.split(',')]
+    batches = [int(v) for v in args.upload_batches.split(',')]
+    megapixels = [float(v) if '.' in v else int(v) for v in args.megapixels.split(',')]
+
+    results = {
+        'meta': {
+            'git_revision': git_revision(),
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args)
+        }
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        harness = Harness(workdir, args.thumbnail_workers)
+
+        results['listing'] = {}
+        for count in sizes:
+            folder = os.path.join(workdir, f"folder_{count}")
+            print(f"Generating {count} files ...")
+            started = time.perf_counter()
+            generate_folder(folder, count)
+            print(f"  generated in {time.perf_counter() - started:.1f}s, timing gallery ...")
+            listing = bench_listing(harness, folder, count, pages, args.repeat)
+            results['listing'][str(count)] = listing
+            print(f"  cold index {listing['index_cold_ms']:.0f} ms, " + ", ".join(
+                f"page {page} {stats['median_ms']:.1f} ms" for page, stats in listing['index_pages'].items()))
+
+        print("Timing uploads ...")
+        results['upload'] = bench_uploads(harness, os.path.join(workdir, 'uploads'), batches, args.repeat)
+        for batch, stats in results['upload'].items():
+            print(f"  batch {batch:>4}: {stats['files_per_s']:.1f} files/s, {stats['mb_per_s']:.1f} MB/s")
+
+        print("Timing thumbnail rendering ...")
+        results['thumbnail'] = bench_thumbnails(harness, os.path.join(workdir, 'render'), megapixels, args.repeat)
+        for mp, stats in results['thumbnail'].items():
+            print(f"  {mp:>4} MP: {stats['median_ms']:.1f} ms ({stats['ms_per_megapixel']:.1f} ms/MP)")
+
+        print("Timing file serving ...")
+        results['serve'] = bench_serving(harness, os.path.join(workdir, 'serve'), args.serve_mb, args.repeat)
+        print(f"  {args.serve_mb} MB file: {results['serve']['full']['mb_per_s']:.0f} MB/s")
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✅ Results written to {output}")
+
+if __name__ == '__main__':
+    main()
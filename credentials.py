@@ -0,0 +1,54 @@
+"""
+Credentials File Handling for File Manager
+Shared by app.py and tool_registeruser.py so both read user_credentials.txt
+the same way.
+
+Format: one "username:password_hash" entry per line, '#' starts a comment.
+"""
+
+import os
+import threading
+
+def parse_credentials(path):
+    """Parse a credentials file into a {username: password_hash} dict"""
+    users = {}
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                parts = line.strip().split(':', 1)
+                if len(parts) == 2:
+                    username, password_hash = parts
+                    users[username] = password_hash
+    return users
+
+class CredentialStore:
+    """Credentials parsed once and re-read only when the file changes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._users = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def _file_key(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get_users(self):
+        """Return the current {username: password_hash} dict (empty if the file is missing)"""
+        key = self._file_key()
+        with self._lock:
+            if self._users is not None and key == self._key:
+                return self._users
+            users = parse_credentials(self.path) if key is not None else {}
+            self._users = users
+            self._key = key
+            return users
+
+    def invalidate(self):
+        with self._lock:
+            self._users = None
+            self._key = None
@@ -0,0 +1,181 @@
+"""
+Near-Duplicate Detection for File Manager
+Clusters images whose 64-bit perceptual hashes (dHash) differ in at most
+max_distance bits. Uses NumPy when it is installed (vectorized XOR and
+popcount) and plain Python otherwise.
+
+Candidate pairs come from band bucketing: with the hash split into
+max_distance + 1 bands, two hashes within max_distance bits agree exactly
+on at least one band, so only hashes sharing a band value are compared.
+Clusters are the connected components of the matching pairs.
+"""
+
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+# Above this many new hashes per update a full rebuild is cheaper than comparing each one against all
+INCREMENTAL_MAX_NEW = 2000
+
+def _popcount_array(values):
+    """Set bits of every element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    # NumPy < 2.0: SWAR popcount
+    values = values - ((values >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    values = (values & np.uint64(0x3333333333333333)) + ((values >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (values * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+if hasattr(int, 'bit_count'):
+    _popcount = int.bit_count
+else:
+    def _popcount(value):
+        return bin(value).count('1')
+
+def _bands(max_distance):
+    """(shift, mask) of each of the max_distance + 1 bands the hash is split into"""
+    count = min(max_distance + 1, HASH_BITS)
+    edges = [round(i * HASH_BITS / count) for i in range(count + 1)]
+    return [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+
+def _banded_pairs_numpy(values, max_distance):
+    """Index pairs (i, j) of hashes within max_distance bits, as two arrays"""
+    left, right = [], []
+    n = len(values)
+    for shift, mask in _bands(max_distance):
+        keys = (values >> np.uint64(shift)) & np.uint64(mask)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        sorted_values = values[order]
+        # Equal keys are contiguous: compare every element with its k-th successor
+        # while that successor is still in the same bucket
+        candidates = np.arange(n - 1)
+        k = 1
+        while candidates.size:
+            candidates = candidates[candidates + k < n]
+            candidates = candidates[sorted_keys[candidates] == sorted_keys[candidates + k]]
+            if not candidates.size:
+                break
+            distances = _popcount_array(sorted_values[candidates] ^ sorted_values[candidates + k])
+            hits = candidates[distances <= max_distance]
+            left.append(order[hits])
+            right.append(order[hits + k])
+            k += 1
+    if not left:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+def _banded_pairs_python(values, max_distance):
+    for shift, mask in _bands(max_distance):
+        buckets = {}
+        for i, value in enumerate(values):
+            buckets.setdefault((value >> shift) & mask, []).append(i)
+        for bucket in buckets.values():
+            for a in range(len(bucket) - 1):
+                value = values[bucket[a]]
+                for b in bucket[a + 1:]:
+                    if _popcount(value ^ values[b]) <= max_distance:
+                        yield bucket[a], b
+
+class DuplicateIndex:
+    """Clusters of near-identical hashes, kept up to date as hashes are added"""
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._names = {}  # name -> hash
+        self._members = {}  # hash -> set of names
+        self._hashes = []  # distinct hashes; position = union-find node
+        self._positions = {}  # hash -> position
+        self._parent = []
+        self._array = None
+
+    def _find(self, node):
+        parent = self._parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _union(self, a, b):
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a != root_b:
+            self._parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def _rebuild(self):
+        self._hashes = sorted(self._members)
+        self._positions = {value: i for i, value in enumerate(self._hashes)}
+        self._parent = list(range(len(self._hashes)))
+        if np is not None:
+            self._array = np.array(self._hashes, dtype=np.uint64)
+            left, right = _banded_pairs_numpy(self._array, self.max_distance)
+            for a, b in zip(left.tolist(), right.tolist()):
+                self._union(a, b)
+        else:
+            for a, b in _banded_pairs_python(self._hashes, self.max_distance):
+                self._union(a, b)
+
+    def _add_hashes(self, new_hashes):
+        """Compare each new distinct hash against all known ones"""
+        start = len(self._hashes)
+        for value in new_hashes:
+            self._positions[value] = len(self._hashes)
+            self._hashes.append(value)
+            self._parent.append(len(self._parent))
+        if np is not None:
+            self._array = np.concatenate([self._array, np.array(self._hashes[start:], dtype=np.uint64)])
+            for position in range(start, len(self._hashes)):
+                distances = _popcount_array(self._array[:position] ^ self._array[position])
+                for match in np.flatnonzero(distances <= self.max_distance).tolist():
+                    self._union(match, position)
+        else:
+            for position in range(start, len(self._hashes)):
+                value = self._hashes[position]
+                for match in range(position):
+                    if _popcount(self._hashes[match] ^ value) <= self.max_distance:
+                        self._union(match, position)
+
+    def update(self, entries):
+        """Bring the index in line with {name: hash}; returns True if it was rebuilt"""
+        entries = {name: value & HASH_MASK for name, value in entries.items()}
+        with self._lock:
+            removed = [name for name in self._names if name not in entries]
+            changed = [name for name, value in entries.items() if self._names.get(name, value) != value]
+            for name in removed + changed:
+                value = self._names.pop(name)
+                self._members[value].discard(name)
+            new_hashes = {}
+            for name, value in entries.items():
+                if name in self._names:
+                    continue
+                self._names[name] = value
+                self._members.setdefault(value, set()).add(name)
+                if value not in self._positions:
+                    new_hashes[value] = None
+
+            # A hash without files left may have linked two clusters: start over
+            orphaned = [value for value, names in self._members.items() if not names]
+            if orphaned or len(new_hashes) > INCREMENTAL_MAX_NEW or not self._hashes:
+                for value in orphaned:
+                    del self._members[value]
+                self._rebuild()
+                return True
+            if new_hashes:
+                self._add_hashes(new_hashes)
+            return False
+
+    def clusters(self):
+        """Lists of names with near-identical images (two or more), largest first"""
+        with self._lock:
+            groups = {}
+            for value, names in self._members.items():
+                groups.setdefault(self._find(self._positions[value]), []).extend(names)
+        clusters = [sorted(names) for names in groups.values() if len(names) > 1]
+        clusters.sort(key=lambda names: (-len(names), names[0]))
+        return clusters
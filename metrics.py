@@ -0,0 +1,203 @@
+"""
+Metrics Collection for File Manager
+Counters and latency histograms kept in memory by each process and
+periodically written to a per-process JSON file, so /metrics can add up
+every gunicorn worker (and workers that have since exited) without a
+metrics server.
+
+Files live in one directory: "<pid>-<token>.json" per live process, plus
+"archived.json" holding the totals of processes that are gone.
+"""
+
+import os
+import json
+import time
+import fcntl
+import secrets
+import threading
+
+# Request latency buckets in seconds, tuned for a Raspberry Pi
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ARCHIVE_FILE = 'archived.json'
+LOCK_FILE = '.lock'
+
+def _key(name, labels):
+    return name + json.dumps(labels, sort_keys=True, separators=(',', ':'))
+
+def _split_key(key):
+    brace = key.index('{')
+    return key[:brace], json.loads(key[brace:])
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _merge(total, data):
+    for key, value in data.get('counters', {}).items():
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for key, hist in data.get('histograms', {}).items():
+        merged = total['histograms'].get(key)
+        if merged is None or merged['le'] != hist['le']:
+            total['histograms'][key] = {'le': list(hist['le']), 'buckets': list(hist['buckets']),
+                                        'sum': hist['sum'], 'count': hist['count']}
+            continue
+        merged['buckets'] = [a + b for a, b in zip(merged['buckets'], hist['buckets'])]
+        merged['sum'] += hist['sum']
+        merged['count'] += hist['count']
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in items)
+    return '{' + ','.join(escaped) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metrics:
+    """Process-local counters and histograms, shared across workers through files"""
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.help = {}
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._token = secrets.token_hex(4)
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = time.monotonic()
+
+    def _check_fork(self):
+        # A forked worker starts from zero instead of re-counting its parent's data
+        if self._pid != os.getpid():
+            self._reset()
+
+    def describe(self, name, kind, help_text):
+        self.help[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._check_fork()
+            key = _key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        with self._lock:
+            self._check_fork()
+            key = _key(name, labels)
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {'le': list(buckets), 'buckets': [0] * len(buckets),
+                                                'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(hist['le']):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+                    break
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def _path(self):
+        return os.path.join(self.directory, f"{self._pid}-{self._token}.json")
+
+    def flush(self, force=False):
+        """Write this process's totals to its file (at most every flush_interval seconds)"""
+        if not self.directory:
+            return
+        with self._lock:
+            self._check_fork()
+            if not force and time.monotonic() - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = time.monotonic()
+            data = json.dumps({'counters': self._counters, 'histograms': self._histograms})
+            path = self._path()
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """Totals over all processes; files of exited processes are folded into the archive"""
+        self.flush(force=True)
+        total = {'counters': {}, 'histograms': {}}
+        if not self.directory:
+            return total
+        with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+            archive = {'counters': {}, 'histograms': {}}
+            try:
+                with open(archive_path) as f:
+                    _merge(archive, json.load(f))
+            except (FileNotFoundError, ValueError):
+                pass
+
+            archived = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.json') or entry.name == ARCHIVE_FILE:
+                    continue
+                try:
+                    with open(entry.path) as f:
+                        data = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                pid = int(entry.name.split('-', 1)[0])
+                if _pid_alive(pid):
+                    _merge(total, data)
+                else:
+                    _merge(archive, data)
+                    archived.append(entry.path)
+
+            if archived:
+                tmp_path = archive_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(archive, f)
+                os.replace(tmp_path, archive_path)
+                for path in archived:
+                    os.remove(path)
+            _merge(total, archive)
+        return total
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        total = self.collect()
+        by_name = {}
+        for key, value in total['counters'].items():
+            name, labels = _split_key(key)
+            by_name.setdefault(name, ('counter', []))[1].append((labels, value))
+        for key, hist in total['histograms'].items():
+            name, labels = _split_key(key)
+            by_name.setdefault(name, ('histogram', []))[1].append((labels, hist))
+
+        lines = []
+        for name in sorted(by_name):
+            kind, series = by_name[name]
+            help_text = self.help.get(name, (kind, ''))[1]
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(series, key=lambda s: _key('', s[0])):
+                if kind == 'counter':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value['le'], value['buckets']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, {'le': _format_value(bound)})} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {value['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+        return '\n'.join(lines) + '\n'
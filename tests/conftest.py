@@ -0,0 +1,75 @@
+import datetime
+import io
+import os
+import sys
+
+import pytest
+from PIL import Image
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope='session')
+def filebox(tmp_path_factory):
+    """The app module, set up in a scratch directory (it reads config.txt from the working directory)"""
+    root = tmp_path_factory.mktemp('filebox')
+    (root / 'config.txt').write_text(
+        f"UPLOAD_FOLDER={root / 'uploads'}\nMETRICS_DIR={root / 'metrics'}\n"
+        "THUMBNAIL_WORKERS=0\nFOLDER_WATCHER=off\n"
+    )
+    (root / 'user_credentials.txt').write_text(
+        'test:' + generate_password_hash('secret', method='pbkdf2:sha256') + '\n'
+    )
+    cwd = os.getcwd()
+    os.chdir(root)
+    import app
+    app.app.config['TESTING'] = True
+    yield app
+    os.chdir(cwd)
+
+@pytest.fixture
+def upload_folder(filebox):
+    with filebox.app.app_context():
+        return filebox.get_current_upload_folder()
+
+@pytest.fixture
+def client(filebox):
+    client = filebox.app.test_client()
+    assert client.post('/login', data={'username': 'test', 'password': 'secret'}).status_code == 302
+    return client
+
+@pytest.fixture
+def save_image(filebox, upload_folder):
+    """Write an image straight into the upload folder and index it"""
+    def save(name, size=(1200, 900), mtime=None):
+        path = os.path.join(upload_folder, name)
+        Image.new('RGB', size, (200, 10, 10)).save(path)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        filebox.reconcile_index(upload_folder)
+        return path
+    return save
+
+@pytest.fixture
+def indexed_folder(filebox, tmp_path):
+    """A separate upload folder with small files at the given {name: mtime}, indexed"""
+    def build(files):
+        folder = str(tmp_path / 'folder')
+        os.makedirs(folder, exist_ok=True)
+        for name, mtime in files.items():
+            path = os.path.join(folder, name)
+            with open(path, 'wb') as f:
+                f.write(name.encode('utf-8'))
+            os.utime(path, (mtime, mtime))
+        filebox.reconcile_index(folder)
+        return folder, filebox.get_index_db(folder)
+    return build
+
+def timestamp(day, hour=12):
+    """Local timestamp on a YYYY-MM-DD day, which the index dates files without a date by"""
+    return datetime.datetime.fromisoformat(f'{day} {hour:02d}:00').timestamp()
+
+def jpeg_bytes(size=(640, 480)):
+    data = io.BytesIO()
+    Image.new('RGB', size, (10, 200, 10)).save(data, 'JPEG')
+    return data.getvalue()
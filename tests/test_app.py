@@ -0,0 +1,108 @@
+import io
+import os
+
+from PIL import Image
+
+from conftest import jpeg_bytes
+
+def test_evicted_rendition_is_rendered_again(filebox, client, upload_folder, save_image):
+    save_image('evicted.png', size=(3000, 2000))
+    assert client.get('/thumbs/evicted.png').status_code == 200
+    grid_path = filebox.get_thumbnail_path(upload_folder, 'evicted.png', 'grid')
+    os.remove(grid_path)
+
+    assert client.get('/thumbs/evicted.png?size=grid').status_code == 200
+    assert os.path.exists(grid_path)
+
+    os.remove(grid_path)
+    assert client.get('/uploads/evicted.png?size=grid').status_code == 200
+
+def test_failed_inline_render_is_not_retried(filebox, client, upload_folder, monkeypatch):
+    with open(os.path.join(upload_folder, 'corrupt.jpg'), 'wb') as f:
+        f.write(b'not an image')
+    filebox.reconcile_index(upload_folder)
+    renders = []
+    render_renditions = filebox.render_renditions
+    monkeypatch.setattr(filebox, 'render_renditions', lambda *args: renders.append(args) or render_renditions(*args))
+
+    client.get('/thumbs/corrupt.jpg?size=grid')
+    client.get('/thumbs/corrupt.jpg?size=grid')
+    assert client.get('/uploads/corrupt.jpg?size=grid').status_code == 200
+    assert len(renders) == 1
+    assert filebox.get_thumbnail_job_status(upload_folder, 'corrupt.jpg') == 'failed'
+
+def test_renditions_follow_exif_orientation(filebox, upload_folder):
+    image = Image.new('RGB', (3000, 2000))
+    exif = image.getexif()
+    exif[0x0112] = 6  # rotated 90° clockwise
+    image.save(os.path.join(upload_folder, 'portrait.jpg'), exif=exif.tobytes())
+    filebox.reconcile_index(upload_folder)
+
+    with filebox.app.app_context():
+        rendition = filebox.get_rendition(upload_folder, 'portrait.jpg', 'screen')
+    with Image.open(rendition) as img:
+        assert img.size == (1365, 2048)
+
+def test_sprite_sheet_survives_missing_tile(filebox, upload_folder, save_image, monkeypatch):
+    for i in range(3):
+        save_image(f'sprite{i}.jpg', size=(400, 300), mtime=1700000000 + i)
+    date = filebox.get_index_db(upload_folder).execute(
+        "SELECT date FROM files WHERE name = 'sprite0.jpg'"
+    ).fetchone()['date']
+    files = filebox.get_sprite_files([dict(row) for row in filebox.get_index_db(upload_folder).execute(
+        'SELECT name, mtime FROM files WHERE date = ? ORDER BY mtime DESC, name DESC', (date,)
+    )])
+    key = filebox.get_sprite_key(files)
+    get_rendition = filebox.get_rendition
+
+    def evicted_meanwhile(folder, filename, size):
+        path = get_rendition(folder, filename, size)
+        if filename == 'sprite1.jpg':
+            os.remove(path)
+        return path
+
+    monkeypatch.setattr(filebox, 'get_rendition', evicted_meanwhile)
+    with filebox.app.app_context():
+        filebox.build_sprite_sheets(upload_folder, date, key, files)
+    assert os.path.exists(filebox.get_sprite_path(upload_folder, date, key, 0))
+
+def test_upload_session_rejects_invalid_sha256(client):
+    for sha256 in (123, ['0' * 64], 'abc', 'g' * 64):
+        response = client.post('/upload/sessions', json={'filename': 'a.txt', 'size': 3, 'sha256': sha256})
+        assert response.status_code == 400
+    response = client.post('/upload/sessions', json={'filename': 'a.txt', 'size': 3, 'sha256': 'A' * 64})
+    assert response.status_code == 201
+
+def test_anonymous_upload_is_refused_before_admission(filebox, upload_folder, monkeypatch):
+    monkeypatch.setitem(filebox.app.config, 'UPLOAD_MAX_CONCURRENT', 1)
+    steps = []
+    monkeypatch.setattr(filebox, 'admission_step', lambda *args: steps.append(args))
+
+    anonymous = filebox.app.test_client()
+    response = anonymous.post('/upload', data={'files': [(io.BytesIO(b'data'), 'anonymous.txt')]},
+                              content_type='multipart/form-data')
+    assert response.status_code == 302  # to the login page
+    response = anonymous.put('/upload/sessions/0123/chunks/0', data=b'data')
+    assert response.status_code == 302
+    assert steps == []
+    assert not os.path.exists(os.path.join(upload_folder, 'anonymous.txt'))
+    assert filebox.get_index_db(upload_folder).execute('SELECT COUNT(*) FROM upload_admissions').fetchone()[0] == 0
+
+def test_reconcile_keeps_claimed_name(filebox, client, upload_folder):
+    spool = os.path.join(filebox.get_incoming_dir(upload_folder), 'claim.part')
+    with open(spool, 'wb') as f:
+        f.write(b'data')
+    with filebox.app.app_context():
+        name, _relpath = filebox.claim_upload_name(upload_folder, 'claimed.txt', spool, None)
+
+    filebox.reconcile_index(upload_folder)
+    assert filebox.is_name_taken(upload_folder, name)
+
+def test_upload_names_do_not_collide(client):
+    saved = []
+    for _ in range(3):
+        response = client.post('/upload', data={'files': [(io.BytesIO(jpeg_bytes()), 'same.jpg')]},
+                               headers={'X-Requested-With': 'XMLHttpRequest'}, content_type='multipart/form-data')
+        assert response.status_code == 200
+        saved.append(response.get_json()['files'][0]['saved_as'])
+    assert saved == ['same.jpg', 'same_1.jpg', 'same_2.jpg']
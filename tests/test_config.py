@@ -0,0 +1,42 @@
+import os
+import signal
+import time
+
+import pytest
+
+@pytest.fixture
+def config_loads(filebox, monkeypatch):
+    """Count load_config() calls, with the cached config fresh for this test"""
+    loads = []
+    load_config = filebox.load_config
+    monkeypatch.setattr(filebox, 'load_config', lambda: loads.append(1) or load_config())
+    filebox.get_config()
+    monkeypatch.setitem(filebox._config_cache, 'checked_at', time.monotonic())
+    return loads
+
+def test_config_is_not_reparsed_within_check_interval(filebox, config_loads):
+    for _ in range(5):
+        filebox.get_config()
+    assert config_loads == []
+
+def test_sighup_forces_config_reload(filebox, config_loads):
+    os.kill(os.getpid(), signal.SIGHUP)
+    filebox.get_config()
+    assert config_loads == [1]
+    filebox.get_config()
+    assert config_loads == [1]
+
+def test_changed_config_file_is_reloaded(filebox, config_loads):
+    original = open(filebox.CONFIG_FILE).read()
+    try:
+        with open(filebox.CONFIG_FILE, 'a') as f:
+            f.write('SLOW_REQUEST_MS=250\n')
+        os.utime(filebox.CONFIG_FILE, ns=(0, filebox._config_cache['mtime'] + 1))
+        filebox._config_cache['checked_at'] = 0.0
+        assert filebox.get_config()['SLOW_REQUEST_MS'] == 250
+        assert config_loads == [1]
+    finally:
+        with open(filebox.CONFIG_FILE, 'w') as f:
+            f.write(original)
+        filebox.request_config_reload()
+        assert filebox.get_config()['SLOW_REQUEST_MS'] == 0
@@ -0,0 +1,56 @@
+import os
+
+from werkzeug.security import generate_password_hash
+
+from credentials import CredentialStore, parse_credentials
+
+def write_credentials(path, users):
+    with open(path, 'w') as f:
+        f.write('# username:password_hash\n')
+        for username, password in users.items():
+            f.write(f"{username}:{generate_password_hash(password, method='pbkdf2:sha256')}\n")
+
+def test_parse_credentials_skips_comments_and_malformed_lines(tmp_path):
+    path = tmp_path / 'user_credentials.txt'
+    path.write_text('# comment\n\nalice:pbkdf2:sha256:abc\nbroken\nbob:hash\n')
+    assert parse_credentials(path) == {'alice': 'pbkdf2:sha256:abc', 'bob': 'hash'}
+
+def test_credentials_are_cached_until_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / 'user_credentials.txt'
+    write_credentials(path, {'alice': 'a'})
+    store = CredentialStore(str(path))
+    parses = []
+    monkeypatch.setattr('credentials.parse_credentials', lambda p: parses.append(p) or parse_credentials(p))
+
+    users = store.get_users()
+    assert list(users) == ['alice']
+    assert store.get_users() is users
+    assert len(parses) == 1
+
+    write_credentials(path, {'alice': 'a', 'bob': 'b'})
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert list(store.get_users()) == ['alice', 'bob']
+    assert len(parses) == 2
+
+    store.invalidate()
+    store.get_users()
+    assert len(parses) == 3
+
+def test_missing_credentials_file_means_no_users(tmp_path):
+    store = CredentialStore(str(tmp_path / 'missing.txt'))
+    assert store.get_users() == {}
+
+def test_removed_user_can_no_longer_log_in(filebox, client):
+    path = filebox.app.config['USER_CREDENTIALS_FILE']
+    original = open(path).read()
+    try:
+        write_credentials(path, {'other': 'pw'})
+        filebox.credential_store.invalidate()
+        assert filebox.load_user('test') is None
+        assert client.get('/api/files').status_code in (302, 401)
+    finally:
+        with open(path, 'w') as f:
+            f.write(original)
+        filebox.credential_store.invalidate()
+    assert filebox.load_user('test') is not None
@@ -0,0 +1,70 @@
+import datetime
+import os
+
+import pytest
+from PIL import Image
+
+def save_with_exif(path, tags, exif_tags=None, endian='<'):
+    image = Image.new('RGB', (64, 48), (120, 80, 40))
+    exif = Image.Exif()
+    exif.endian = endian
+    for tag, value in tags.items():
+        exif[tag] = value
+    if exif_tags:
+        exif[0x8769] = exif_tags
+    image.save(path, exif=exif.tobytes())
+
+DATE_CASES = {
+    'original': ({0x0132: '2020:01:02 03:04:05'}, {0x9003: '2019:05:06 07:08:09'}, datetime.date(2019, 5, 6)),
+    'datetime_only': ({0x0132: '2018:11:12 13:14:15'}, None, datetime.date(2018, 11, 12)),
+    'digitized_only': ({}, {0x9004: '2017:03:04 05:06:07'}, datetime.date(2017, 3, 4)),
+    'invalid_original': ({0x0132: '2016:07:08 09:10:11'}, {0x9003: 'not a date'}, datetime.date(2016, 7, 8)),
+    'no_dates': ({0x010F: 'Camera'}, None, None),
+}
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+@pytest.mark.parametrize('case', sorted(DATE_CASES))
+def test_fast_exif_date_matches_pillow(filebox, tmp_path, case, endian):
+    tags, exif_tags, expected = DATE_CASES[case]
+    path = str(tmp_path / f'{case}.jpg')
+    save_with_exif(path, tags, exif_tags, endian=endian)
+    assert filebox.extract_date_fast(path) == filebox.extract_date_with_pillow(path) == expected
+
+@pytest.mark.parametrize('endian', ['<', '>'])
+@pytest.mark.parametrize('case', sorted(DATE_CASES))
+def test_fast_exif_date_of_tiff(filebox, tmp_path, case, endian):
+    tags, exif_tags, expected = DATE_CASES[case]
+    path = str(tmp_path / f'{case}.tif')
+    save_with_exif(path, tags, exif_tags, endian=endian)
+    assert filebox.extract_date_fast(path) == expected
+
+def test_fast_exif_date_without_exif_block(filebox, tmp_path):
+    path = str(tmp_path / 'plain.jpg')
+    Image.new('RGB', (64, 48)).save(path)
+    assert filebox.extract_date_fast(path) is None
+
+def test_unreadable_header_falls_back_to_pillow(filebox, tmp_path, monkeypatch):
+    path = str(tmp_path / 'fallback.jpg')
+    save_with_exif(path, {0x0132: '2015:01:01 00:00:00'})
+
+    def unreadable(file_path):
+        raise ValueError('Bad JPEG marker')
+    monkeypatch.setattr(filebox, 'extract_date_fast', unreadable)
+    assert filebox.extract_date_from_metadata(path) == datetime.date(2015, 1, 1)
+
+def test_resolved_date_is_cached_until_the_file_changes(filebox, tmp_path, monkeypatch):
+    path = str(tmp_path / 'cached.jpg')
+    save_with_exif(path, {0x0132: '2014:02:03 04:05:06'})
+    reads = []
+    extract = filebox.extract_date_from_metadata
+    monkeypatch.setattr(filebox, 'extract_date_from_metadata', lambda p: reads.append(p) or extract(p))
+
+    assert filebox.resolve_file_date(path, 'cached.jpg') == datetime.date(2014, 2, 3)
+    assert filebox.resolve_file_date(path, 'cached.jpg') == datetime.date(2014, 2, 3)
+    assert len(reads) == 1
+
+    save_with_exif(path, {0x0132: '2013:02:03 04:05:06'})
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert filebox.resolve_file_date(path, 'cached.jpg') == datetime.date(2013, 2, 3)
+    assert len(reads) == 2
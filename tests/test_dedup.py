@@ -0,0 +1,65 @@
+import io
+import os
+
+import pytest
+
+from conftest import jpeg_bytes
+
+@pytest.fixture
+def dedup(filebox, monkeypatch):
+    monkeypatch.setitem(filebox.app.config, 'DEDUPLICATE_UPLOADS', True)
+
+def upload(client, name, data):
+    response = client.post('/upload', data={'files': [(io.BytesIO(data), name)]},
+                           headers={'X-Requested-With': 'XMLHttpRequest'}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    return response.get_json()['files'][0]
+
+def stored(filebox, upload_folder, name):
+    return os.stat(filebox.get_file_path(upload_folder, name))
+
+def test_same_content_is_stored_once(filebox, client, upload_folder, dedup):
+    data = jpeg_bytes((321, 123))
+    first = upload(client, 'dedup_first.jpg', data)
+    assert not first['deduplicated']
+    conn = filebox.get_index_db(upload_folder)
+    with conn:
+        conn.execute("UPDATE files SET phash = 1234 WHERE name = 'dedup_first.jpg'")
+
+    second = upload(client, 'dedup_second.jpg', data)
+    assert second['deduplicated'] and second['saved_as'] == 'dedup_second.jpg'
+    assert second['hash'] == first['hash']
+    first_st = stored(filebox, upload_folder, 'dedup_first.jpg')
+    assert stored(filebox, upload_folder, 'dedup_second.jpg').st_ino == first_st.st_ino
+    assert first_st.st_nlink == 2
+    # Renditions and image features come along with the content
+    for size in filebox.EAGER_RENDITIONS:
+        assert os.stat(filebox.get_thumbnail_path(upload_folder, 'dedup_second.jpg', size)).st_ino == \
+            os.stat(filebox.get_thumbnail_path(upload_folder, 'dedup_first.jpg', size)).st_ino
+    assert conn.execute("SELECT phash FROM files WHERE name = 'dedup_second.jpg'").fetchone()[0] == 1234
+
+def test_same_name_and_content_writes_nothing(filebox, client, upload_folder, dedup):
+    data = jpeg_bytes((322, 123))
+    upload(client, 'dedup_again.jpg', data)
+    again = upload(client, 'dedup_again.jpg', data)
+    assert again['deduplicated'] and again['saved_as'] == 'dedup_again.jpg'
+    assert stored(filebox, upload_folder, 'dedup_again.jpg').st_nlink == 1
+
+    other = upload(client, 'dedup_again.jpg', jpeg_bytes((323, 123)))
+    assert not other['deduplicated'] and other['saved_as'] == 'dedup_again_1.jpg'
+
+def test_copy_gone_from_disk_is_not_linked(filebox, client, upload_folder, dedup):
+    data = jpeg_bytes((324, 123))
+    upload(client, 'dedup_gone.jpg', data)
+    os.remove(filebox.get_file_path(upload_folder, 'dedup_gone.jpg'))
+    result = upload(client, 'dedup_replacement.jpg', data)
+    assert not result['deduplicated']
+    assert stored(filebox, upload_folder, 'dedup_replacement.jpg').st_nlink == 1
+
+def test_without_deduplication_copies_are_separate(filebox, client, upload_folder):
+    data = jpeg_bytes((325, 123))
+    upload(client, 'dedup_off_a.jpg', data)
+    result = upload(client, 'dedup_off_b.jpg', data)
+    assert not result['deduplicated']
+    assert stored(filebox, upload_folder, 'dedup_off_a.jpg').st_ino != \
+        stored(filebox, upload_folder, 'dedup_off_b.jpg').st_ino
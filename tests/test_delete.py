@@ -0,0 +1,96 @@
+import os
+
+def wait_for_purge(filebox, upload_folder):
+    thread = filebox._trash_purge_threads.get(upload_folder)
+    if thread is not None:
+        thread.join(10)
+
+def trash_batches(filebox, upload_folder):
+    return [entry.name for entry in os.scandir(filebox.get_trash_dir(upload_folder)) if entry.is_dir()]
+
+def test_batch_delete_trashes_and_purges(filebox, client, upload_folder, save_image):
+    for name in ('del_a.png', 'del_b.png'):
+        save_image(name, size=(400, 300))
+        assert client.get(f'/thumbs/{name}').status_code == 200
+        filebox.enqueue_thumbnail(upload_folder, name)
+    renditions = [path for name in ('del_a.png', 'del_b.png')
+                  for path in filebox.get_rendition_paths(upload_folder, name) if os.path.exists(path)]
+    assert renditions
+
+    response = client.post('/delete', json={'files': [
+        'del_a.png', 'del_b.png', 'del_a.png', 'del_missing.png', '../config.txt', '.filebox_index.sqlite3'
+    ]})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result['deleted'] == ['del_a.png', 'del_b.png']
+    assert result['missing'] == ['del_missing.png', '../config.txt', '.filebox_index.sqlite3']
+    conn = filebox.get_index_db(upload_folder)
+    assert conn.execute("SELECT COUNT(*) FROM files WHERE name LIKE 'del\\_%' ESCAPE '\\'").fetchone()[0] == 0
+    assert not os.path.exists(os.path.join(upload_folder, 'del_a.png'))
+    assert os.path.exists(os.path.join(upload_folder, filebox.INDEX_DB_NAME))
+
+    wait_for_purge(filebox, upload_folder)
+    assert trash_batches(filebox, upload_folder) == []
+    assert not any(os.path.exists(path) for path in renditions)
+    assert conn.execute("SELECT COUNT(*) FROM thumbnail_jobs WHERE name IN ('del_a.png', 'del_b.png')").fetchone()[0] == 0
+
+def test_batch_delete_as_form_fields(filebox, client, upload_folder, save_image):
+    save_image('del_form.png', size=(40, 30))
+    response = client.post('/delete', data={'files': ['del_form.png']})
+    assert response.get_json()['deleted'] == ['del_form.png']
+    wait_for_purge(filebox, upload_folder)
+
+def test_batch_delete_rejects_bad_requests(client):
+    assert client.post('/delete', json={'files': 'del_a.png'}).status_code == 400
+    assert client.post('/delete', json=['del_a.png']).status_code == 400
+    assert client.post('/delete', json={'files': [1]}).status_code == 400
+    assert client.post('/delete', json={'files': []}).status_code == 400
+
+def test_single_delete_redirects(filebox, client, upload_folder, save_image):
+    save_image('del_single.png', size=(40, 30))
+    response = client.get('/delete/del_single.png')
+    assert response.status_code == 302
+    assert not filebox.is_name_taken(upload_folder, 'del_single.png')
+    assert client.get('/delete/del_single.png').status_code == 302
+    wait_for_purge(filebox, upload_folder)
+
+def test_purge_keeps_renditions_of_a_name_taken_again(filebox, client, upload_folder, save_image):
+    save_image('del_again.png', size=(400, 300))
+    assert client.get('/thumbs/del_again.png').status_code == 200
+    trashed, missing = filebox.move_to_trash(upload_folder, ['del_again.png'])
+    assert trashed == ['del_again.png']
+    save_image('del_again.png', size=(400, 300))
+    rendition = filebox.get_thumbnail_path(upload_folder, 'del_again.png')
+    assert os.path.exists(rendition)
+
+    wait_for_purge(filebox, upload_folder)
+    assert filebox.purge_trash(upload_folder) == 1
+    assert os.path.exists(rendition)
+    assert os.path.exists(os.path.join(upload_folder, 'del_again.png'))
+
+def test_only_one_purge_at_a_time(filebox, upload_folder, save_image):
+    save_image('del_locked.png', size=(40, 30))
+    filebox.move_to_trash(upload_folder, ['del_locked.png'])
+    wait_for_purge(filebox, upload_folder)
+    lock_file = filebox.try_lock_file(os.path.join(filebox.get_trash_dir(upload_folder), filebox.TRASH_PURGE_LOCK))
+    try:
+        assert filebox.purge_trash(upload_folder) == 0
+        assert len(trash_batches(filebox, upload_folder)) == 1
+    finally:
+        lock_file.close()
+    assert filebox.purge_trash(upload_folder) == 1
+
+def test_purge_skips_batches_being_filled(filebox, upload_folder):
+    wait_for_purge(filebox, upload_folder)
+    trash_dir = filebox.get_trash_dir(upload_folder)
+    filling = os.path.join(trash_dir, '.123-filling')
+    os.mkdir(filling)
+    with open(os.path.join(filling, 'del_filling.txt'), 'w') as f:
+        f.write('x')
+    assert filebox.purge_trash(upload_folder) == 0
+    assert os.path.exists(os.path.join(filling, 'del_filling.txt'))
+
+    # Left behind by a crash
+    os.utime(filling, (0, 0))
+    assert filebox.purge_trash(upload_folder) == 1
+    assert not os.path.exists(filling)
@@ -0,0 +1,137 @@
+import random
+
+import pytest
+
+import duplicates
+from duplicates import DuplicateIndex
+
+def reference_clusters(entries, max_distance):
+    """Connected components of names within max_distance bits, compared pair by pair"""
+    names = sorted(entries)
+    parent = {name: name for name in names}
+
+    def find(name):
+        while parent[name] != name:
+            name = parent[name]
+        return name
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            if bin((entries[a] ^ entries[b]) & duplicates.HASH_MASK).count('1') <= max_distance:
+                parent[find(b)] = find(a)
+    groups = {}
+    for name in names:
+        groups.setdefault(find(name), []).append(name)
+    clusters = [group for group in groups.values() if len(group) > 1]
+    clusters.sort(key=lambda group: (-len(group), group[0]))
+    return clusters
+
+def flip_bits(value, count, rng):
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+def random_entries(rng, count, prefix='img'):
+    """Random signed 64-bit hashes (as SQLite stores them), a third of them near copies of others"""
+    entries = {}
+    for i in range(count):
+        if entries and i % 3 == 0:
+            value = flip_bits(rng.choice(list(entries.values())) & duplicates.HASH_MASK, rng.randint(0, 9), rng)
+        else:
+            value = rng.getrandbits(64)
+        entries[f'{prefix}{i}.jpg'] = value - (1 << 64) if value >> 63 else value
+    return entries
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy' and duplicates.np is None:
+        pytest.skip('NumPy is not installed')
+    if request.param == 'python':
+        monkeypatch.setattr(duplicates, 'np', None)
+    return request.param
+
+@pytest.mark.parametrize('max_distance', [0, 3, 6, 12])
+def test_clusters_match_pairwise_comparison(backend, max_distance):
+    entries = random_entries(random.Random(max_distance), 400)
+    index = DuplicateIndex(max_distance)
+    assert index.update(entries)
+    assert index.clusters() == reference_clusters(entries, max_distance)
+
+def test_incremental_adds(backend):
+    rng = random.Random(1)
+    entries = random_entries(rng, 300)
+    index = DuplicateIndex(6)
+    index.update(entries)
+    for batch in range(3):
+        entries.update(random_entries(rng, 50, prefix=f'new{batch}_'))
+        assert index.update(entries) is False
+        assert index.clusters() == reference_clusters(entries, 6)
+
+def test_many_new_hashes_rebuild(backend, monkeypatch):
+    monkeypatch.setattr(duplicates, 'INCREMENTAL_MAX_NEW', 10)
+    rng = random.Random(2)
+    entries = random_entries(rng, 100)
+    index = DuplicateIndex(6)
+    index.update(entries)
+    entries.update(random_entries(rng, 11, prefix='batch'))
+    assert index.update(entries) is True
+    assert index.clusters() == reference_clusters(entries, 6)
+
+def test_removing_a_bridge_splits_the_cluster(backend):
+    # a and c are 8 bits apart, b is within 4 bits of both
+    entries = {'a.jpg': 0, 'b.jpg': 0x0F, 'c.jpg': 0xFF, 'far.jpg': 0xFFFF0000}
+    index = DuplicateIndex(4)
+    index.update(entries)
+    assert index.clusters() == [['a.jpg', 'b.jpg', 'c.jpg']]
+
+    del entries['b.jpg']
+    assert index.update(entries) is True
+    assert index.clusters() == []
+
+def test_names_sharing_a_hash(backend):
+    entries = {'a.jpg': 42, 'a_copy.jpg': 42, 'other.jpg': 0xFFFF << 40}
+    index = DuplicateIndex(0)
+    index.update(entries)
+    assert index.clusters() == [['a.jpg', 'a_copy.jpg']]
+
+    # One copy left: the hash keeps a name, so nothing has to be rebuilt
+    del entries['a_copy.jpg']
+    assert index.update(entries) is False
+    assert index.clusters() == []
+
+def test_changed_hash_moves_the_name(backend):
+    far = 0xFFFF << 40
+    entries = {'a.jpg': 0, 'b.jpg': 1, 'c.jpg': far}
+    index = DuplicateIndex(2)
+    index.update(entries)
+    assert index.clusters() == [['a.jpg', 'b.jpg']]
+    entries['b.jpg'] = far | 1
+    index.update(entries)
+    assert index.clusters() == [['b.jpg', 'c.jpg']]
+
+def test_duplicate_clusters_reload_only_after_changes(filebox, indexed_folder, monkeypatch):
+    folder, conn = indexed_folder({f'dup{i}.jpg': 1700000000 + i for i in range(4)})
+    with conn:
+        conn.executemany('UPDATE files SET phash = ? WHERE name = ?',
+                         [(0, 'dup0.jpg'), (1, 'dup1.jpg'), (0xFFFF << 40, 'dup2.jpg')])
+    updates = []
+    update = DuplicateIndex.update
+    monkeypatch.setattr(DuplicateIndex, 'update', lambda self, entries: updates.append(entries) or update(self, entries))
+
+    clusters, hashed, pending = filebox.find_duplicate_clusters(folder, 2)
+    assert [[row['name'] for row in cluster] for cluster in clusters] == [['dup0.jpg', 'dup1.jpg']]
+    assert (hashed, pending) == (3, 1)
+    filebox.find_duplicate_clusters(folder, 2)
+    assert len(updates) == 1
+
+    with conn:
+        conn.execute("UPDATE files SET phash = 3 WHERE name = 'dup3.jpg'")
+    clusters, hashed, pending = filebox.find_duplicate_clusters(folder, 2)
+    assert [[row['name'] for row in cluster] for cluster in clusters] == [['dup0.jpg', 'dup1.jpg', 'dup3.jpg']]
+    assert (hashed, pending) == (4, 0)
+    assert len(updates) == 2
+
+    with conn:
+        conn.execute("DELETE FROM files WHERE name = 'dup1.jpg'")
+    clusters, hashed, pending = filebox.find_duplicate_clusters(folder, 2)
+    assert [[row['name'] for row in cluster] for cluster in clusters] == [['dup0.jpg', 'dup3.jpg']]
+    assert len(updates) == 3
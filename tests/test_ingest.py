@@ -0,0 +1,92 @@
+import os
+import sys
+
+import pytest
+
+from conftest import jpeg_bytes
+
+@pytest.fixture
+def source_tree(tmp_path):
+    """An archive to import: photos in nested folders, a repeated photo and files to skip"""
+    root = tmp_path / 'archive'
+    (root / 'DCIM' / '100').mkdir(parents=True)
+    (root / 'DCIM' / '101').mkdir(parents=True)
+    (root / '.thumbnails').mkdir()
+    (root / 'DCIM' / '100' / 'IMG_20200101_1.jpg').write_bytes(jpeg_bytes((300, 200)))
+    (root / 'DCIM' / '100' / 'photo.jpg').write_bytes(jpeg_bytes((301, 200)))
+    (root / 'DCIM' / '101' / 'photo.jpg').write_bytes(jpeg_bytes((302, 200)))
+    (root / 'DCIM' / '101' / 'IMG_20200101_1.jpg').write_bytes(jpeg_bytes((300, 200)))
+    (root / 'notes.txt').write_text('notes')
+    (root / 'setup.exe').write_bytes(b'MZ')
+    (root / '.hidden.jpg').write_bytes(jpeg_bytes((303, 200)))
+    (root / '.thumbnails' / 'thumb.jpg').write_bytes(jpeg_bytes((304, 200)))
+    return root
+
+@pytest.fixture
+def ingest(filebox, tmp_path, monkeypatch):
+    """Run the import tool into a separate, empty upload folder"""
+    import tool_ingest  # after filebox: importing app reads config.txt
+    folder = str(tmp_path / 'uploads')
+    os.makedirs(folder)
+    monkeypatch.setattr(tool_ingest, 'get_current_upload_folder', lambda: folder)
+
+    def run(*args):
+        monkeypatch.setattr(sys, 'argv', ['tool_ingest.py', *map(str, args), '--workers', '1'])
+        tool_ingest.main()
+        return folder, filebox.get_index_db(folder)
+    return run
+
+def stored_names(conn):
+    return sorted(row[0] for row in conn.execute('SELECT name FROM files'))
+
+def test_import_tree(filebox, source_tree, ingest, capsys):
+    folder, conn = ingest(source_tree)
+    assert stored_names(conn) == ['IMG_20200101_1.jpg', 'notes.txt', 'photo.jpg', 'photo_1.jpg']
+    assert '1 of a type not allowed' in capsys.readouterr().out
+    with open(filebox.get_file_path(folder, 'photo_1.jpg'), 'rb') as f:
+        assert f.read() == (source_tree / 'DCIM' / '101' / 'photo.jpg').read_bytes()
+    row = conn.execute("SELECT date, hash, phash FROM files WHERE name = 'IMG_20200101_1.jpg'").fetchone()
+    assert row['date'] == '2020-01-01' and row['hash'] and row['phash'] is not None
+    assert os.path.exists(filebox.get_thumbnail_path(folder, 'photo.jpg', 'grid'))
+    # Copies, not links
+    assert os.stat(filebox.get_file_path(folder, 'photo.jpg')).st_nlink == 1
+    assert conn.execute('SELECT COUNT(*) FROM ingest_checkpoints').fetchone()[0] == 5
+
+def test_second_run_only_picks_up_new_files(filebox, source_tree, ingest, capsys):
+    ingest(source_tree)
+    capsys.readouterr()
+    folder, conn = ingest(source_tree)
+    assert '0 files to import, 5 already imported' in capsys.readouterr().out
+
+    (source_tree / 'later.jpg').write_bytes(jpeg_bytes((305, 200)))
+    folder, conn = ingest(source_tree)
+    assert '1 files to import, 5 already imported' in capsys.readouterr().out
+    assert 'later.jpg' in stored_names(conn)
+
+def test_interrupted_import_does_not_store_twice(filebox, source_tree, ingest):
+    folder, conn = ingest(source_tree)
+    # As if killed after storing the files but before their checkpoints and thumbnails
+    with conn:
+        conn.execute('DELETE FROM ingest_checkpoints')
+        conn.execute('UPDATE files SET phash = NULL')
+    for name in stored_names(conn):
+        for path in filebox.get_rendition_paths(folder, name):
+            if os.path.exists(path):
+                os.remove(path)
+    folder, conn = ingest(source_tree)
+    assert stored_names(conn) == ['IMG_20200101_1.jpg', 'notes.txt', 'photo.jpg', 'photo_1.jpg']
+    assert conn.execute('SELECT COUNT(*) FROM files WHERE phash IS NULL AND ext = ?', ('jpg',)).fetchone()[0] == 0
+
+def test_import_with_links(filebox, source_tree, ingest):
+    folder, conn = ingest(source_tree, '--link')
+    assert os.stat(filebox.get_file_path(folder, 'photo.jpg')).st_ino == \
+        os.stat(source_tree / 'DCIM' / '100' / 'photo.jpg').st_ino
+
+def test_dry_run_stores_nothing(source_tree, ingest, capsys):
+    folder, conn = ingest(source_tree, '--dry-run')
+    assert stored_names(conn) == []
+    assert '5 files to import' in capsys.readouterr().out
+
+def test_refuses_overlapping_folders(ingest, tmp_path):
+    with pytest.raises(SystemExit):
+        ingest(tmp_path)
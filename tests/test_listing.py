@@ -0,0 +1,70 @@
+import pytest
+
+from conftest import timestamp
+
+FILES = {
+    'a.txt': timestamp('2024-03-01', 9),
+    'b.txt': timestamp('2024-03-01', 9),  # same mtime as a.txt: ordered by name
+    'c.txt': timestamp('2024-03-01', 15),
+    'd.txt': timestamp('2024-02-10'),
+    'e.pdf': timestamp('2024-02-10', 8),
+    'f.txt': timestamp('2023-12-31'),
+    'g.txt': timestamp('2023-12-31', 18),
+}
+GALLERY_ORDER = ['c.txt', 'b.txt', 'a.txt', 'd.txt', 'e.pdf', 'g.txt', 'f.txt']
+
+def collect_pages(filebox, conn, limit, filters=(), params=()):
+    names = []
+    cursor = None
+    while True:
+        page = filebox.query_file_page(conn, list(filters), list(params), limit, cursor)
+        assert len(page['files']) <= limit
+        names.extend(file['name'] for file in page['files'])
+        for file in page['files']:
+            assert page['counts'][file['date']] >= 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            return names
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7, 100])
+def test_cursor_pages_cover_every_file_once(filebox, indexed_folder, limit):
+    folder, conn = indexed_folder(FILES)
+    assert collect_pages(filebox, conn, limit) == GALLERY_ORDER
+
+def test_page_counts_are_for_the_whole_date_group(filebox, indexed_folder):
+    folder, conn = indexed_folder(FILES)
+    page = filebox.query_file_page(conn, [], [], 2)
+    assert [file['name'] for file in page['files']] == ['c.txt', 'b.txt']
+    assert page['counts'] == {'2024-03-01': 3}
+
+def test_filtered_pages(filebox, indexed_folder):
+    folder, conn = indexed_folder(FILES)
+    filters, params = filebox.parse_file_filters({'type': 'document', 'ext': '.TXT', 'date_from': '2024-01-01'})
+    assert collect_pages(filebox, conn, 2, filters, params) == ['c.txt', 'b.txt', 'a.txt', 'd.txt']
+    with pytest.raises(ValueError):
+        filebox.parse_file_filters({'date_to': '2024-13-01'})
+
+def test_cursor_round_trip(filebox):
+    cursor = filebox.encode_file_cursor('2024-03-01', 1709280000.5, 'ä b.txt')
+    assert filebox.decode_file_cursor(cursor) == ('2024-03-01', 1709280000.5, 'ä b.txt')
+    for bad in ('!!', 'bm90IGpzb24', filebox.encode_file_cursor('2024-03-01', 'x', 'a')):
+        with pytest.raises(ValueError):
+            filebox.decode_file_cursor(bad)
+
+def test_files_api_pages(filebox, client, upload_folder, save_image):
+    for i in range(5):
+        save_image(f'listed{i}.png', size=(40, 30), mtime=timestamp('2022-05-0' + str(i + 1)))
+    expected = [row['name'] for row in filebox.get_index_db(upload_folder).execute(
+        'SELECT name FROM files ORDER BY date DESC, mtime DESC, name DESC'
+    )]
+    names = []
+    url = '/api/files?limit=2'
+    while url:
+        page = client.get(url).get_json()
+        names.extend(file['name'] for file in page['files'])
+        url = page['next_cursor'] and f"/api/files?limit=2&cursor={page['next_cursor']}"
+    assert names == expected
+
+def test_files_api_rejects_bad_input(client):
+    assert client.get('/api/files?cursor=!!').status_code == 400
+    assert client.get('/api/files?date_from=yesterday').status_code == 400
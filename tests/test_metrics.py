@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+
+import metrics as metrics_module
+from metrics import Metrics
+
+def dead_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+def write_worker_file(directory, pid, counters=None, histograms=None):
+    with open(os.path.join(directory, f'{pid}-abcd1234.json'), 'w') as f:
+        json.dump({'counters': counters or {}, 'histograms': histograms or {}}, f)
+
+def histogram(buckets, total):
+    return {'le': [0.1, 1.0], 'buckets': buckets, 'sum': total, 'count': sum(buckets)}
+
+def test_collect_adds_up_live_and_exited_workers(tmp_path):
+    directory = str(tmp_path)
+    recorder = Metrics(directory)
+    recorder.inc('requests_total', route='index')
+    recorder.observe('latency_seconds', 0.05, buckets=(0.1, 1.0), route='index')
+    key = 'requests_total{"route":"index"}'
+    latency_key = 'latency_seconds{"route":"index"}'
+    write_worker_file(directory, os.getppid(), {key: 2}, {latency_key: histogram([1, 1], 0.6)})
+    gone = dead_pid()
+    write_worker_file(directory, gone, {key: 4, 'uploads_total{}': 1}, {latency_key: histogram([0, 2], 1.5)})
+
+    total = recorder.collect()
+    assert total['counters'] == {key: 7, 'uploads_total{}': 1}
+    assert total['histograms'][latency_key]['buckets'] == [2, 3]
+    assert total['histograms'][latency_key]['count'] == 5
+    assert abs(total['histograms'][latency_key]['sum'] - 2.15) < 1e-9
+
+    # The exited worker's file is folded into the archive once
+    assert not os.path.exists(os.path.join(directory, f'{gone}-abcd1234.json'))
+    assert os.path.exists(os.path.join(directory, metrics_module.ARCHIVE_FILE))
+    assert recorder.collect()['counters'] == {key: 7, 'uploads_total{}': 1}
+
+def test_unreadable_worker_files_are_skipped(tmp_path):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, f'{os.getppid()}-00000000.json'), 'w') as f:
+        f.write('{"counters": ')
+    recorder = Metrics(directory)
+    recorder.inc('requests_total')
+    assert recorder.collect()['counters'] == {'requests_total{}': 1}
+
+def test_forked_worker_starts_from_zero(tmp_path):
+    recorder = Metrics(str(tmp_path))
+    recorder.inc('requests_total')
+    recorder._pid = dead_pid()  # as if this were the parent's copy
+    recorder.inc('requests_total')
+    assert recorder._counters == {'requests_total{}': 1}
+
+def test_prometheus_rendering(tmp_path):
+    recorder = Metrics(str(tmp_path))
+    recorder.describe('latency_seconds', 'histogram', 'Request latency')
+    recorder.inc('requests_total', 3, route='a"b\\c')
+    for value in (0.05, 0.5, 5.0):
+        recorder.observe('latency_seconds', value, buckets=(0.1, 1.0))
+    lines = recorder.render_prometheus().splitlines()
+    assert lines == [
+        '# HELP latency_seconds Request latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        'latency_seconds_sum 5.55',
+        'latency_seconds_count 3',
+        '# TYPE requests_total counter',
+        'requests_total{route="a\\"b\\\\c"} 3',
+    ]
+
+def test_metrics_endpoint(filebox, client, monkeypatch):
+    client.get('/api/files')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'filebox_requests_total{method="GET",route="list_files_api",status="200"}' in response.get_data(as_text=True)
+
+    anonymous = filebox.app.test_client()
+    assert anonymous.get('/metrics').status_code in (302, 401)
+    monkeypatch.setitem(filebox.app.config, 'METRICS_TOKEN', 'scrape-token')
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code in (302, 401)
+    assert anonymous.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code == 200
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+from conftest import timestamp
+
+FILES = {'a.txt': timestamp('2021-01-02'), 'b.jpg': timestamp('2022-03-04'), 'c.pdf': timestamp('2023-05-06')}
+
+@pytest.fixture
+def migrate(filebox, indexed_folder, monkeypatch):
+    """Run the migration tool on a separate folder holding FILES, with a rendition per file"""
+    import tool_migrate_layout  # after filebox: importing app reads config.txt
+    folder, conn = indexed_folder(FILES)
+    for name in FILES:
+        path = filebox.get_thumbnail_path(folder, name, 'grid', layout='flat')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'rendition')
+    monkeypatch.setattr(tool_migrate_layout, 'get_current_upload_folder', lambda: folder)
+
+    def run(*args):
+        monkeypatch.setattr(sys, 'argv', ['tool_migrate_layout.py', *args])
+        tool_migrate_layout.main()
+        return folder, conn
+    run.move = tool_migrate_layout.move
+    return run
+
+def stored_paths(conn):
+    return dict(conn.execute('SELECT name, path FROM files').fetchall())
+
+@pytest.mark.parametrize('layout', ['hash', 'date'])
+def test_migrate_and_back(filebox, migrate, layout):
+    folder, conn = migrate(layout)
+    paths = stored_paths(conn)
+    for name, row in conn.execute('SELECT name, date FROM files').fetchall():
+        expected = filebox.get_storage_relpath(name, filebox.date_cls.fromisoformat(row), layout)
+        assert paths[name] == expected != name
+        with open(os.path.join(folder, expected), 'rb') as f:
+            assert f.read() == name.encode('utf-8')
+        assert os.path.exists(filebox.get_thumbnail_path(folder, name, 'grid', layout=layout))
+        assert not os.path.exists(filebox.get_thumbnail_path(folder, name, 'grid', layout='flat'))
+    assert filebox.reconcile_index(folder)['unchanged'] == len(FILES)
+
+    migrate('flat')
+    assert stored_paths(conn) == {name: name for name in FILES}
+    assert sorted(entry.name for entry in os.scandir(folder) if entry.is_file() and entry.name in FILES) == sorted(FILES)
+    assert not [entry.name for entry in os.scandir(folder) if entry.is_dir() and entry.name.isdigit()]
+
+def test_interrupted_migration_resumes(filebox, migrate):
+    folder, conn = migrate('--dry-run', 'hash')
+    assert stored_paths(conn) == {name: name for name in FILES}
+
+    # As if killed after moving a.txt, before its index entry was updated
+    migrate.move(folder, 'a.txt', filebox.get_storage_relpath('a.txt', layout='hash'))
+    migrate('hash')
+    assert stored_paths(conn) == {name: filebox.get_storage_relpath(name, layout='hash') for name in FILES}
+
+def test_refuses_to_run_next_to_filebox(filebox, migrate, indexed_folder):
+    folder, conn = indexed_folder({})
+    lock = filebox.try_lock_file(os.path.join(folder, filebox.WATCHER_LOCK_NAME))
+    try:
+        with pytest.raises(SystemExit):
+            migrate('hash')
+    finally:
+        lock.close()
+    assert stored_paths(conn) == {name: name for name in FILES}
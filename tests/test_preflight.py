@@ -0,0 +1,61 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from conftest import jpeg_bytes
+
+def upload(client, name, data):
+    response = client.post('/upload', data={'files': [(io.BytesIO(data), name)]},
+                           headers={'X-Requested-With': 'XMLHttpRequest'}, content_type='multipart/form-data')
+    return response.get_json()['files'][0]
+
+def preflight(client, *files):
+    response = client.post('/upload/preflight', json={'files': [
+        {'name': name, 'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()} for name, data in files
+    ]})
+    assert response.status_code == 200
+    return response.get_json()['files']
+
+def test_preflight_reports_stored_content(client):
+    data = jpeg_bytes((331, 123))
+    upload(client, 'preflight_stored.jpg', data)
+    results = preflight(client, ('preflight_stored.jpg', data), ('elsewhere.jpg', data),
+                        ('preflight_new.jpg', jpeg_bytes((332, 123))))
+    assert [result['status'] for result in results] == ['present', 'present', 'missing']
+    assert results[0]['saved_as'] == results[1]['saved_as'] == 'preflight_stored.jpg'
+    # Same hash but another size is not the same file
+    response = client.post('/upload/preflight', json={'files': [
+        {'name': 'x.jpg', 'size': len(data) + 1, 'sha256': hashlib.sha256(data).hexdigest()}
+    ]})
+    assert response.get_json()['files'][0]['status'] == 'missing'
+
+def test_preflight_links_with_deduplication(filebox, client, upload_folder, monkeypatch):
+    monkeypatch.setitem(filebox.app.config, 'DEDUPLICATE_UPLOADS', True)
+    data = jpeg_bytes((333, 123))
+    upload(client, 'preflight_original.jpg', data)
+    result, = preflight(client, ('preflight_linked.jpg', data))
+    assert result['status'] == 'linked' and result['saved_as'] == 'preflight_linked.jpg'
+    assert os.stat(filebox.get_file_path(upload_folder, 'preflight_linked.jpg')).st_ino == \
+        os.stat(filebox.get_file_path(upload_folder, 'preflight_original.jpg')).st_ino
+
+    os.remove(filebox.get_file_path(upload_folder, 'preflight_original.jpg'))
+    os.remove(filebox.get_file_path(upload_folder, 'preflight_linked.jpg'))
+    result, = preflight(client, ('preflight_relinked.jpg', data))
+    assert result['status'] == 'missing'
+
+@pytest.mark.parametrize('entry', [
+    {'name': 'bad.exe', 'size': 1, 'sha256': '0' * 64},
+    {'name': 'short.txt', 'size': 1, 'sha256': '0' * 63},
+    {'name': 'size.txt', 'size': '1', 'sha256': '0' * 64},
+    'not an object',
+])
+def test_invalid_entries_are_missing(client, entry):
+    response = client.post('/upload/preflight', json={'files': [entry]})
+    assert response.get_json()['files'][0]['status'] == 'missing'
+
+def test_preflight_rejects_bad_requests(filebox, client):
+    assert client.post('/upload/preflight', json={'files': 'x'}).status_code == 400
+    too_many = [{'name': 'a.txt', 'size': 1, 'sha256': '0' * 64}] * (filebox.PREFLIGHT_MAX_FILES + 1)
+    assert client.post('/upload/preflight', json={'files': too_many}).status_code == 400
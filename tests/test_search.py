@@ -0,0 +1,70 @@
+import pytest
+
+from conftest import timestamp
+
+FILES = {
+    'Holiday_Beach.JPG': timestamp('2021-07-14'),
+    'holiday-notes.txt': timestamp('2021-07-15'),
+    'beach.png': timestamp('2022-01-02'),
+    '100%_done.txt': timestamp('2020-05-05'),
+    'a_b.txt': timestamp('2020-05-06'),
+    'axb.txt': timestamp('2020-05-07'),
+    'report.pdf': timestamp('2019-11-11'),
+}
+
+@pytest.fixture(params=['trigram', 'like'])
+def search(request, filebox, indexed_folder, monkeypatch):
+    """Search the FILES folder, through the trigram index or the LIKE fallback"""
+    if request.param == 'trigram' and not filebox.SEARCH_TRIGRAM:
+        pytest.skip('SQLite without the FTS5 trigram tokenizer')
+    monkeypatch.setattr(filebox, 'SEARCH_TRIGRAM', request.param == 'trigram')
+    folder, conn = indexed_folder(FILES)
+
+    def run(**args):
+        filters, params = filebox.parse_search_filters(args)
+        page = filebox.query_file_page(conn, filters, params, 100)
+        return sorted(file['name'] for file in page['files'])
+    return run
+
+def test_search_is_a_case_insensitive_substring_match(search):
+    assert search(q='holiday') == ['Holiday_Beach.JPG', 'holiday-notes.txt']
+    assert search(q='BEACH') == ['Holiday_Beach.JPG', 'beach.png']
+    assert search(q='lida') == ['Holiday_Beach.JPG', 'holiday-notes.txt']
+    assert search(q='nothing like it') == []
+
+def test_short_queries(search):
+    assert search(q='ac') == ['Holiday_Beach.JPG', 'beach.png']
+
+def test_like_wildcards_are_literal(search):
+    assert search(q='_') == ['100%_done.txt', 'Holiday_Beach.JPG', 'a_b.txt']
+    assert search(q='%') == ['100%_done.txt']
+    assert search(q='a_b') == ['a_b.txt']
+    assert search(q='"quoted"') == []
+
+def test_search_filters(search):
+    assert search(q='holiday', ext='jpg') == ['Holiday_Beach.JPG']
+    assert search(q='holiday', ext='.JPG') == ['Holiday_Beach.JPG']
+    assert search(type='image') == ['Holiday_Beach.JPG', 'beach.png']
+    assert search(q='.txt', date_from='2020-05-06', date_to='2021-07-15') == ['a_b.txt', 'axb.txt', 'holiday-notes.txt']
+
+def test_search_follows_renames_and_deletes(filebox, search, indexed_folder):
+    folder, conn = indexed_folder({})
+    with conn:
+        conn.execute("UPDATE files SET name = 'summer.pdf' WHERE name = 'report.pdf'")
+        conn.execute("DELETE FROM files WHERE name = 'beach.png'")
+    assert search(q='report') == []
+    assert search(q='summer') == ['summer.pdf']
+    assert search(q='beach') == ['Holiday_Beach.JPG']
+
+def test_extension_of_names_without_one(filebox):
+    assert filebox.get_file_extension('README') == ''
+    assert filebox.get_file_extension('archive.tar.GZ') == 'gz'
+
+def test_search_api(filebox, client, save_image):
+    save_image('searchable_Sunset.png', size=(40, 30))
+    page = client.get('/api/search?q=ble_sun&type=image').get_json()
+    assert [file['name'] for file in page['files']] == ['searchable_Sunset.png']
+    assert client.get('/api/search?q=ble_sun&date_from=soon').status_code == 400
+    response = client.get('/search?q=ble_sun')
+    assert response.status_code == 200
+    assert b'searchable_Sunset.png' in response.data
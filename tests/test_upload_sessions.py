@@ -0,0 +1,129 @@
+import hashlib
+import os
+
+import pytest
+
+CHUNK_SIZE = 1000
+
+@pytest.fixture(autouse=True)
+def small_chunks(filebox, monkeypatch):
+    monkeypatch.setattr(filebox, 'UPLOAD_CHUNK_SIZE', CHUNK_SIZE)
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def create_session(client, filename, data, **extra):
+    response = client.post('/upload/sessions', json=dict({'filename': filename, 'size': len(data)}, **extra))
+    assert response.status_code == 201
+    return response.get_json()
+
+def put_chunk(client, session, index, data, checksum=True):
+    chunk = data[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+    headers = {'X-Chunk-SHA256': sha256(chunk)} if checksum else {}
+    return client.put(f"/upload/sessions/{session['id']}/chunks/{index}", data=chunk, headers=headers)
+
+def incoming_files(filebox, upload_folder):
+    return sorted(os.listdir(filebox.get_incoming_dir(upload_folder)))
+
+def test_chunks_in_any_order(filebox, client, upload_folder):
+    data = os.urandom(3 * CHUNK_SIZE + 123)
+    session = create_session(client, 'session ordered.txt', data, sha256=sha256(data))
+    assert (session['total_chunks'], session['missing'], session['offset']) == (4, [0, 1, 2, 3], 0)
+
+    assert put_chunk(client, session, 2, data).get_json()['missing'] == [0, 1, 3]
+    assert put_chunk(client, session, 0, data).get_json()['offset'] == CHUNK_SIZE
+    # A chunk sent twice (e.g. after a lost response) is simply accepted again
+    assert put_chunk(client, session, 0, data, checksum=False).status_code == 200
+    status = client.get(f"/upload/sessions/{session['id']}").get_json()
+    assert (status['received'], status['missing'], status['offset']) == ([0, 2], [1, 3], CHUNK_SIZE)
+
+    assert client.post(f"/upload/sessions/{session['id']}/complete").status_code == 409
+    put_chunk(client, session, 3, data)
+    put_chunk(client, session, 1, data)
+    result = client.post(f"/upload/sessions/{session['id']}/complete").get_json()
+    assert result['success'] and result['hash'] == sha256(data)
+    assert result['saved_as'] == 'session_ordered.txt'
+
+    with open(filebox.get_file_path(upload_folder, 'session_ordered.txt'), 'rb') as f:
+        assert f.read() == data
+    row = filebox.get_index_db(upload_folder).execute(
+        "SELECT size, hash FROM files WHERE name = 'session_ordered.txt'"
+    ).fetchone()
+    assert (row['size'], row['hash']) == (len(data), sha256(data))
+    assert client.get(f"/upload/sessions/{session['id']}").status_code == 404
+    assert not [name for name in incoming_files(filebox, upload_folder) if name.startswith(session['id'])]
+
+def test_bad_chunks_are_not_recorded(client):
+    data = os.urandom(2 * CHUNK_SIZE)
+    session = create_session(client, 'session_bad_chunks.txt', data)
+    url = f"/upload/sessions/{session['id']}/chunks"
+    assert client.put(f'{url}/0', data=data[:CHUNK_SIZE], headers={'X-Chunk-SHA256': '0' * 64}).status_code == 422
+    assert client.put(f'{url}/0', data=data[:CHUNK_SIZE - 1]).status_code == 400
+    assert client.put(f'{url}/0', data=data[:CHUNK_SIZE + 1]).status_code == 400
+    assert client.put(f'{url}/2', data=data[:CHUNK_SIZE]).status_code == 400
+    assert client.get(f"/upload/sessions/{session['id']}").get_json()['received'] == []
+
+def test_file_checksum_mismatch_starts_over(filebox, client, upload_folder):
+    data = os.urandom(2 * CHUNK_SIZE)
+    session = create_session(client, 'session_mismatch.txt', data, sha256=sha256(b'other content'))
+    put_chunk(client, session, 0, data)
+    put_chunk(client, session, 1, data)
+    response = client.post(f"/upload/sessions/{session['id']}/complete")
+    assert response.status_code == 422
+    assert response.get_json()['hash'] == sha256(data)
+    assert client.get(f"/upload/sessions/{session['id']}").get_json()['missing'] == [0, 1]
+    assert not filebox.is_name_taken(upload_folder, 'session_mismatch.txt')
+
+def test_lost_chunk_is_asked_for_again(filebox, client, upload_folder):
+    data = os.urandom(2 * CHUNK_SIZE)
+    session = create_session(client, 'session_lost.txt', data)
+    put_chunk(client, session, 0, data)
+    put_chunk(client, session, 1, data)
+    os.remove(filebox.get_session_chunk_path(upload_folder, session['id'], 1))
+    response = client.post(f"/upload/sessions/{session['id']}/complete")
+    assert response.status_code == 409
+    assert response.get_json()['missing'] == [1]
+
+    put_chunk(client, session, 1, data)
+    assert client.post(f"/upload/sessions/{session['id']}/complete").get_json()['success']
+
+def test_empty_file(filebox, client, upload_folder):
+    session = create_session(client, 'session_empty.txt', b'')
+    assert session['total_chunks'] == 0
+    result = client.post(f"/upload/sessions/{session['id']}/complete").get_json()
+    assert result['success'] and result['hash'] == sha256(b'')
+    assert os.path.getsize(filebox.get_file_path(upload_folder, 'session_empty.txt')) == 0
+
+def test_cancel_removes_received_chunks(filebox, client, upload_folder):
+    data = os.urandom(2 * CHUNK_SIZE)
+    session = create_session(client, 'session_cancel.txt', data)
+    put_chunk(client, session, 0, data)
+    assert client.delete(f"/upload/sessions/{session['id']}").status_code == 200
+    assert client.get(f"/upload/sessions/{session['id']}").status_code == 404
+    assert not [name for name in incoming_files(filebox, upload_folder) if name.startswith(session['id'])]
+
+def test_session_is_private_to_its_user(filebox, client, upload_folder):
+    session = create_session(client, 'session_private.txt', b'abc')
+    conn = filebox.get_index_db(upload_folder)
+    with conn:
+        conn.execute("UPDATE upload_sessions SET user = 'someone else' WHERE id = ?", (session['id'],))
+    assert client.get(f"/upload/sessions/{session['id']}").status_code == 404
+    assert client.put(f"/upload/sessions/{session['id']}/chunks/0", data=b'abc').status_code == 404
+
+def test_session_validation(filebox, client, monkeypatch):
+    assert client.post('/upload/sessions', json={'filename': 'x.exe', 'size': 1}).status_code == 400
+    assert client.post('/upload/sessions', json={'filename': 'x.txt', 'size': -1}).status_code == 400
+    assert client.post('/upload/sessions', json={'filename': 'x.txt', 'size': '1'}).status_code == 400
+    monkeypatch.setitem(filebox.app.config, 'MAX_FILE_SIZE', 10)
+    assert client.post('/upload/sessions', json={'filename': 'x.txt', 'size': 11}).status_code == 413
+
+def test_expired_sessions_are_dropped(filebox, client, upload_folder):
+    data = os.urandom(CHUNK_SIZE)
+    session = create_session(client, 'session_expired.txt', data)
+    put_chunk(client, session, 0, data)
+    conn = filebox.get_index_db(upload_folder)
+    with conn:
+        conn.execute('UPDATE upload_sessions SET created = 0 WHERE id = ?', (session['id'],))
+    create_session(client, 'session_new.txt', b'x')
+    assert client.get(f"/upload/sessions/{session['id']}").status_code == 404
+    assert not [name for name in incoming_files(filebox, upload_folder) if name.startswith(session['id'])]
@@ -0,0 +1,57 @@
+import io
+import os
+import zipfile
+
+from conftest import timestamp
+
+def write_file(filebox, upload_folder, name, data, mtime=None):
+    path = os.path.join(upload_folder, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    filebox.reconcile_index(upload_folder)
+    return path
+
+def test_zip_of_selected_files(filebox, client, upload_folder):
+    write_file(filebox, upload_folder, 'zip_notes.txt', b'notes ' * 1000)
+    write_file(filebox, upload_folder, 'zip_photo.png', b'not really a png')
+    response = client.post('/download.zip', data={'files': [
+        'zip_notes.txt', 'zip_photo.png', 'zip_notes.txt',
+        '../config.txt', '../../etc/passwd', 'sub/zip_notes.txt', '.filebox_index.sqlite3', 'zip_missing.txt'
+    ]})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    assert response.headers['Content-Disposition'].startswith('attachment; filename="files-')
+
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['zip_notes.txt', 'zip_photo.png']
+        assert archive.read('zip_notes.txt') == b'notes ' * 1000
+        assert archive.getinfo('zip_notes.txt').compress_type == zipfile.ZIP_DEFLATED
+        assert archive.getinfo('zip_photo.png').compress_type == zipfile.ZIP_STORED
+
+def test_zip_of_a_date_group(filebox, client, upload_folder):
+    write_file(filebox, upload_folder, 'zip_day1.txt', b'1', timestamp('1999-02-03', 10))
+    write_file(filebox, upload_folder, 'zip_day2.txt', b'2', timestamp('1999-02-03', 11))
+    write_file(filebox, upload_folder, 'zip_other_day.txt', b'3', timestamp('1999-02-04'))
+    response = client.get('/download.zip?date=1999-02-03')
+    assert response.status_code == 200
+    assert 'files-1999-02-03.zip' in response.headers['Content-Disposition']
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.namelist() == ['zip_day2.txt', 'zip_day1.txt']
+
+def test_zip_without_files(client):
+    assert client.get('/download.zip?date=1899-01-01').status_code == 404
+    assert client.get('/download.zip?date=someday').status_code == 400
+    assert client.post('/download.zip', data={'files': ['../config.txt']}).status_code == 404
+
+def test_zip_is_streamed_in_pieces(filebox, upload_folder):
+    data = os.urandom(3 * filebox.ZIP_CHUNK_SIZE + 10)
+    write_file(filebox, upload_folder, 'zip_large.bin.txt', data)
+    pieces = list(filebox.generate_zip(upload_folder, ['zip_large.bin.txt', 'zip_gone_meanwhile.txt']))
+    assert len(pieces) >= 4
+    assert max(len(piece) for piece in pieces) <= 2 * filebox.ZIP_CHUNK_SIZE
+    with zipfile.ZipFile(io.BytesIO(b''.join(pieces))) as archive:
+        assert archive.namelist() == ['zip_large.bin.txt']
+        assert archive.read('zip_large.bin.txt') == data
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Bulk Import Script for File Manager
+Imports a directory tree (e.g. an old phone backup) into UPLOAD_FOLDER with
+the same naming, deduplication and date logic as web uploads, without going
+through the web server.
+
+Hashing, EXIF date extraction and thumbnail rendering run in a pool of
+worker processes with a bounded number of files in flight. Files are copied
+in the kernel (copy_file_range, which reflinks on btrfs/XFS) or, with
+--link, hardlinked when the tree is on the same filesystem. Every imported
+file is checkpointed in the index, so an interrupted import can simply be
+started again and continues where it stopped.
+
+Hidden files and directories (.thumbnails, .trashed-*) and file types the
+web upload does not accept are skipped. MAX_FILE_SIZE does not apply.
+
+Usage:
+    python3 tool_ingest.py /media/backup/DCIM             # copy the tree in
+    python3 tool_ingest.py /media/backup/DCIM --link      # hardlink instead of copying
+    python3 tool_ingest.py /media/backup/DCIM --workers 2
+    python3 tool_ingest.py /media/backup/DCIM --dry-run
+"""
+
+import os
+import re
+import sys
+import time
+import errno
+import shutil
+import argparse
+import tempfile
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from werkzeug.utils import secure_filename
+
+from app import (app, get_current_upload_folder, get_index_db, reconcile_index, allowed_file, store_upload,
+                 calculate_file_hash, extract_date_from_metadata, render_renditions, get_rendition_job,
+                 get_file_path, get_thumbnail_path, is_rendition_fresh, is_thumbnailable, get_incoming_dir,
+                 link_into_place, fsync_dir, create_image_pool, UPLOAD_BUFFER_SIZE, UPLOAD_FILE_MODE)
+
+CHECKPOINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source TEXT PRIMARY KEY,  -- absolute path of the imported file
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    saved_as TEXT NOT NULL,
+    imported REAL NOT NULL
+);
+"""
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# Errors meaning copy_file_range cannot be used between these files
+COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.EPERM}
+# Errors meaning the tree cannot be hardlinked into the upload folder
+LINK_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EMLINK}
+PROGRESS_INTERVAL = 5  # seconds between progress lines
+
+def analyze(path, filename):
+    """Hash and date a source file (runs in the worker processes)"""
+    return calculate_file_hash(path), extract_date_from_metadata(path, filename)
+
+def copy_to_incoming(source_path, upload_folder):
+    """Copy a file into the upload folder's spool directory, keeping its mtime; returns the copy's path"""
+    fd, path = tempfile.mkstemp(suffix='.part', dir=get_incoming_dir(upload_folder))
+    try:
+        with open(source_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            st = os.fstat(src.fileno())
+            try:
+                # The data never enters userspace: a server-side copy, or a reflink on btrfs/XFS
+                while os.copy_file_range(src.fileno(), dst.fileno(), COPY_CHUNK_SIZE):
+                    pass
+            except (AttributeError, OSError) as e:
+                if isinstance(e, OSError) and e.errno not in COPY_FALLBACK_ERRNOS:
+                    raise
+                src.seek(0)
+                dst.seek(0)
+                dst.truncate()
+                shutil.copyfileobj(src, dst, UPLOAD_BUFFER_SIZE)
+            dst.flush()
+            os.fchmod(dst.fileno(), UPLOAD_FILE_MODE)
+            # The original's mtime stays the fallback gallery date and the index's change marker
+            os.utime(dst.fileno(), ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.fsync(dst.fileno())
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+class SourceFile:
+    """A file of the imported tree, handed to store_upload() like a received upload"""
+
+    def __init__(self, source_path, upload_folder, file_hash, size, link):
+        self.source_path = source_path
+        self.upload_folder = upload_folder
+        self.file_hash = file_hash
+        self.size = size
+        self.link = link
+        # store_upload() builds the index row from this file: the original until it is copied
+        self.path = source_path
+        self._copy = None
+
+    def hexdigest(self):
+        return self.file_hash
+
+    def sync(self):
+        """Copy the content next to the uploads, unless it is going to be hardlinked"""
+        if not self.link and self._copy is None:
+            self.path = self._copy = copy_to_incoming(self.source_path, self.upload_folder)
+
+    def claim(self, target_path):
+        if self._copy is None:
+            try:
+                os.link(self.source_path, target_path)
+                fsync_dir(os.path.dirname(target_path))
+                return
+            except FileExistsError:
+                raise
+            except OSError as e:
+                if e.errno not in LINK_FALLBACK_ERRNOS:
+                    raise
+            # Cannot hardlink this one: copy it after all
+            self.link = False
+            self.sync()
+        link_into_place(self._copy, target_path)
+        self.path = self._copy = None
+
+    def discard(self):
+        if self._copy is not None:
+            os.remove(self._copy)
+            self.path = self._copy = None
+
+def iter_sources(root):
+    """Yield (path, stat, filename) of the importable files below root, in a stable order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        for name in sorted(filenames):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield path, st, secure_filename(name)
+
+def find_imported_copy(conn, filename, file_hash, size):
+    """Name under which this content is already stored as filename or a numbered variant of it.
+
+    Covers a file imported just before an interruption, ahead of its checkpoint,
+    and the same photo found twice in the tree.
+    """
+    base, ext = os.path.splitext(filename)
+    variant = re.compile(re.escape(base) + r'_\d+' + re.escape(ext))
+    for row in conn.execute('SELECT name FROM files WHERE hash = ? AND size = ?', (file_hash, size)):
+        if row['name'] == filename or variant.fullmatch(row['name']):
+            return row['name']
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a directory tree into the File Manager upload folder')
+    parser.add_argument('source', help='directory to import')
+    parser.add_argument('--link', action='store_true',
+                        help='hardlink files instead of copying them (same filesystem only)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='processes hashing files and rendering thumbnails')
+    parser.add_argument('--dry-run', action='store_true', help='only count the files that would be imported')
+    args = parser.parse_args()
+
+    source_root = os.path.realpath(args.source)
+    if not os.path.isdir(source_root):
+        print(f"❌ {args.source} is not a directory")
+        sys.exit(1)
+
+    with app.app_context():
+        upload_folder = get_current_upload_folder()
+        upload_root = os.path.realpath(upload_folder)
+        if os.path.commonpath([source_root, upload_root]) in (source_root, upload_root):
+            print("❌ The source and the upload folder must not contain each other")
+            sys.exit(1)
+        link = args.link
+        if link and os.stat(source_root).st_dev != os.stat(upload_root).st_dev:
+            print("⚠️  The source is on another filesystem than the upload folder: copying instead of linking")
+            link = False
+
+        # Drops names reserved by an import that was killed before the file was placed
+        print(f"Indexing {upload_folder} ...")
+        reconcile_index(upload_folder)
+        conn = get_index_db(upload_folder)
+        conn.executescript(CHECKPOINT_SCHEMA)
+        checkpoints = {row['source']: (row['size'], row['mtime']) for row in conn.execute(
+            'SELECT source, size, mtime FROM ingest_checkpoints'
+        )}
+
+        pending = []
+        skipped = resumed = 0
+        for path, st, filename in iter_sources(source_root):
+            if not filename or not allowed_file(filename):
+                skipped += 1
+            elif checkpoints.get(path) == (st.st_size, st.st_mtime):
+                resumed += 1
+            else:
+                pending.append((path, st, filename))
+        # Imported before an interruption, but their thumbnails were still being rendered
+        to_render = deque(row['name'] for row in conn.execute(
+            'SELECT DISTINCT name FROM files JOIN ingest_checkpoints ON saved_as = name WHERE phash IS NULL'
+        ) if is_thumbnailable(row['name']))
+        print(f"{len(pending)} files to import, {resumed} already imported, {skipped} of a type not allowed")
+        if args.dry_run or not (pending or to_render):
+            return
+
+        started = last_progress = time.time()
+        stats = {'imported': 0, 'deduplicated': 0, 'existing': 0, 'failed': 0, 'rendered': 0, 'render_failed': 0}
+        sources = iter(pending)
+        analyses = deque()  # (future, source) in tree order, so naming conflicts resolve the same way every run
+        renders = {}  # future -> stored name
+        window = max(args.workers, 1) * 4  # files in flight, which bounds memory on large trees
+
+        with create_image_pool(args.workers) as executor:
+            try:
+                while True:
+                    while len(analyses) + len(renders) < window:
+                        if to_render:
+                            name = to_render.popleft()
+                            renders[executor.submit(render_renditions, *get_rendition_job(upload_folder, name))] = name
+                            continue
+                        source = next(sources, None)
+                        if source is None:
+                            break
+                        analyses.append((executor.submit(analyze, source[0], source[2]), source))
+                    if not analyses and not renders:
+                        break
+                    wait([future for future, _source in analyses] + list(renders), return_when=FIRST_COMPLETED)
+
+                    # Store analysed files in tree order
+                    while analyses and analyses[0][0].done():
+                        future, (path, st, filename) = analyses.popleft()
+                        try:
+                            file_hash, metadata_date = future.result()
+                            saved_as = find_imported_copy(conn, filename, file_hash, st.st_size)
+                            if saved_as:
+                                stats['existing'] += 1
+                            else:
+                                spool = SourceFile(path, upload_folder, file_hash, st.st_size, link)
+                                try:
+                                    saved_as, deduplicated = store_upload(spool, filename, upload_folder,
+                                                                          metadata_date, queue_thumbnail=False)
+                                finally:
+                                    spool.discard()
+                                stats['deduplicated' if deduplicated else 'imported'] += 1
+                            with conn:
+                                conn.execute('INSERT OR REPLACE INTO ingest_checkpoints VALUES (?, ?, ?, ?, ?)',
+                                             (path, st.st_size, st.st_mtime, saved_as, time.time()))
+                        except Exception as e:
+                            print(f"  ❌ {path}: {str(e)}")
+                            stats['failed'] += 1
+                            continue
+                        if is_thumbnailable(saved_as) and not is_rendition_fresh(
+                                get_thumbnail_path(upload_folder, saved_as), get_file_path(upload_folder, saved_as)):
+                            to_render.append(saved_as)
+
+                    for future in [future for future in renders if future.done()]:
+                        name = renders.pop(future)
+                        try:
+                            features = future.result()
+                        except Exception as e:
+                            print(f"  ⚠️  No thumbnail for {name}: {str(e)}")
+                            stats['render_failed'] += 1
+                            continue
+                        with conn:
+                            conn.execute('UPDATE files SET phash = ?, lqip = ? WHERE name = ?', (*features, name))
+                        stats['rendered'] += 1
+
+                    if time.time() - last_progress >= PROGRESS_INTERVAL:
+                        last_progress = time.time()
+                        done = stats['imported'] + stats['deduplicated'] + stats['existing'] + stats['failed']
+                        print(f"  {done}/{len(pending)} files, {done / (last_progress - started):.1f} files/s")
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+        elapsed = time.time() - started
+
+    print(f"✅ Imported {stats['imported']} files in {elapsed:.1f}s "
+          f"({stats['deduplicated']} as links to identical files, {stats['existing']} already stored, "
+          f"{stats['failed']} failed); rendered {stats['rendered']} thumbnails"
+          + (f", {stats['render_failed']} images could not be read" if stats['render_failed'] else ""))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nImport interrupted. Run the same command again to resume.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Storage Layout Migration Script for File Manager
+Moves the originals and renditions of an upload folder, in place, into
+another storage layout: flat, hash (ab/cd/name) or date (YYYY/MM/DD/name).
+Public /uploads/<filename> URLs do not change.
+
+Run it with filebox stopped. Every file is moved with a single rename and
+its index entry updated in batches, so an interrupted run can simply be
+started again and continues where it stopped.
+
+Usage:
+    python3 tool_migrate_layout.py hash          # shard by hash of the name
+    python3 tool_migrate_layout.py date          # shard by gallery date
+    python3 tool_migrate_layout.py flat          # back to one directory
+    python3 tool_migrate_layout.py hash --dry-run
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import date
+
+from app import (app, get_current_upload_folder, get_index_db, reconcile_index, try_lock_file,
+                 get_storage_relpath, get_rendition_shard, STORAGE_LAYOUTS, RENDITION_SIZES,
+                 WATCHER_LOCK_NAME, THUMBNAILER_LOCK_NAME)
+
+def prune_empty_dirs(path, stop):
+    """Remove path and its parents while they are empty, without going above stop"""
+    while path != stop and path.startswith(stop + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
+
+def move(upload_folder, src_rel, dst_rel):
+    """Rename src to dst; True if the file is at dst afterwards"""
+    src = os.path.join(upload_folder, src_rel)
+    dst = os.path.join(upload_folder, dst_rel)
+    if not os.path.exists(src):
+        # Moved by an earlier, interrupted run
+        return os.path.exists(dst)
+    if os.path.exists(dst):
+        raise FileExistsError(f"{dst_rel} already exists, not overwriting it with {src_rel}")
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.rename(src, dst)
+    prune_empty_dirs(os.path.dirname(src), upload_folder)
+    return True
+
+def move_renditions(upload_folder, name, layout):
+    for size in RENDITION_SIZES:
+        size_dir = os.path.join('thumbs', size)
+        target_shard = get_rendition_shard(name, layout)
+        for ext in ('webp', 'jpg'):
+            rendition = f"{name}.{ext}"
+            target = os.path.join(size_dir, target_shard, rendition)
+            for shard in {get_rendition_shard(name, other) for other in STORAGE_LAYOUTS} - {target_shard}:
+                source = os.path.join(size_dir, shard, rendition)
+                if not os.path.exists(os.path.join(upload_folder, source)):
+                    continue
+                if os.path.exists(os.path.join(upload_folder, target)):
+                    # Already rendered in the new place
+                    os.remove(os.path.join(upload_folder, source))
+                    prune_empty_dirs(os.path.dirname(os.path.join(upload_folder, source)), upload_folder)
+                else:
+                    move(upload_folder, source, target)
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert an upload folder to another storage layout')
+    parser.add_argument('layout', choices=STORAGE_LAYOUTS)
+    parser.add_argument('--batch', type=int, default=500, help='files moved per index transaction')
+    parser.add_argument('--dry-run', action='store_true', help='only count the files that would move')
+    args = parser.parse_args()
+
+    with app.app_context():
+        upload_folder = get_current_upload_folder()
+
+        # The running app's watcher/thumbnailer hold these; taking them keeps it out while we move files
+        locks = [try_lock_file(os.path.join(upload_folder, name)) for name in (WATCHER_LOCK_NAME, THUMBNAILER_LOCK_NAME)]
+        if None in locks:
+            print("❌ filebox is running on this folder. Stop it before migrating.")
+            sys.exit(1)
+
+        print(f"Indexing {upload_folder} ...")
+        reconcile_index(upload_folder)
+        conn = get_index_db(upload_folder)
+        rows = conn.execute('SELECT name, path, date FROM files ORDER BY name').fetchall()
+        pending = []
+        for row in rows:
+            target = get_storage_relpath(row['name'], date.fromisoformat(row['date']), args.layout)
+            if row['path'] != target:
+                pending.append((row['name'], row['path'], target))
+        print(f"{len(pending)} of {len(rows)} files to move into the '{args.layout}' layout")
+        if args.dry_run or not pending:
+            return
+
+        started = time.time()
+        updates = []
+        moved = 0
+        for name, current, target in pending:
+            if move(upload_folder, current, target):
+                move_renditions(upload_folder, name, args.layout)
+                updates.append((target, name))
+            if len(updates) >= args.batch:
+                with conn:
+                    conn.executemany('UPDATE files SET path = ? WHERE name = ?', updates)
+                moved += len(updates)
+                updates = []
+                print(f"  {moved}/{len(pending)} moved")
+        with conn:
+            conn.executemany('UPDATE files SET path = ? WHERE name = ?', updates)
+        moved += len(updates)
+        elapsed = time.time() - started
+
+    print(f"✅ Moved {moved} files in {elapsed:.1f}s. "
+          f"Set STORAGE_LAYOUT={args.layout} in config.txt before starting filebox.")
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nMigration interrupted. Run the same command again to resume.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Error: {str(e)}")
+        sys.exit(1)
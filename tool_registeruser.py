@@ -9,19 +9,15 @@ import sys
 import getpass
 from werkzeug.security import generate_password_hash
 
+from credentials import parse_credentials
+
 USER_CREDENTIALS_FILE = 'user_credentials.txt'
 
 def load_existing_users():
     """Load existing usernames from credentials file"""
-    users = set()
     if os.path.exists(USER_CREDENTIALS_FILE):
-        with open(USER_CREDENTIALS_FILE, 'r') as f:
-            for line in f:
-                if line.strip() and not line.startswith('#'):
-                    parts = line.strip().split(':', 1)
-                    if len(parts) == 2:
-                        users.add(parts[0])
-    return users
+        return set(parse_credentials(USER_CREDENTIALS_FILE))
+    return set()
 
 def register_user(username, password):
     """Register a new user with hashed password"""
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Metadata Index Maintenance Script for File Manager
+Reconciles the gallery index with files changed outside the app
+(Samba, rsync, manual copies) or rebuilds it from scratch.
+
+Usage:
+    python3 tool_reindex.py            # reconcile, hashing new/changed files
+    python3 tool_reindex.py --rebuild  # drop every entry and re-index the folder
+    python3 tool_reindex.py --no-hash  # skip SHA-256 hashing (faster)
+    python3 tool_reindex.py --sweep-orphans  # also delete thumbnails of removed files
+    python3 tool_reindex.py --perceptual-hashes  # hash images for the duplicates report and placeholders
+"""
+
+import sys
+import time
+import argparse
+
+from app import (app, get_current_upload_folder, reconcile_index, purge_trash, sweep_orphan_renditions,
+                 backfill_image_features)
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile or rebuild the File Manager metadata index')
+    parser.add_argument('--rebuild', action='store_true', help='drop the index and rebuild it from the upload folder')
+    parser.add_argument('--no-hash', action='store_true', help='do not compute SHA-256 hashes of new or changed files')
+    parser.add_argument('--sweep-orphans', action='store_true',
+                        help='delete thumbnails and renditions whose original no longer exists')
+    parser.add_argument('--perceptual-hashes', action='store_true',
+                        help='compute the perceptual hashes and gallery placeholders of images missing them')
+    args = parser.parse_args()
+
+    with app.app_context():
+        upload_folder = get_current_upload_folder()
+        print(f"Indexing {upload_folder} ...")
+        started = time.time()
+        stats = reconcile_index(upload_folder, compute_hashes=not args.no_hash, rebuild=args.rebuild)
+        elapsed = time.time() - started
+
+        print(f"✅ Index updated in {elapsed:.1f}s: "
+              f"{stats['added']} added, {stats['updated']} updated, "
+              f"{stats['removed']} removed, {stats['unchanged']} unchanged")
+
+        if args.sweep_orphans:
+            purged = purge_trash(upload_folder)
+            removed = sweep_orphan_renditions(upload_folder)
+            print(f"✅ Purged {purged} deleted files, removed {removed} orphaned thumbnails")
+
+        if args.perceptual_hashes:
+            started = time.time()
+            hashed, failed = backfill_image_features(upload_folder)
+            elapsed = time.time() - started
+            print(f"✅ Hashed {hashed} images in {elapsed:.1f}s" + (f", {failed} could not be read" if failed else ""))
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nIndexing cancelled.")
+        sys.exit(0)
+    except Exception as e:
+        print(f"\n❌ Error: {str(e)}")
+        sys.exit(1)